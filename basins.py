@@ -0,0 +1,150 @@
+import argparse
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import params
+from terrain import terrains
+from classes.Optimizer import Optimizer
+from classes.Surface import Surface
+from classes.BatchEngine import BatchEngine
+
+
+class BasinMaps:
+    def __init__(self, X:np.ndarray, Y:np.ndarray, final_x:np.ndarray, final_y:np.ndarray, loss:np.ndarray,
+                 steps:np.ndarray, converged:np.ndarray, basin:np.ndarray, minima:np.ndarray):
+        """
+        Per start point results of running one optimizer from every point of a grid.
+
+        Parameters:
+        - X, Y: meshgrid of the start points.
+        - final_x, final_y, loss: where each run ended and the height there.
+        - steps: number of steps each run took to converge, the step budget for the ones that did not.
+        - converged: whether each run converged within the step budget.
+        - basin: index into minima of the minimum each run converged to, -1 if it did not converge.
+        - minima: np.ndarray of shape (K, 3), the x, y, z of the distinct minima that were reached.
+        """
+        self.X, self.Y = X, Y
+        self.final_x, self.final_y, self.loss = final_x, final_y, loss
+        self.steps = steps
+        self.converged = converged
+        self.basin = basin
+        self.minima = minima
+
+    def save(self, path:str)-> None:
+        np.savez(path, **vars(self))
+
+    def __repr__(self) -> str:
+        return f'BasinMaps({self.X.shape[0]}x{self.X.shape[1]} starts, {len(self.minima)} minima, {self.converged.mean():.0%} converged)'
+
+
+def _run_chunk(surface:Surface, optimizer:Optimizer, starts_x:np.ndarray, starts_y:np.ndarray,
+               max_steps:int, tolerance:float)-> tuple[np.ndarray, ...]:
+    engine = BatchEngine(surface, [copy.copy(optimizer)], starts_x, starts_y)
+    steps = np.full(engine.shape[1], max_steps)
+    for step in range(1, max_steps + 1):
+        del_v = engine.step()[0]
+        converged = engine.active[0] & (del_v < tolerance)
+        steps[converged] = step
+        engine.active[0] &= ~converged
+        if not engine.active.any():
+            break
+    return engine.x[0], engine.y[0], engine.z[0], steps, ~engine.active[0]
+
+
+def _label_minima(final_x:np.ndarray, final_y:np.ndarray, final_z:np.ndarray, converged:np.ndarray,
+                  radius:float)-> tuple[np.ndarray, np.ndarray]:
+    '''
+    groups the end points of the converged runs into minima. end points are snapped to cells of size radius,
+    then neighbouring cells closer than radius are merged.
+    '''
+    basin = np.full(final_x.shape, -1)
+    if not converged.any():
+        return basin, np.empty((0, 3))
+    cells = np.stack([np.round(final_x[converged] / radius), np.round(final_y[converged] / radius)], axis=-1)
+    unique_cells, inverse = np.unique(cells, axis=0, return_inverse=True)
+    # union-find over the distinct cells, the loop is over the few cells left, not over start points
+    parent = list(range(len(unique_cells)))
+    def find(a:int)-> int:
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+    for a in range(len(unique_cells)):
+        for b in np.flatnonzero(np.abs(unique_cells[a + 1:] - unique_cells[a]).max(axis=1) <= 1) + a + 1:
+            parent[find(b)] = find(a)
+    _, cell_label = np.unique([find(a) for a in range(len(unique_cells))], return_inverse=True)
+
+    basin[converged] = cell_label[inverse.ravel()]
+    minima = np.array([[final_x[basin == k].mean(), final_y[basin == k].mean(), final_z[basin == k].mean()]
+                       for k in range(cell_label.max() + 1)])
+    return basin, minima
+
+
+def basin_maps(surface:Surface, optimizer:Optimizer, resolution:int|None=None, *, max_steps:int=1000,
+               tolerance:float=1e-4, chunk_size:int=20000, processes:int|None=None)-> BasinMaps:
+    """
+    Runs an optimizer from every point of a grid over the surface and maps where and how fast each run converged.
+
+    The start points are split into chunks of chunk_size, each chunk is one vectorized BatchEngine run
+    and the chunks are spread over a process pool.
+
+    Parameters:
+    - surface: the Surface to optimize on.
+    - optimizer: a configured optimizer, copied for every chunk, its start position is ignored.
+    - resolution: start points per axis, defaults to the surface meshgrid.
+    - max_steps: step budget of every run.
+    - tolerance: a run whose step is shorter than this has converged.
+    - chunk_size: number of start points stepped together.
+    - processes: number of worker processes, defaults to the number of cores, 1 runs in this process.
+    """
+    if resolution is None:
+        X, Y = surface.X, surface.Y
+    else:
+        X, Y = np.meshgrid(np.linspace(surface.x_min, surface.x_max, resolution), np.linspace(surface.y_min, surface.y_max, resolution))
+    starts_x, starts_y = np.ravel(X), np.ravel(Y)
+    chunks = [(surface, optimizer, starts_x[i:i + chunk_size], starts_y[i:i + chunk_size], max_steps, tolerance)
+              for i in range(0, len(starts_x), chunk_size)]
+
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(chunks) == 1:
+        results = [_run_chunk(*chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(processes, len(chunks))) as pool:
+            results = list(pool.map(_run_chunk, *zip(*chunks)))
+
+    final_x, final_y, loss, steps, converged = (np.concatenate(parts).reshape(X.shape) for parts in zip(*results))
+    radius = 0.01 * max(surface.x_max - surface.x_min, surface.y_max - surface.y_min)
+    basin, minima = _label_minima(final_x, final_y, loss, converged, radius)
+    return BasinMaps(X, Y, final_x, final_y, loss, steps, converged, basin, minima)
+
+
+def main()->None:
+    import headless
+    parser = argparse.ArgumentParser(description='Map the basins of attraction and convergence times of an optimizer.')
+    parser.add_argument('--optimizer', default='Adam', help='name of one of the optimizers of main.py: GD, Nesterov, Momentum, '
+                                                            'AdaGrad, RMSProp, Adam, Newton or L-BFGS')
+    parser.add_argument('--terrain', default=params.TERRAIN, choices=list(terrains.TERRAINS), help='name of a terrain in terrain/terrains.py')
+    parser.add_argument('--resolution', type=int, default=200, help='start points per axis')
+    parser.add_argument('--max-steps', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--save', help='write the maps to this .npz file')
+    args = parser.parse_args()
+
+    surface = Surface(terrains.get_terrain(args.terrain), params.X_MIN, params.X_MAX, params.Y_MIN, params.Y_MAX)
+    optimizers = {repr(optim): optim for optim in headless.default_optimizers(surface, params.START_X, params.START_Y)}
+    if args.optimizer not in optimizers:
+        parser.error(f"argument --optimizer: invalid choice: '{args.optimizer}' (choose from {', '.join(optimizers)})")
+    optimizer = optimizers[args.optimizer]
+    maps = basin_maps(surface, optimizer, args.resolution, max_steps=args.max_steps, processes=args.processes)
+
+    print(maps)
+    for k, (x, y, z) in enumerate(maps.minima):
+        share = (maps.basin == k).mean()
+        print(f'minimum {k}: ({x:.2f}, {y:.2f}) z = {z:.3f}, {share:.1%} of the starts, median {np.median(maps.steps[maps.basin == k]):.0f} steps')
+    if args.save:
+        maps.save(args.save)
+
+
+if __name__ == '__main__':
+    main()
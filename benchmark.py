@@ -0,0 +1,357 @@
+import argparse
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import types
+from functools import lru_cache
+import numpy as np
+import params
+from terrain import terrains, perlin
+from classes import Optimizer
+from classes.Surface import Surface
+from classes.BatchEngine import BatchEngine, sample_starts
+from classes.ParameterEngine import ParameterEngine
+from classes.LossFunction import LeastSquares, LogisticRegression
+from classes.Trails import TrailBuffer
+
+# hyperparameters given to the optimizers that need more than a learning rate
+HYPERPARAMETERS = {'gamma': 0.9, 'beta_1': 0.7, 'beta_2': 0.999, 'damping': 0.05, 'memory': 10}
+# seconds a fresh interpreter may spend importing each entry point, and the heavy modules it may import with it,
+# the others (see HEAVY_MODULES) must only be imported where they are used
+IMPORT_BUDGET = {'params': (0.25, []), 'headless': (0.3, []), 'mesh': (0.3, []), 'sweep': (0.35, []), 'basins': (0.35, []),
+                 'export': (0.35, []), 'graphics': (0.6, ['vpython'])}
+HEAVY_MODULES = ['matplotlib', 'vpython', 'PIL']
+# benchmarks only reported next to their baseline, never flagged: an import takes ~0.1s in a fresh interpreter,
+# whose cold-start jitter alone exceeds the threshold, and IMPORT_BUDGET already bounds it absolutely
+REPORT_ONLY = ('import/',)
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+
+def measure(function, number:int, repeat:int=5, setup=None)-> float:
+    '''
+    seconds per call of function() in the fastest of `repeat` rounds of `number` calls.
+    the fastest round is the least disturbed by the rest of the machine, as in timeit.
+    setup, if given, is called before every round and returns the function to time, for stateful
+    benchmarks whose cost changes as they run.
+    '''
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            function = setup()
+        function()
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+    return min(times)
+
+
+def terrain_functions()-> dict[str, object]:
+    '''
+    the terrains registered in terrain/terrains.py TERRAINS.
+    '''
+    return dict(terrains.TERRAINS)
+
+
+def optimizer_classes()-> dict[str, type]:
+    return {name: cls for name, cls in vars(Optimizer).items()
+            if inspect.isclass(cls) and issubclass(cls, Optimizer.Optimizer) and cls is not Optimizer.Optimizer}
+
+
+def _make_optimizer(cls:type, surface:Surface)-> Optimizer.Optimizer:
+    arguments = inspect.signature(cls).parameters
+    extra = {name: value for name, value in HYPERPARAMETERS.items() if name in arguments}
+    return cls(params.START_X, params.START_Y, surface=surface, lr=params.LEARNING_RATE * 0.1, color=None, **extra)
+
+
+def _stub_vpython()-> types.ModuleType:
+    '''
+    module standing in for vpython, whose constructors only store their arguments, so plot_surface
+    can be timed without a browser and without counting the websocket traffic.
+    '''
+    class stub:
+        def __init__(self, *args, **kwargs):
+            self.args, self.kwargs = args, kwargs
+
+    vp = types.ModuleType('vpython')
+    for name in ['vector', 'vertex', 'triangle', 'compound', 'sphere', 'points', 'curve', 'text', 'button', 'slider', 'wtext']:
+        setattr(vp, name, stub)
+    vp.color = types.SimpleNamespace(black=None, white=None, red=None, green=None, blue=None)
+    vp.scene = stub()
+    return vp
+
+
+def bench_optimizers(quick:bool)-> dict[str, float]:
+    '''
+    steps per second of the scalar step() of every optimizer class, and start points stepped per second
+    by the BatchEngine with one row of 1000 start points.
+    '''
+    surface = Surface(terrains.gaussian_terrain, params.X_MIN, params.X_MAX, params.Y_MIN, params.Y_MAX)
+    starts_x, starts_y = np.meshgrid(np.linspace(params.X_MIN, params.X_MAX, 42)[1:-1], np.linspace(params.Y_MIN, params.Y_MAX, 27)[1:-1])
+    results = {}
+    for name, cls in optimizer_classes().items():
+        optim = _make_optimizer(cls, surface)
+        try:
+            optim.step()
+        except (AttributeError, NotImplementedError) as error:
+            print(f'skipping {name}: {error!r}', file=sys.stderr)
+            continue
+        # every round starts from a fresh optimizer, the cost of a step depends on where it is
+        results[f'optimizer_step/{name}'] = 1 / measure(None, 50 if quick else 500, setup=lambda: _make_optimizer(cls, surface).step)
+        setup = lambda: BatchEngine(surface, [_make_optimizer(cls, surface)], starts_x, starts_y).step
+        results[f'optimizer_batch/{name}'] = starts_x.size / measure(None, 5 if quick else 50, setup=setup)
+    return results
+
+
+def bench_terrains(quick:bool)-> dict[str, float]:
+    '''
+    scalar and array (10^5 points) evaluations per second of every terrain, and Surface.derivative calls per second.
+    '''
+    bounds = (params.X_MIN, params.X_MAX, params.Y_MIN, params.Y_MAX)
+    rng = np.random.default_rng(0)
+    xs, ys = rng.uniform(bounds[0], bounds[1], 100_000), rng.uniform(bounds[2], bounds[3], 100_000)
+    x, y = float(params.START_X), float(params.START_Y)
+    results = {}
+    for name, function in terrain_functions().items():
+        surface = Surface(function, *bounds, granularity=2)
+        results[f'terrain_scalar/{name}'] = 1 / measure(lambda: function(x, y, *bounds), 100 if quick else 2000)
+        results[f'terrain_array/{name}'] = xs.size / measure(lambda: function(xs, ys, *bounds), 2 if quick else 10)
+        results[f'derivative/{name}'] = 1 / measure(lambda: surface.derivative(x, y), 100 if quick else 2000)
+    return results
+
+
+def bench_perlin(quick:bool)-> dict[str, float]:
+    '''
+    generate_terrain calls per second, bypassing its memoization.
+    '''
+    generate = perlin.generate_terrain.__wrapped__
+    return {f'perlin_generate_terrain/{resolution}': 1 / measure(lambda: generate(2, resolution, 87), 2 if quick else 10)
+            for resolution in (100, 400)}
+
+
+def bench_plot_surface(quick:bool)-> dict[str, float]:
+    '''
+    plot_surface calls per second at several granularities, the vpython objects being stubs.
+    '''
+    real = sys.modules.get('vpython')
+    sys.modules['vpython'] = _stub_vpython()
+    try:
+        sys.modules.pop('graphics', None)
+        import graphics
+        results = {}
+        for granularity in (25, 50, 100) if quick else (25, 50, 100, 200):
+            surface = Surface(terrains.gaussian_terrain, params.X_MIN, params.X_MAX, params.Y_MIN, params.Y_MAX, granularity=granularity)
+            rendering = graphics.Graphics(surface)
+            results[f'plot_surface/{granularity}'] = 1 / measure(rendering.plot_surface, 1, 3 if quick else 5)
+    finally:
+        sys.modules.pop('graphics', None)
+        if real is None:
+            sys.modules.pop('vpython', None)
+        else:
+            sys.modules['vpython'] = real
+    return results
+
+
+def bench_trails(quick:bool)-> dict[str, float]:
+    '''
+    trail points pushed and flushed per second by a TrailBuffer of 500 random walks, one push and flush per frame.
+    '''
+    rng = np.random.default_rng(0)
+    steps = rng.standard_normal((200, 500, 3)).cumsum(axis=0) * 0.1
+    def setup():
+        trails = TrailBuffer(200)
+        for position in steps[0]:
+            trails.add(position)
+        frames = iter(np.concatenate([steps] * 100))
+        def frame():
+            trails.push(next(frames))
+            trails.flush()
+        return frame
+    return {'trails/500': 500 / measure(None, 20 if quick else 200, setup=setup)}
+
+
+def bench_precision(quick:bool)-> dict[str, float]:
+    '''
+    start points stepped per second by a BatchEngine running Momentum, RMSProp and Adam from 10^5 start points each,
+    in float64, in float32 and in float32 with float64 second-moment sums.
+    '''
+    results = {}
+    for name, dtype, accumulator_dtype in (('float64', np.float64, None), ('float32', np.float32, None),
+                                           ('float32_accumulate_float64', np.float32, np.float64)):
+        surface = Surface(terrains.gaussian_terrain, params.X_MIN, params.X_MAX, params.Y_MIN, params.Y_MAX, granularity=2, dtype=dtype)
+        starts_x, starts_y = sample_starts(surface, 100_000)
+        classes = (Optimizer.Momentum, Optimizer.RMSProp, Optimizer.Adam)
+        setup = lambda: BatchEngine(surface, [_make_optimizer(cls, surface) for cls in classes], starts_x, starts_y,
+                                    accumulator_dtype=accumulator_dtype).step
+        results[f'population_step/{name}'] = len(classes) * starts_x.size / measure(None, 3 if quick else 20, setup=setup)
+    return results
+
+
+class _FixedGradient:
+    '''
+    loss with a fixed random gradient, so bench_parameters can time the update kernels alone.
+    '''
+    def __init__(self, dimension:int):
+        self.dimension = dimension
+
+    def value_and_grad(self, theta:np.ndarray)-> tuple[np.ndarray, np.ndarray]:
+        return np.zeros(theta.shape[:-1]), np.random.default_rng(1).standard_normal(theta.shape)
+
+
+def bench_parameters(quick:bool)-> dict[str, float]:
+    '''
+    parameters updated per second by the update kernel of every optimizer class (8 rows of 10^4 parameters),
+    and ParameterEngine steps per second with every first-order class on synthetic problems of 2000 parameters,
+    L-BFGS being timed on its own since its line search evaluates the loss at 10 more points per step.
+    Newton is left out, its (D, D) Hessians are meant for few parameters.
+    '''
+    classes = {name: cls for name, cls in optimizer_classes().items()
+               if cls.update is not Optimizer.Optimizer.update and cls.order == 1}
+    loss = _FixedGradient(10_000)
+    results = {}
+    for name, cls in classes.items():
+        def setup():
+            engine = ParameterEngine(loss, [(cls, {'lr': 1e-3, **HYPERPARAMETERS})] * 8, np.zeros(loss.dimension))
+            state = engine.state(slice(None))
+            return lambda: cls.update(state, engine.gradient)
+        results[f'parameter_update/{name}'] = 8 * loss.dimension / measure(None, 20 if quick else 200, setup=setup)
+    optimizers = [(cls, {'lr': 1e-3, **HYPERPARAMETERS}) for cls in classes.values() if cls is not Optimizer.LBFGS]
+    for name, loss in (('least_squares', LeastSquares.make(1000, 2000)), ('logistic_regression', LogisticRegression.make(1000, 2000))):
+        setup = lambda: ParameterEngine(loss, optimizers, np.zeros(loss.dimension)).step
+        results[f'parameter_step/{name}'] = 1 / measure(None, 5 if quick else 50, setup=setup)
+        setup = lambda: ParameterEngine(loss, [(Optimizer.LBFGS, {'lr': 1, 'memory': 10})], np.zeros(loss.dimension)).step
+        results[f'parameter_step/{name}/LBFGS'] = 1 / measure(None, 5 if quick else 50, setup=setup)
+    return results
+
+
+@lru_cache(maxsize=None)
+def import_profile(module:str, repeat:int=5)-> tuple[float, tuple[str, ...]]:
+    '''
+    seconds a fresh interpreter spends importing module, the fastest of `repeat` runs,
+    and the HEAVY_MODULES that were imported with it.
+    '''
+    script = (f'import sys, time; start = time.perf_counter(); import {module}; seconds = time.perf_counter() - start; '
+              f'print(seconds, *[name for name in {HEAVY_MODULES!r} if name in sys.modules])')
+    directory = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', script], cwd=directory, capture_output=True, text=True, check=True).stdout.split()
+        times.append(float(output[0]))
+    return min(times), tuple(output[1:])
+
+
+def bench_startup(quick:bool)-> dict[str, float]:
+    '''
+    imports per second of every entry point of IMPORT_BUDGET in a fresh interpreter.
+    '''
+    return {f'import/{module}': 1 / import_profile(module, 3 if quick else 5)[0] for module in IMPORT_BUDGET}
+
+
+def startup_violations(quick:bool=False)-> list[str]:
+    '''
+    the entry points importing slower than their IMPORT_BUDGET or importing a heavy module they should not.
+    '''
+    violations = []
+    for module, (budget, allowed) in IMPORT_BUDGET.items():
+        seconds, heavy = import_profile(module, 3 if quick else 5)
+        if seconds > budget:
+            violations.append(f'import {module} takes {seconds:.3f}s, over its budget of {budget}s')
+        for name in set(heavy) - set(allowed):
+            violations.append(f'import {module} imports {name}')
+    return violations
+
+
+SUITES = {'optimizers': bench_optimizers, 'terrains': bench_terrains, 'perlin': bench_perlin, 'plot_surface': bench_plot_surface,
+          'parameters': bench_parameters, 'startup': bench_startup,
+          'trails': bench_trails, 'precision': bench_precision}
+
+
+def run(suites:list[str]|None=None, quick:bool=False)-> dict:
+    """
+    Runs the benchmark suites.
+
+    Every result is a throughput (operations per second, higher is better) so results of different
+    benchmarks read the same way.
+
+    Parameters:
+    - suites: names of SUITES to run, all of them by default.
+    - quick: fewer repetitions, for a fast but noisier check.
+
+    Returns:
+    - a dict with the 'machine' the run was made on and the 'results' as {benchmark name: operations per second}.
+    """
+    results = {}
+    for name in suites or SUITES:
+        results.update(SUITES[name](quick))
+    machine = {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+               'processor': platform.processor() or platform.machine(), 'cores': os.cpu_count()}
+    return {'machine': machine, 'results': results}
+
+
+def compare(report:dict, baseline:dict, threshold:float=0.25, complete:bool=True)-> list[str]:
+    '''
+    prints every benchmark next to its baseline and returns the names of the ones slower than the
+    baseline by more than threshold (0.25 = 25% fewer operations per second), except the REPORT_ONLY ones.
+    complete: whether every suite ran, only then are the baseline entries missing from the report listed.
+    '''
+    regressions = []
+    for name, value in report['results'].items():
+        reference = baseline['results'].get(name)
+        if reference is None:
+            print(f'{name:45s} {value:14.1f}/s   (new)')
+            continue
+        ratio = value / reference
+        flag = ''
+        if name.startswith(REPORT_ONLY):
+            flag = '  (reported only)'
+        elif ratio < 1 - threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f'{name:45s} {value:14.1f}/s   {ratio:6.2f}x baseline{flag}')
+    if complete:
+        for name in sorted(baseline['results'].keys() - report['results'].keys()):
+            print(f'{name:45s} missing from this run')
+    return regressions
+
+
+def main()->None:
+    parser = argparse.ArgumentParser(description='Benchmark the optimizers, terrains and mesh building.')
+    parser.add_argument('--suite', action='append', choices=list(SUITES), help='run only this suite, can be repeated')
+    parser.add_argument('--quick', action='store_true', help='fewer repetitions')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', default=BASELINE, help='JSON results to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline instead of comparing')
+    parser.add_argument('--threshold', type=float, default=0.25, help='relative slowdown reported as a regression')
+    args = parser.parse_args()
+
+    report = run(args.suite, args.quick)
+    violations = startup_violations(args.quick) if 'startup' in (args.suite or SUITES) else []
+    for violation in violations:
+        print(violation)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+        print(f'baseline written to {args.baseline}')
+        sys.exit(1 if violations else 0)
+    if not os.path.exists(args.baseline):
+        print(json.dumps(report['results'], indent=2, sort_keys=True))
+        print(f'no baseline at {args.baseline}, run with --save-baseline to create one')
+        sys.exit(1 if violations else 0)
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    regressions = compare(report, baseline, args.threshold, complete=args.suite is None)
+    if regressions:
+        print(f'{len(regressions)} regression(s) against {args.baseline}')
+    if regressions or violations:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
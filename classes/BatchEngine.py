@@ -0,0 +1,201 @@
+import numpy as np
+from .Surface import Surface
+from .Optimizer import Optimizer, OptimizerState, CurvatureHistory
+from .vector import vector_view
+from .Profiler import Profiler
+
+
+def sample_starts(surface:Surface, n:int, sampling:str='grid', seed:int=0)-> tuple[np.ndarray, np.ndarray]:
+    """
+    Start points spread inside the surface bounds, for running a population of particles per optimizer.
+
+    Parameters:
+    - surface: the Surface whose bounds are sampled.
+    - n: the number of start points. A 'grid' sampling uses the largest square grid with at most n points.
+    - sampling: 'grid' for a regular grid of cell centers, 'random' for uniformly random points.
+    - seed: seed of the random sampling.
+
+    Returns:
+    - starts_x, starts_y: 1D arrays of the start coordinates, to pass to BatchEngine.
+    """
+    if sampling == 'grid':
+        k = max(int(np.sqrt(n)), 1)
+        # centers of a k x k grid of cells, so no particle starts on the border
+        xs = surface.x_min + (np.arange(k) + 0.5) * (surface.x_max - surface.x_min) / k
+        ys = surface.y_min + (np.arange(k) + 0.5) * (surface.y_max - surface.y_min) / k
+        starts_x, starts_y = np.meshgrid(xs, ys)
+        return starts_x.ravel(), starts_y.ravel()
+    if sampling == 'random':
+        rng = np.random.default_rng(seed)
+        return rng.uniform(surface.x_min, surface.x_max, n), rng.uniform(surface.y_min, surface.y_max, n)
+    raise ValueError(f'unknown sampling {sampling}')
+
+
+class BatchEngine:
+    def __init__(self, surface:Surface, optimizers:list[Optimizer], starts_x=None, starts_y=None, profiler:Profiler|None=None,
+                 dtype=None, accumulator_dtype=None)->None:
+        """
+        Steps N optimizers from M start points each with one vectorized update per algorithm family.
+
+        The state of every trajectory (position, velocity, moment accumulators) lives in contiguous
+        (N, M) arrays. Rows are grouped by optimizer class so that each family owns a contiguous slice.
+        The height and gradient of all trajectories come from a single fused surface.value_and_grad call
+        per step, only families evaluating the gradient elsewhere (Nesterov) need an extra call. Newton gets
+        the Hessians of its trajectories in one batched call and LBFGS evaluates all the steps of its line
+        search in one call, its curvature pairs being kept in a preallocated (memory, 2, N, M) ring buffer.
+
+        Parameters:
+        - surface: the Surface the optimizers run on.
+        - optimizers: the optimizers to drive. They are bound to the engine, so their position and
+                      velocity become views of the first start point of their row.
+        - starts_x, starts_y: optional 1D sequences of the M start points shared by all optimizers.
+                              If omitted every optimizer starts from its own position (M = 1).
+        - profiler: optional Profiler timing the gradient evaluations and updates of every step.
+        - dtype: precision of the state and the hyperparameters, the surface's by default. In float32 the
+                 engine uses half the memory and the compiled terrains are evaluated in float32 as well.
+        - accumulator_dtype: precision of the second-moment sums of AdaGrad, RMSProp and Adam, dtype by default.
+                             np.float64 keeps those sums of squared gradients exact enough over long float32 runs,
+                             the updates reading them are then computed in float64 and rounded.
+        """
+        families:dict[type, list[Optimizer]] = {}
+        for optim in optimizers:
+            families.setdefault(type(optim), []).append(optim)
+
+        self.surface = surface
+        self.profiler = profiler or Profiler()
+        self.optimizers:list[Optimizer] = [optim for group in families.values() for optim in group]
+        self.families:list[tuple[type, slice]] = []
+        start = 0
+        for cls, group in families.items():
+            self.families.append((cls, slice(start, start + len(group))))
+            start += len(group)
+
+        n = len(self.optimizers)
+        if starts_x is None or starts_y is None:
+            starts_x = [[optim.position.x] for optim in self.optimizers]
+            starts_y = [[optim.position.y] for optim in self.optimizers]
+        else:
+            starts_x = np.broadcast_to(np.asarray(starts_x, dtype=float).ravel(), (n, np.size(starts_x)))
+            starts_y = np.broadcast_to(np.asarray(starts_y, dtype=float).ravel(), (n, np.size(starts_y)))
+
+        self.dtype = np.dtype(dtype or getattr(surface, 'dtype', np.float64))
+        # x, y, z and the gradient are stacked along a leading axis, so the update kernels see (2, n, M) parameters
+        x = np.array(starts_x, dtype=self.dtype)
+        y = np.array(starts_y, dtype=self.dtype)
+        assert x.shape == y.shape, 'starts_x and starts_y must have the same length'
+        self.position = np.stack([x, y, np.zeros_like(x)])
+        self.x, self.y, self.z = self.position
+        self.gradient = np.zeros((2,) + x.shape, dtype=self.dtype)
+        self.gradient_x, self.gradient_y = self.gradient
+        self.z[...], self.gradient_x[...], self.gradient_y[...] = surface.value_and_grad(self.x, self.y)
+        self.velocity = np.zeros_like(self.gradient)
+        self.vx, self.vy = self.velocity
+        self.sum_grad = np.zeros_like(self.gradient)
+        self.sum_grad_x, self.sum_grad_y = self.sum_grad
+        self.sum_square_grad = np.zeros_like(self.gradient, dtype=accumulator_dtype or self.dtype)
+        self.sum_square_grad_x, self.sum_square_grad_y = self.sum_square_grad
+        self.active = np.ones(self.x.shape, dtype=bool)
+
+        # per-row hyperparameters, shaped (N, 1) to broadcast over the start points
+        self.lr = self._column('lr')
+        self.gamma = self._column('gamma')
+        self.beta_1 = self._column('beta_1')
+        self.beta_2 = self._column('beta_2')
+        self.t = self._column('t', default=1)
+        self.damping = self._column('damping')
+        self.radius = self._column('radius', default=np.inf)
+        self.memory = self._column('memory')
+        # empty unless there are LBFGS optimizers, the longest memory is kept for all of them
+        self.history = CurvatureHistory.allocate(int(self.memory.max(initial=0)), self.gradient.shape, 0, self.dtype)
+
+        for row, optim in enumerate(self.optimizers):
+            optim.bind(vector_view(self.x, self.y, self.z, (row, 0)), vector_view(self.vx, self.vy, None, (row, 0)))
+
+    def _column(self, name:str, default:float=0.0)->np.ndarray:
+        return np.array([[getattr(optim, name, default)] for optim in self.optimizers], dtype=self.dtype)
+
+    def state(self, rows:slice)->OptimizerState:
+        '''
+        the state of the given rows as views of the engine arrays, with the x and y of every array stacked.
+        '''
+        history = CurvatureHistory(self.history.s[:, :, rows], self.history.y[:, :, rows], self.history.rho[:, :, rows])
+        return OptimizerState(self.velocity[:, rows], self.sum_grad[:, rows], self.sum_square_grad[:, rows], self.t[rows],
+                              self.lr[rows], self.gamma[rows], self.beta_1[rows], self.beta_2[rows],
+                              damping=self.damping[rows], radius=self.radius[rows], memory=self.memory[rows],
+                              position=self.position[:2, rows],
+                              value=self.z[None, rows], loss=lambda points: self._loss(rows, points),
+                              hessian=lambda: self._hessian(rows), history=history, axis=0)
+
+    def _loss(self, rows:slice, points:np.ndarray)->np.ndarray:
+        '''
+        heights of (K, 2, n, M) points of the given rows in one evaluation, as (K, 1, n, M). frozen trajectories are not
+        evaluated, their height is infinite.
+        '''
+        active = self.active[rows]
+        with self.profiler.evaluations(self, rows, active):
+            if active.all():
+                return self.surface.get_z(points[:, 0], points[:, 1])[:, None]
+            values = np.full(points.shape[:1] + active.shape, np.inf, dtype=self.dtype)
+            values[:, active] = self.surface.get_z(points[:, 0][:, active], points[:, 1][:, active])
+        return values[:, None]
+
+    def _hessian(self, rows:slice)->np.ndarray:
+        '''
+        the (n, M, 2, 2) Hessians at the positions of the given rows in one evaluation, the identity for frozen trajectories.
+        '''
+        active = self.active[rows]
+        hessian = np.zeros(active.shape + (2, 2), dtype=self.dtype)
+        hessian[...] = np.eye(2)
+        with self.profiler.evaluations(self, rows, active):
+            d_xx, d_xy, d_yy = self.surface.hessian(self.x[rows][active], self.y[rows][active])
+        hessian[active] = np.stack([d_xx, d_xy, d_xy, d_yy], axis=-1).reshape(-1, 2, 2)
+        return hessian
+
+    @property
+    def shape(self)->tuple[int, int]:
+        return self.x.shape
+
+    def freeze(self, row:int, start:int|slice=slice(None))->None:
+        '''
+        stops the given trajectories from moving in the following steps.
+        '''
+        self.active[row, start] = False
+
+    def step(self)->np.ndarray:
+        '''
+        advances every active trajectory by one step, the surface is only evaluated at active trajectories.
+        returns the (N, M) array of velocity lengths, zero for frozen trajectories.
+        '''
+        profiler = self.profiler
+        everyone = self.active.all()
+        # one minibatch per step on a DataSurface, shared by the lookahead and the value and gradient calls
+        self.surface.next_batch()
+        for cls, rows in self.families:
+            state = self.state(rows)
+            if cls.lookahead is Optimizer.lookahead:
+                # the gradient at the current position is cached from the previous step
+                gradient = self.gradient[:, rows]
+            else:
+                active = self.active[rows]
+                with profiler.phase('lookahead gradient'), profiler.evaluations(self, rows, active):
+                    lookahead = cls.lookahead(state, self.position[:2, rows])
+                    if everyone:
+                        gradient = np.stack(self.surface.derivative(*lookahead))
+                    else:
+                        gradient = np.zeros_like(lookahead)
+                        if active.any():
+                            gradient[:, active] = np.stack(self.surface.derivative(*lookahead[:, active]))
+            with profiler.phase('update'):
+                cls.update(state, gradient)
+
+        self.velocity *= self.active
+        self.position[:2] += self.velocity
+        active = self.active
+        with profiler.phase('value and gradient'), profiler.evaluations(self, slice(None), active):
+            if everyone:
+                self.z[...], self.gradient_x[...], self.gradient_y[...] = self.surface.value_and_grad(self.x, self.y)
+            elif active.any():
+                # frozen trajectories keep their last height and gradient
+                self.z[active], self.gradient_x[active], self.gradient_y[active] = self.surface.value_and_grad(self.x[active], self.y[active])
+
+        return np.hypot(self.vx, self.vy)
@@ -0,0 +1,95 @@
+import numpy as np
+
+# why a trajectory finished, stored per trajectory in Convergence.reason
+RUNNING, STEP, GRADIENT, PLATEAU, OUT_OF_BOUNDS = 0, 1, 2, 3, 4
+REASONS = {RUNNING: 'running', STEP: 'step', GRADIENT: 'gradient', PLATEAU: 'plateau', OUT_OF_BOUNDS: 'out of bounds'}
+
+
+class Convergence:
+    def __init__(self, engine, *, step_tolerance:float|None=1e-4, gradient_tolerance:float|None=None,
+                 plateau_window:int|None=None, plateau_tolerance:float=1e-6,
+                 bounds:tuple[float, float, float, float]|str|None=None, dt:float=1.0):
+        """
+        Stopping criteria of the trajectories of a BatchEngine, evaluated after every step as boolean masks.
+
+        A trajectory converges when its step is shorter than step_tolerance, when its gradient norm is under
+        gradient_tolerance, or when its loss changed by less than plateau_tolerance over the last plateau_window
+        steps. It diverges when it leaves the bounds or its loss is no longer finite. A trajectory meeting
+        several criteria in the same step is recorded with the last of them in that order, so divergence wins.
+        Finished trajectories are frozen in the engine right away, which also stops their gradient evaluations.
+
+        Parameters:
+        - engine: the BatchEngine whose trajectories are watched.
+        - step_tolerance, gradient_tolerance: None disables the criterion.
+        - plateau_window: number of steps the loss change is measured over, None disables the criterion.
+        - plateau_tolerance: loss change under which the loss has reached a plateau.
+        - bounds: (x_min, x_max, y_min, y_max) a trajectory must stay in, 'surface' for the bounds of the engine's Surface.
+                  None disables it.
+        - dt: simulated time per step, for the finishing times.
+        """
+        self.step_tolerance = step_tolerance
+        self.gradient_tolerance = gradient_tolerance
+        self.plateau_window = plateau_window
+        self.plateau_tolerance = plateau_tolerance
+        if bounds == 'surface':
+            surface = engine.surface
+            bounds = (surface.x_min, surface.x_max, surface.y_min, surface.y_max)
+        self.bounds = bounds
+        self.dt = dt
+        self.reason = np.full(engine.shape, RUNNING, dtype=np.int8)
+        # step at which every trajectory finished, -1 while it runs
+        self.step = np.full(engine.shape, -1)
+        # the losses of the last plateau_window steps, the slot of a step is step % plateau_window
+        self.losses = None if plateau_window is None else np.full((plateau_window,) + engine.shape, np.nan)
+
+    @property
+    def time(self)-> np.ndarray:
+        '''
+        simulated time at which every trajectory finished, NaN while it runs.
+        '''
+        return np.where(self.step >= 0, self.step * self.dt, np.nan)
+
+    @property
+    def converged(self)-> np.ndarray:
+        return (self.reason != RUNNING) & (self.reason != OUT_OF_BOUNDS)
+
+    @property
+    def diverged(self)-> np.ndarray:
+        return self.reason == OUT_OF_BOUNDS
+
+    def update(self, engine, del_v:np.ndarray, step:int)-> np.ndarray:
+        '''
+        evaluates the criteria after the given step, del_v being the (N, M) step lengths returned by engine.step().
+        records and freezes the trajectories that finished in this step and returns their (N, M) mask.
+        '''
+        reason = np.zeros(engine.shape, dtype=np.int8)
+        if self.step_tolerance is not None:
+            reason[del_v < self.step_tolerance] = STEP
+        if self.gradient_tolerance is not None:
+            reason[np.hypot(engine.gradient_x, engine.gradient_y) < self.gradient_tolerance] = GRADIENT
+        if self.losses is not None:
+            slot = step % self.plateau_window
+            # NaN until the window is full, which compares as False
+            reason[np.abs(engine.z - self.losses[slot]) < self.plateau_tolerance] = PLATEAU
+            self.losses[slot] = engine.z
+        if self.bounds is not None:
+            x_min, x_max, y_min, y_max = self.bounds
+            outside = ~np.isfinite(engine.z) | (engine.x < x_min) | (engine.x > x_max) | (engine.y < y_min) | (engine.y > y_max)
+            reason[outside] = OUT_OF_BOUNDS
+
+        finished = engine.active & (reason != RUNNING)
+        self.reason[finished] = reason[finished]
+        self.step[finished] = step
+        engine.active &= ~finished
+        return finished
+
+    def ranking(self, engine, finished:np.ndarray)-> list[int]:
+        '''
+        the rows whose first trajectory converged in the step of the finished mask, in leaderboard order:
+        lowest loss first, then row order, so optimizers finishing in the same step are placed deterministically.
+        '''
+        rows = np.flatnonzero(finished[:, 0] & self.converged[:, 0])
+        return rows[np.lexsort((rows, engine.z[rows, 0]))].tolist()
+
+    def __repr__(self) -> str:
+        return f'Convergence({int(self.converged.sum())} converged, {int(self.diverged.sum())} diverged of {self.reason.size})'
@@ -0,0 +1,152 @@
+import math
+import numpy as np
+from terrain.compiled import MixtureTerrain
+from .Surface import Surface
+
+
+def write_dataset(path:str, n_samples:int, slope:float=4.0, intercept:float=-3.0, noise:float=1.0, seed:int=0,
+                  chunk:int=1 << 20)-> np.memmap:
+    """
+    Writes a synthetic linear regression dataset to a .npy file, chunk by chunk, so it can be larger than RAM.
+
+    Every row is (feature, target) with standard normal features and target = slope * feature + intercept + noise.
+
+    Parameters:
+    - path: the .npy file, overwritten.
+    - n_samples: number of rows.
+    - slope, intercept: the true model, which is where the loss of a DataSurface has its minimum.
+    - noise: standard deviation of the gaussian noise on the targets.
+    - seed: seed of the random data.
+    - chunk: number of rows generated and written at a time.
+
+    Returns:
+    - the dataset, memory-mapped read-only.
+    """
+    data = np.lib.format.open_memmap(path, mode='w+', dtype=float, shape=(n_samples, 2))
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_samples, chunk):
+        rows = data[start:start + chunk]
+        rows[:, 0] = rng.standard_normal(len(rows))
+        rows[:, 1] = slope * rows[:, 0] + intercept + noise * rng.standard_normal(len(rows))
+    data.flush()
+    del data
+    return np.load(path, mmap_mode='r')
+
+
+class MinibatchSampler:
+    def __init__(self, n:int, batch_size:int, seed:int=0):
+        """
+        Indices of shuffled minibatches that visit every row once per epoch, in O(batch_size) memory.
+
+        An epoch is the permutation i -> (a i + c) mod n with a random multiplier a coprime with n and a random
+        offset c, so no permutation of the n rows is ever stored and drawing a minibatch costs O(batch_size)
+        whatever the size of the dataset. The indices of a minibatch are sorted, so a memory-mapped dataset
+        is read in file order.
+
+        Parameters:
+        - n: number of rows of the dataset.
+        - batch_size: rows per minibatch, the last minibatch of an epoch can be smaller.
+        - seed: seed of the shuffling.
+        """
+        self.n = n
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed)
+        self.epoch = -1
+        self.position = n
+        self.multiplier, self.offset = 1, 0
+
+    def _new_epoch(self)-> None:
+        self.epoch += 1
+        self.position = 0
+        self.multiplier = 1
+        if self.n > 2:
+            while True:
+                self.multiplier = int(self.rng.integers(1, self.n))
+                if math.gcd(self.multiplier, self.n) == 1:
+                    break
+        self.offset = int(self.rng.integers(0, self.n))
+
+    def next(self, batch_size:int|None=None)-> np.ndarray:
+        '''
+        sorted row indices of the next minibatch, of batch_size rows (the sampler's by default).
+        '''
+        if self.position >= self.n:
+            self._new_epoch()
+        stop = min(self.position + (batch_size or self.batch_size), self.n)
+        # multiplier * step < n^2 stays exact in int64 up to n ~ 3e9 rows
+        steps = np.arange(self.position, stop, dtype=np.int64)
+        self.position = stop
+        return np.sort((self.multiplier * steps + self.offset) % self.n)
+
+
+class DataSurface(Surface):
+    def __init__(self, data:np.ndarray|str, x_min:float, x_max:float, y_min:float, y_max:float, batch_size:int=32,
+                 granularity:int=50, seed:int=0, chunk:int=1 << 20, cache=None, dtype=np.float64):
+        """
+        Surface of the mean squared error of a linear model over a dataset, with minibatch gradients.
+
+        The point (x, y) is the model target = x * feature + y, and its height is the loss over the whole
+        dataset, 0.5 mean((x * feature + y - target)^2). That loss is a quadratic whose coefficients are means
+        of feature^2, feature, feature * target, target and target^2, gathered in one chunked pass over the
+        data, so it is drawn and evaluated exactly by a MixtureTerrain.
+        The gradient is stochastic: next_batch() draws the next minibatch from a MinibatchSampler, and until the
+        following call value_and_grad (and derivative) return the gradient of that minibatch's loss, computed
+        from the same five means over the minibatch only. A step costs O(batch_size) whatever the size of the
+        dataset, and every optimizer stepped on this surface, scalar or through a BatchEngine, follows
+        stochastic gradients. A BatchEngine draws one minibatch of the surface's batch_size per step, which its
+        trajectories share, including the lookahead gradients of Nesterov, so an epoch lasts n / batch_size steps.
+
+        Parameters:
+        - data: (n, 2) array of (feature, target) rows or the path of a .npy file, which is memory-mapped,
+                see write_dataset.
+        - x_min, x_max, y_min, y_max: the bounds of the drawn surface.
+        - batch_size: rows per minibatch.
+        - granularity: see Surface.
+        - seed: seed of the minibatch shuffling.
+        - chunk: rows read at a time by the pass computing the loss.
+        - cache, dtype: see Surface.
+        """
+        self.data = np.load(data, mmap_mode='r') if isinstance(data, str) else data
+        assert self.data.ndim == 2 and self.data.shape[1] == 2, 'the dataset must have (feature, target) rows'
+        self.sampler = MinibatchSampler(len(self.data), batch_size, seed)
+        # the (feature, target) rows of the current minibatch, drawn by next_batch()
+        self.batch:np.ndarray|None = None
+        # one pass over the data, the memory-mapped pages are released as it goes
+        sums = np.zeros(5)
+        for start in range(0, len(self.data), chunk):
+            sums += self._sums(np.asarray(self.data[start:start + chunk]))
+        ff, f, ft, t, tt = sums / len(self.data)
+        super().__init__(MixtureTerrain(quadratic=(0.5 * ff, 0.5, f, -ft, -t, 0.5 * tt)), x_min, x_max, y_min, y_max,
+                         granularity=granularity, cache=cache, dtype=dtype)
+
+    @staticmethod
+    def _sums(rows:np.ndarray)-> np.ndarray:
+        feature, target = rows[:, 0], rows[:, 1]
+        return np.array([feature @ feature, feature.sum(), feature @ target, target.sum(), target @ target])
+
+    def get_random_sample(self, batch_size:int|None=None)-> np.ndarray:
+        '''
+        the (feature, target) rows of the next minibatch, batch_size rows (the surface's by default).
+        '''
+        return np.asarray(self.data[self.sampler.next(batch_size)])
+
+    def next_batch(self, batch_size:int|None=None)-> None:
+        self.batch = self.get_random_sample(batch_size)
+
+    def stochastic_value_and_grad(self, x, y, batch:np.ndarray)-> tuple:
+        '''
+        minibatch loss and gradient at (x, y), scalars or arrays, for the (feature, target) rows of batch.
+        '''
+        ff, f, ft, t, tt = self._sums(batch) / len(batch)
+        # 0.5 mean((x f + y - t)^2) expanded, so the cost is O(len(batch)) + O(points) instead of their product
+        z = 0.5 * (x * x * ff + y * y + tt) + x * y * f - x * ft - y * t
+        return z, x * ff + y * f - ft, x * f + y - t
+
+    def value_and_grad(self, x, y)-> tuple:
+        '''
+        the exact loss over the whole dataset and the gradient of the current minibatch at (x, y).
+        '''
+        if self.batch is None:
+            self.next_batch()
+        _, dz_dx, dz_dy = self.stochastic_value_and_grad(x, y, self.batch)
+        return self.terrain(x, y), dz_dx, dz_dy
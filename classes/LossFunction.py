@@ -0,0 +1,197 @@
+import hashlib
+import numpy as np
+
+
+class LossFunction:
+    '''
+    loss of a model with D parameters, evaluated for any number of parameter vectors at once.
+    '''
+    dimension:int
+
+    def value_and_grad(self, theta:np.ndarray)-> tuple[np.ndarray, np.ndarray]:
+        '''
+        returns the loss (...) and its gradient (..., D) for parameters theta of shape (..., D).
+        '''
+        raise NotImplementedError
+
+    def hessian(self, theta:np.ndarray, h:float=1e-5)-> np.ndarray:
+        '''
+        returns the Hessian (..., D, D) for parameters theta of shape (..., D), a central difference of the gradient
+        at the 2 D offset parameters evaluated in one value_and_grad call, so it is meant for small D.
+        '''
+        theta = np.asarray(theta, dtype=float)
+        offsets = h * np.eye(self.dimension)
+        points = np.concatenate([theta[..., None, :] + offsets, theta[..., None, :] - offsets], axis=-2)
+        _, gradient = self.value_and_grad(points)
+        hessian = (gradient[..., :self.dimension, :] - gradient[..., self.dimension:, :]) / (2 * h)
+        return (hessian + np.swapaxes(hessian, -1, -2)) / 2
+
+    def __call__(self, theta:np.ndarray)-> np.ndarray:
+        return self.value_and_grad(theta)[0]
+
+
+class LeastSquares(LossFunction):
+    def __init__(self, A:np.ndarray, b:np.ndarray)->None:
+        """
+        Mean squared error of a linear model, L(theta) = |A theta - b|^2 / (2 n).
+
+        Parameters:
+        - A: (n, D) design matrix.
+        - b: (n,) targets.
+        """
+        self.A = np.asarray(A, dtype=float)
+        self.b = np.asarray(b, dtype=float)
+        self.dimension = self.A.shape[1]
+        # A^T A / n, computed on the first hessian call
+        self.gram = None
+
+    @classmethod
+    def make(cls, n_samples:int=1000, dimension:int=100, noise:float=0.1, seed:int=0)-> 'LeastSquares':
+        '''
+        synthetic problem with standard normal features, targets of a random true model plus gaussian noise.
+        '''
+        rng = np.random.default_rng(seed)
+        A = rng.standard_normal((n_samples, dimension))
+        theta = rng.standard_normal(dimension)
+        return cls(A, A @ theta + noise * rng.standard_normal(n_samples))
+
+    def value_and_grad(self, theta:np.ndarray)-> tuple[np.ndarray, np.ndarray]:
+        n = len(self.b)
+        # every parameter vector is handled by the same matrix product
+        residual = theta @ self.A.T - self.b
+        return np.einsum('...i,...i->...', residual, residual) / (2 * n), residual @ self.A / n
+
+    def hessian(self, theta:np.ndarray)-> np.ndarray:
+        '''
+        the Hessian A^T A / n, the same for all parameters.
+        '''
+        if self.gram is None:
+            self.gram = self.A.T @ self.A / len(self.b)
+        return np.broadcast_to(self.gram, np.shape(theta)[:-1] + self.gram.shape)
+
+    def __repr__(self) -> str:
+        return f'LeastSquares({self.A.shape[0]} samples, {self.dimension} parameters)'
+
+
+class LogisticRegression(LossFunction):
+    def __init__(self, X:np.ndarray, y:np.ndarray, l2:float=0.0)->None:
+        """
+        Mean cross-entropy of a logistic model, L(theta) = mean(log(1 + exp(X theta)) - y X theta) + l2 |theta|^2 / 2.
+
+        Parameters:
+        - X: (n, D) features.
+        - y: (n,) labels, 0 or 1.
+        - l2: weight of the L2 regularization, which makes the minimum unique on separable data.
+        """
+        self.X = np.asarray(X, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.l2 = l2
+        self.dimension = self.X.shape[1]
+
+    @classmethod
+    def make(cls, n_samples:int=1000, dimension:int=100, l2:float=1e-3, seed:int=0)-> 'LogisticRegression':
+        '''
+        synthetic problem with standard normal features and labels drawn from a random true model.
+        '''
+        rng = np.random.default_rng(seed)
+        X = rng.standard_normal((n_samples, dimension))
+        theta = rng.standard_normal(dimension) / np.sqrt(dimension)
+        y = rng.uniform(size=n_samples) < 1 / (1 + np.exp(-X @ theta))
+        return cls(X, y, l2)
+
+    def value_and_grad(self, theta:np.ndarray)-> tuple[np.ndarray, np.ndarray]:
+        n = len(self.y)
+        margin = theta @ self.X.T
+        # log(1 + exp(m)) and the sigmoid without overflow for large margins
+        loss = np.mean(np.logaddexp(0, margin) - self.y * margin, axis=-1)
+        probability = np.exp(-np.logaddexp(0, -margin))
+        grad = (probability - self.y) @ self.X / n
+        if self.l2:
+            loss = loss + self.l2 / 2 * np.einsum('...i,...i->...', theta, theta)
+            grad = grad + self.l2 * theta
+        return loss, grad
+
+    def hessian(self, theta:np.ndarray)-> np.ndarray:
+        '''
+        the Hessian X^T diag(p (1 - p)) X / n + l2 I, p being the predicted probabilities.
+        '''
+        margin = np.asarray(theta, dtype=float) @ self.X.T
+        weight = np.exp(-np.logaddexp(0, -margin) - np.logaddexp(0, margin))
+        hessian = np.einsum('...s,si,sj->...ij', weight, self.X, self.X, optimize=True) / len(self.y)
+        return hessian + self.l2 * np.eye(self.dimension)
+
+    def __repr__(self) -> str:
+        return f'LogisticRegression({self.X.shape[0]} samples, {self.dimension} parameters)'
+
+
+class LossSlice:
+    def __init__(self, loss:LossFunction, center:np.ndarray, d1:np.ndarray, d2:np.ndarray)->None:
+        """
+        2D slice of a loss through the parameter space, usable as a terrain so a Surface can draw it.
+
+        The point (x, y) of the slice is the parameter vector center + x d1 + y d2, and the terrain gradient
+        is the loss gradient projected on d1 and d2. It has the terrain signature, the bounds being ignored,
+        so Surface(LossSlice(...), x_min, x_max, y_min, y_max) works like any terrain function.
+
+        Parameters:
+        - loss: the LossFunction sliced.
+        - center: (D,) parameters at the origin of the slice.
+        - d1, d2: (D,) directions of the x and y axes, see from_trajectory.
+        """
+        self.loss = loss
+        self.center = np.asarray(center, dtype=float)
+        self.directions = np.stack([d1, d2]).astype(float)
+        # the repr identifies the slice for the surface cache, which cannot tell two slices apart otherwise
+        digest = hashlib.sha1(self.center.tobytes() + self.directions.tobytes())
+        for value in vars(loss).values():
+            if isinstance(value, np.ndarray):
+                digest.update(value.tobytes())
+        self.digest = digest.hexdigest()[:12]
+
+    @classmethod
+    def from_trajectory(cls, loss:LossFunction, trajectory:np.ndarray)-> 'LossSlice':
+        '''
+        slice centered on the last parameters of a trajectory of shape (steps, D), along the two principal
+        directions of the path that leads there, the plane the trajectory moved in the most.
+        '''
+        trajectory = np.asarray(trajectory, dtype=float)
+        center = trajectory[-1]
+        _, _, vt = np.linalg.svd(trajectory - center, full_matrices=False)
+        if len(vt) < 2:
+            # a trajectory without two independent moves, any direction orthogonal to the first one does
+            rng = np.random.default_rng(0)
+            other = rng.standard_normal(len(center))
+            other -= (other @ vt[0]) * vt[0]
+            vt = np.stack([vt[0], other / np.linalg.norm(other)])
+        return cls(loss, center, vt[0], vt[1])
+
+    def project(self, theta:np.ndarray)-> tuple[np.ndarray, np.ndarray]:
+        '''
+        x and y coordinates of parameters of shape (..., D) in the slice, exact for orthonormal directions.
+        '''
+        coordinates = (np.asarray(theta, dtype=float) - self.center) @ self.directions.T
+        return coordinates[..., 0], coordinates[..., 1]
+
+    def bounds(self, trajectory:np.ndarray, margin:float=0.2)-> tuple[float, float, float, float]:
+        '''
+        x_min, x_max, y_min, y_max of the projected trajectory, widened by `margin` times its extent.
+        '''
+        x, y = self.project(trajectory)
+        extent = max(x.max() - x.min(), y.max() - y.min(), 1e-3)
+        return (float(x.min() - margin * extent), float(x.max() + margin * extent),
+                float(y.min() - margin * extent), float(y.max() + margin * extent))
+
+    def _theta(self, x, y)-> np.ndarray:
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+        return self.center + x[..., None] * self.directions[0] + y[..., None] * self.directions[1]
+
+    def __call__(self, x, y, x_min=None, x_max=None, y_min=None, y_max=None):
+        return self.loss(self._theta(x, y))[()]
+
+    def value_and_grad(self, x, y, x_min=None, x_max=None, y_min=None, y_max=None):
+        z, grad = self.loss.value_and_grad(self._theta(x, y))
+        dz_dx, dz_dy = np.moveaxis(grad @ self.directions.T, -1, 0)
+        return z[()], dz_dx[()], dz_dy[()]
+
+    def __repr__(self) -> str:
+        return f'LossSlice({self.loss!r}, {self.digest})'
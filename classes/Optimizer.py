@@ -3,12 +3,100 @@
 
 
 # import vector
+from __future__ import annotations
+from typing import TYPE_CHECKING
 import numpy as np
-import vpython as vp
 from .vector import vector
 from .Surface import Surface
 
+if TYPE_CHECKING:
+    # only needed for the color annotations, so the optimizers can run without vpython
+    import vpython as vp
+
+
+class CurvatureHistory:
+    def __init__(self, s:np.ndarray, y:np.ndarray, rho:np.ndarray)->None:
+        """
+        The last curvature pairs of quasi-Newton optimizers (LBFGS) in a preallocated ring buffer, usually views of an engine's arrays.
+
+        Slot k holds the pair of the step whose counter is k modulo the memory: s the move of the parameters and
+        y the change of the gradient it caused, with rho = 1 / (s . y). rho is zero for pairs rejected by the curvature
+        condition and for slots not written yet, which makes them no-ops in the two-loop recursion.
+
+        Parameters:
+        - s, y: (memory, *parameters shape) arrays.
+        - rho: (memory, *parameters shape) array whose parameter axis has a length of 1.
+        """
+        self.s = s
+        self.y = y
+        self.rho = rho
+
+    @classmethod
+    def allocate(cls, memory:int, shape:tuple[int, ...], axis:int, dtype=np.float64)-> 'CurvatureHistory':
+        '''
+        an empty history of `memory` pairs for parameters of the given shape, the parameters lying along axis.
+        '''
+        rho_shape = list(shape)
+        rho_shape[axis] = 1
+        return cls(*(np.zeros((memory,) + tuple(pair_shape), dtype=dtype) for pair_shape in (shape, shape, rho_shape)))
+
+    def __len__(self)-> int:
+        return len(self.s)
+
+
+class OptimizerState:
+    def __init__(self, velocity:np.ndarray, sum_grad:np.ndarray, sum_square_grad:np.ndarray, t:np.ndarray,
+                 lr:np.ndarray, gamma:np.ndarray, beta_1:np.ndarray, beta_2:np.ndarray, *, damping:np.ndarray|None=None,
+                 radius:np.ndarray|None=None, memory:np.ndarray|None=None, position:np.ndarray|None=None, value:np.ndarray|None=None,
+                 loss=None, hessian=None, history:CurvatureHistory|None=None, axis:int=0)->None:
+        """
+        Arrays an update kernel (Optimizer.update) reads and writes, usually views of the rows of one family in an engine.
+
+        The accumulators have the shape of the parameters they belong to, e.g. (2, n, M) for the x and y of a
+        BatchEngine or (n, D) for a ParameterEngine. t and the hyperparameters hold one value per optimizer,
+        shaped to broadcast against them. Kernels update every array in place.
+        First-order kernels treat every coordinate independently. Newton and LBFGS also need the parameter axis,
+        the current parameters and loss, and callables evaluating the loss elsewhere, which only they call.
+
+        Parameters:
+        - velocity: the step the kernel writes, the caller adds it to the parameters.
+        - sum_grad, sum_square_grad: first and second moment accumulators.
+        - t: step counters.
+        - lr, gamma, beta_1, beta_2, damping, radius, memory: hyperparameters.
+        - position: the current parameters.
+        - value: the loss at position, shaped like the parameters with a parameter axis of length 1.
+        - loss: function of (K, *parameters shape) points returning their (K, *value shape) losses.
+        - hessian: function returning the Hessians at position, (..., D, D) with the parameters on the last axes.
+        - history: the curvature pairs of LBFGS.
+        - axis: the axis of the parameters, 0 for a BatchEngine and -1 for a ParameterEngine.
+        """
+        self.velocity = velocity
+        self.sum_grad = sum_grad
+        self.sum_square_grad = sum_square_grad
+        self.t = t
+        self.lr = lr
+        self.gamma = gamma
+        self.beta_1 = beta_1
+        self.beta_2 = beta_2
+        self.damping = damping
+        self.radius = radius
+        self.memory = memory
+        self.position = position
+        self.value = value
+        self.loss = loss
+        self.hessian = hessian
+        self.history = history
+        self.axis = axis
+
+
 class Optimizer:
+    # derivatives of the loss the update needs, 2 for the Hessian
+    order = 1
+    # the name shown on the leaderboard, a class attribute so the engines can name rows without an instance
+    name = ''
+    # rows of the minibatch step() draws on a DataSurface, None for the surface's batch_size
+    batch_size = None
+
     def __init__(self, position_x, position_y, *, surface:Surface, lr:float, color:vp.color)->None:
         self.position = vector(position_x, position_y, surface.get_z(position_x, position_y))
         self.velocity = vector()
@@ -16,211 +104,287 @@ class Optimizer:
         self.lr = lr
         self.color = color
         self.losses = []
+        # accumulators of the update kernel when the optimizer is stepped on its own, (2,) arrays for x and y
+        self._sum_grad = np.zeros(2)
+        self._sum_square_grad = np.zeros(2)
+        self._t = np.ones(1)
 
     def step(self)->float:
         '''
-        updates the x and y position of the optimizer according to the optimization algorithm.
+        updates the x and y position of the optimizer according to the optimization algorithm,
+        by running its update kernel on the (2,) parameters of this optimizer.
         returns the length of the velocity vector
         '''
+        self.surface.next_batch(self.batch_size)
+        state = self._state()
+        gradient = np.array(self.surface.derivative(*self.lookahead(state, state.position)))
+        self.update(state, gradient)
+        self.velocity.x, self.velocity.y = state.velocity.tolist()
+
+        self.position += self.velocity
+        self.position.z = self.surface.get_z(self.position.x, self.position.y)
+
+        return self.velocity.length()
+
+    def _state(self)-> OptimizerState:
+        '''
+        the state step() runs the kernel on, the hyperparameters an optimizer does not have are 0 as in the engines.
+        '''
+        hyperparameter = lambda name: getattr(self, name, 0.0)
+        velocity = np.array([self.velocity.x, self.velocity.y], dtype=float)
+        return OptimizerState(velocity, self._sum_grad, self._sum_square_grad, self._t, self.lr,
+                              hyperparameter('gamma'), hyperparameter('beta_1'), hyperparameter('beta_2'),
+                              position=np.array([self.position.x, self.position.y], dtype=float),
+                              value=np.array([self.position.z], dtype=float))
+
+    def bind(self, position:vector, velocity:vector)->None:
+        '''
+        turns the optimizer into a view of a BatchEngine row.
+        position and velocity are read from and written to the engine's arrays from now on.
+        '''
+        self.position = position
+        self.velocity = velocity
+
+    @staticmethod
+    def lookahead(state:OptimizerState, position:np.ndarray)->np.ndarray:
+        '''
+        returns the point where the gradient is evaluated, position being the parameters of the state.
+        '''
+        return position
+
+    @staticmethod
+    def update(state:OptimizerState, gradient:np.ndarray)->None:
+        '''
+        vectorized version of step() for parameter arrays of any shape, every coordinate being independent
+        for the first-order optimizers. writes the new state.velocity (and any accumulators), the caller moves the parameters.
+        '''
         raise NotImplementedError
     
     def __repr__(self) -> str:
-        pass
+        return self.name
 
 
 class GradientDescent(Optimizer):
+    name = 'GD'
+
     def __init__(self, position_x, position_y, *, surface:Surface, lr:float, color:vp.color):
         super().__init__(position_x, position_y, surface=surface, lr=lr, color=color)
 
-    def step(self)-> float:
-        gradient_x, gradient_y = self.surface.derivative(self.position.x, self.position.y)
-        self.velocity.x = - gradient_x * self.lr
-        self.velocity.y = - gradient_y * self.lr
-        self.position.x = self.position.x + self.velocity.x
-        self.position.y = self.position.y + self.velocity.y
-        self.position.z = self.surface.get_z(self.position.x, self.position.y)
-
-        return self.velocity.length()
-    
-    def __repr__(self) -> str:
-        return f'GD'
+    @staticmethod
+    def update(state:OptimizerState, gradient:np.ndarray)->None:
+        state.velocity[...] = - gradient * state.lr
 
 ### In case the question meant the stochastic gradient optimizer
-class StochGradDesc(Optmimizer):
-     def __init__(self, position_x, position_y, *, surface:Surface, lr:float, color:vp.color, batch_size=1):
-          super().__init__(position_x, position_y, surface=surface, lr=lr, color=color)
-          self.batch_size=batch_size #Number of batches in each iteration
-
-    def step(self)-> float:
-        batch_x, batch_y=self.surface.get_random_sample(self.batch_size)
-        gradient_x, gradient_y = self.surface.derivative(batch_x, batch_y)
-
-        self.velocity.x = - gradient_x * self.lr
-        self.velocity.y = - gradient_y * self.lr
-        self.position.x = self.position.x + self.velocity.x
-        self.position.y = self.position.y + self.velocity.y
-        self.position.z = self.surface.get_z(self.position.x, self.position.y)
+class StochGradDesc(Optimizer):
+    name = 'SGD'
 
-        return self.velocity.length()
-    def _repr_(self)->str:
-        return f'SGD'
+    def __init__(self, position_x, position_y, *, surface:Surface, lr:float, color:vp.color, batch_size=1):
+        super().__init__(position_x, position_y, surface=surface, lr=lr, color=color)
+        self.batch_size=batch_size #Number of batches in each iteration
+
+    @staticmethod
+    def update(state:OptimizerState, gradient:np.ndarray)->None:
+        # the gradient is already stochastic on a DataSurface. batch_size only applies to the scalar step(),
+        # a BatchEngine draws one minibatch of the surface's batch_size per step for all its trajectories
+        state.velocity[...] = - gradient * state.lr
 
 class Momentum(Optimizer):
+    name = 'Momentum'
+
     def __init__(self, position_x, position_y, *, surface:Surface, lr:float, color:vp.color, gamma:float):
         super().__init__(position_x, position_y, surface=surface, lr=lr, color=color)
         assert 0 <= gamma <= 1, 'gamma must be in the range [0, 1]'
         self.gamma = gamma
 
-    def step(self)->float:
-        gradient_x, gradient_y = self.surface.derivative(self.position.x, self.position.y)
-        self.velocity.x = self.gamma * self.velocity.x - gradient_x * self.lr
-        self.velocity.y = self.gamma * self.velocity.y - gradient_y * self.lr
-        self.position.x = self.position.x + self.velocity.x
-        self.position.y = self.position.y + self.velocity.y
-        self.position.z = self.surface.get_z(self.position.x, self.position.y)
-
-        return self.velocity.length()
-    
-    def __repr__(self) -> str:
-        return f'Momentum'
+    @staticmethod
+    def update(state:OptimizerState, gradient:np.ndarray)->None:
+        state.velocity[...] = state.gamma * state.velocity - gradient * state.lr
 
 class Nesterov(Optimizer):
+    name = 'Nesterov'
+
     def __init__(self, position_x, position_y, *, surface:Surface, lr:float, color:vp.color, gamma:float):
         super().__init__(position_x, position_y, surface=surface, lr=lr, color=color)
         assert 0 <= gamma <= 1, 'gamma must be in the range [0, 1]'
         self.gamma = gamma
 
-    def step(self)-> float:
-        x_ahead, y_ahead = self.position.x + self.gamma * self.velocity.x, self.position.y + self.gamma * self.velocity.y
-        gradient_x, gradient_y = self.surface.derivative(x_ahead, y_ahead)
-        self.velocity.x = self.gamma * self.velocity.x - gradient_x * self.lr
-        self.velocity.y = self.gamma * self.velocity.y - gradient_y * self.lr
+    @staticmethod
+    def lookahead(state:OptimizerState, position:np.ndarray)->np.ndarray:
+        return position + state.gamma * state.velocity
 
-        self.position.x = self.position.x + self.velocity.x
-        self.position.y = self.position.y + self.velocity.y
-        self.position.z = self.surface.get_z(self.position.x, self.position.y)
-
-        return self.velocity.length()
-
-    def __repr__(self) -> str:
-        return f'Nesterov'
+    @staticmethod
+    def update(state:OptimizerState, gradient:np.ndarray)->None:
+        state.velocity[...] = state.gamma * state.velocity - gradient * state.lr
     
 class AdaGrad(Optimizer):
+    name = 'AdaGrad'
+
     def __init__(self, position_x, position_y, *, surface:Surface, lr:float, color:vp.color):
         super().__init__(position_x, position_y, surface=surface, lr=lr, color=color)
-        self.sum_square_grad_x = 0
-        self.sum_square_grad_y = 0
-
-    def step(self)-> float:
-        gradient_x, gradient_y = self.surface.derivative(self.position.x, self.position.y)
-        self.sum_square_grad_x += gradient_x ** 2
-        self.sum_square_grad_y += gradient_y ** 2
-        self.velocity.x = - gradient_x * self.lr / np.sqrt(self.sum_square_grad_x + 1e-8)
-        self.velocity.y = - gradient_y * self.lr / np.sqrt(self.sum_square_grad_y + 1e-8)
-
-        self.position.x = self.position.x + self.velocity.x
-        self.position.y = self.position.y + self.velocity.y
-        self.position.z = self.surface.get_z(self.position.x, self.position.y)
 
-        return self.velocity.length()
-    
-    def __repr__(self) -> str:
-        return f'AdaGrad'
+    @staticmethod
+    def update(state:OptimizerState, gradient:np.ndarray)->None:
+        state.sum_square_grad += gradient ** 2
+        state.velocity[...] = - gradient * state.lr / np.sqrt(state.sum_square_grad + 1e-8)
     
 class RMSProp(Optimizer):
+    name = 'RMSProp'
+
     def __init__(self, position_x, position_y, *, surface:Surface, lr:float, color:vp.color, gamma:float):
         super().__init__(position_x, position_y, surface=surface, lr=lr, color=color)
         assert 0 <= gamma <= 1, 'gamma must be in the range [0, 1]'
         self.gamma = gamma
-        self.sum_square_grad_x = 0
-        self.sum_square_grad_y = 0
-    
-    def step(self)->float:
-        gradient_x, gradient_y = self.surface.derivative(self.position.x, self.position.y)
-        self.sum_square_grad_x = self.gamma * self.sum_square_grad_x + (1-self.gamma) * gradient_x ** 2
-        self.sum_square_grad_y = self.gamma * self.sum_square_grad_y + (1-self.gamma) * gradient_y ** 2
-        self.velocity.x = - gradient_x * self.lr/ np.sqrt(self.sum_square_grad_x + 1e-8)
-        self.velocity.y = - gradient_y * self.lr/ np.sqrt(self.sum_square_grad_y + 1e-8)
-
-        self.position.x = self.position.x + self.velocity.x
-        self.position.y = self.position.y + self.velocity.y
-        self.position.z = self.surface.get_z(self.position.x, self.position.y)
 
-        return self.velocity.length()
-    
-    def __repr__(self) -> str:
-        return f'RMSProp'
+    @staticmethod
+    def update(state:OptimizerState, gradient:np.ndarray)->None:
+        gamma = state.gamma
+        state.sum_square_grad[...] = gamma * state.sum_square_grad + (1-gamma) * gradient ** 2
+        state.velocity[...] = - gradient * state.lr / np.sqrt(state.sum_square_grad + 1e-8)
     
 class Adam(Optimizer):
+    name = 'Adam'
+
     def __init__(self, position_x, position_y, *, surface:Surface, lr:float, color:vp.color, beta_1:float, beta_2:float):
         super().__init__(position_x, position_y, surface=surface, lr=lr, color=color)
         self.beta_1 = beta_1
         self.beta_2 = beta_2
-        self.t = 1
-        self.sum_grad_x = 0
-        self.sum_grad_y = 0
-        self.sum_square_grad_x = 0
-        self.sum_square_grad_y = 0
-    
-    def step(self)->float:
-        self.t += 1
-        grad_x, grad_y = self.surface.derivative(self.position.x, self.position.y)
-        self.sum_grad_x = self.beta_1 * self.sum_grad_x + (1 - self.beta_1) * grad_x
-        self.sum_grad_y = self.beta_1 * self.sum_grad_y + (1 - self.beta_1) * grad_y
-        self.sum_square_grad_x = self.beta_2 * self.sum_square_grad_x + ( 1 - self.beta_2) * grad_x ** 2
-        self.sum_square_grad_y = self.beta_2 * self.sum_square_grad_y + ( 1 - self.beta_2) * grad_y ** 2
-
-        denominator_m = 1 - self.beta_1 ** self.t
-        denominator_v = 1 - self.beta_2 ** self.t
 
-        m_t_x, m_t_y = self.sum_grad_x / denominator_m, self.sum_grad_y / denominator_m
-        v_t_x, v_t_y = self.sum_square_grad_x / denominator_v, self.sum_square_grad_y / denominator_v
+    @staticmethod
+    def update(state:OptimizerState, gradient:np.ndarray)->None:
+        beta_1, beta_2 = state.beta_1, state.beta_2
+        state.t += 1
+        state.sum_grad[...] = beta_1 * state.sum_grad + (1 - beta_1) * gradient
+        state.sum_square_grad[...] = beta_2 * state.sum_square_grad + (1 - beta_2) * gradient ** 2
 
-        self.velocity.x = - m_t_x * self.lr / np.sqrt(v_t_x + 1e-8)
-        self.velocity.y = - m_t_y * self.lr / np.sqrt(v_t_y + 1e-8)
+        denominator_m = 1 - beta_1 ** state.t
+        denominator_v = 1 - beta_2 ** state.t
 
-        self.position.x = self.position.x + self.velocity.x
-        self.position.y = self.position.y + self.velocity.y
-        self.position.z = self.surface.get_z(self.position.x, self.position.y)
-
-        return self.velocity.length()
-
-    def __repr__(self) -> str:
-        return f'Adam'
+        m_t, v_t = state.sum_grad / denominator_m, state.sum_square_grad / denominator_v
+        state.velocity[...] = - m_t * state.lr / np.sqrt(v_t + 1e-8)
 
 
 #Here is the Normalized gradients Optimizer
 
 class Normalized(Optimizer):
+    name = 'Norm'
+
     def __init__(self, position_x, position_y, *, surface:Surface, lr:float, color:vp.color):
         super().__init__(position_x, position_y, surface=surface, lr=lr, color=color)
-        self.t = 1
-        self.sum_grad_x = 0
-        self.sum_grad_y = 0
-        self.sum_square_grad_x = 0
-        self.sum_square_grad_y = 0
-    
-    def step(self)->float:
-        self.t += 1
-        grad_x, grad_y = self.surface.derivative(self.position.x, self.position.y)
-        self.sum_grad_x = grad_x
-        self.sum_grad_y = grad_y
-        self.sum_square_grad_x =  grad_x ** 2
-        self.sum_square_grad_y =  grad_y ** 2
-
-      
-        self.velocity.x = - self.sum_grad_x * self.lr / np.sqrt(self.sum_square_grad_x + 1e-8)
-        self.velocity.y = - self.sum_grad_y  * self.lr / np.sqrt(self.sum_square_grad_y + 1e-8)
-
-        self.position.x = self.position.x + self.velocity.x
-        self.position.y = self.position.y + self.velocity.y
-        self.position.z = self.surface.get_z(self.position.x, self.position.y)
-
-        return self.velocity.length()
-
-    def __repr__(self) -> str:
-        return f'Norm'
 
+    @staticmethod
+    def update(state:OptimizerState, gradient:np.ndarray)->None:
+        state.t += 1
+        state.velocity[...] = - gradient * state.lr / np.sqrt(gradient ** 2 + 1e-8)
 
 
+class Newton(Optimizer):
+    # damping is the smallest curvature the step is divided by and radius the longest step (the trust region),
+    # so that the optimizer does not jump off the surface where the curvature is small
+    name = 'Newton'
+    order = 2
 
+    def __init__(self, position_x, position_y, *, surface:Surface, lr:float, color:vp.color, damping:float=0.05,
+                 radius:float=2.0):
+        super().__init__(position_x, position_y, surface=surface, lr=lr, color=color)
+        assert damping > 0, 'damping must be positive'
+        assert radius > 0, 'radius must be positive'
+        self.damping = damping
+        self.radius = radius
+
+    def _state(self)-> OptimizerState:
+        state = super()._state()
+        x, y = state.position.tolist()
+        # the (2, 2) Hessian at the position of this optimizer
+        state.hessian = lambda: np.array(self.surface.hessian(x, y))[[0, 1, 1, 2]].reshape(2, 2)
+        state.damping, state.radius = self.damping, self.radius
+        return state
+
+    @staticmethod
+    def update(state:OptimizerState, gradient:np.ndarray)->None:
+        axis = state.axis
+        to_last = lambda array: np.moveaxis(np.broadcast_to(array, gradient.shape), axis, -1)
+        eigenvalues, eigenvectors = np.linalg.eigh(state.hessian())
+        # saddle-free Newton: the curvature along every eigenvector is |eigenvalue|, so saddles and maxima repel
+        # instead of attracting, and at least damping, which bounds the step in flat directions
+        curvature = np.maximum(np.abs(eigenvalues), to_last(state.damping))
+        projected = np.einsum('...ji,...j->...i', eigenvectors, to_last(gradient)) / curvature
+        step = to_last(state.lr) * np.einsum('...ij,...j->...i', eigenvectors, projected)
+        if state.radius is not None:
+            # trust region: longer steps keep their direction and are shortened to the radius
+            length = np.sqrt(np.sum(step ** 2, axis=-1, keepdims=True))
+            radius = to_last(state.radius)[..., :1]
+            outside = length > radius
+            step *= np.where(outside, radius / np.where(outside, length, 1), 1)
+        state.velocity[...] = - np.moveaxis(step, -1, axis)
+
+
+class LBFGS(Optimizer):
+    # the line search tries lr, lr * shrink, lr * shrink^2... in one loss evaluation and takes the longest step
+    # decreasing the loss by at least armijo times the decrease the slope predicts
+    name = 'L-BFGS'
+    line_search_steps = 10
+    shrink = 0.5
+    armijo = 1e-4
+
+    def __init__(self, position_x, position_y, *, surface:Surface, lr:float, color:vp.color, memory:int=10):
+        super().__init__(position_x, position_y, surface=surface, lr=lr, color=color)
+        assert memory >= 1, 'memory must be at least 1'
+        self.memory = memory
+        # the curvature pairs of the scalar step()
+        self._history = CurvatureHistory.allocate(memory, (2,), 0)
+
+    def _state(self)-> OptimizerState:
+        state = super()._state()
+        state.memory, state.history = self.memory, self._history
+        state.loss = lambda points: np.asarray(self.surface.get_z(points[:, 0], points[:, 1]))[:, None]
+        return state
+
+    @staticmethod
+    def update(state:OptimizerState, gradient:np.ndarray)->None:
+        # sum_grad holds the previous gradient, sum_square_grad the scale of the initial inverse Hessian
+        # and velocity the previous move, which the engines zero for frozen optimizers
+        axis, history = state.axis, state.history
+        dot = lambda a, b: np.sum(a * b, axis=axis, keepdims=True)
+        memory = len(history)
+
+        # the curvature pair of the previous move, kept if s . y > 0 so the inverse Hessian stays positive definite,
+        # and large enough for 1 / (s . y) to be finite in float32. the rows of a family are stepped together,
+        # so they share the slot. without memory only the scale is kept
+        newest = int(state.t.flat[0]) % max(memory, 1)
+        s, y = state.velocity, gradient - state.sum_grad
+        sy, yy = dot(s, y), dot(y, y)
+        accepted = (sy > 1e-10 * yy) & (sy > np.finfo(sy.dtype).tiny)
+        if memory:
+            history.s[newest], history.y[newest] = s, y
+            history.rho[newest] = np.where(accepted, 1 / np.where(accepted, sy, 1), 0)
+        state.sum_square_grad[...] = np.where(accepted, sy / np.where(accepted, yy, 1), state.sum_square_grad)
+        state.sum_grad[...] = gradient
+        state.t += 1
+
+        # two-loop recursion, newest pair first, the pairs older than the memory of their optimizer are skipped
+        age = (newest - np.arange(memory)) % memory
+        rho = history.rho * (age.reshape((-1,) + (1,) * (history.rho.ndim - 1)) < state.memory)
+        order = np.argsort(age)
+        q = gradient.copy()
+        alpha = np.zeros_like(rho)
+        for k in order:
+            alpha[k] = rho[k] * dot(history.s[k], q)
+            q -= alpha[k] * history.y[k]
+        r = np.where(state.sum_square_grad > 0, state.sum_square_grad, 1) * q
+        for k in order[::-1]:
+            r += (alpha[k] - rho[k] * dot(history.y[k], r)) * history.s[k]
+
+        # a direction that does not descend falls back to the gradient
+        slope = -dot(gradient, r)
+        descent = slope < 0
+        direction = np.where(descent, -r, -gradient)
+        slope = np.where(descent, slope, -dot(gradient, gradient))
+
+        # backtracking with every candidate step of every optimizer evaluated in a single loss call,
+        # the shortest step is taken if none decreases the loss enough
+        steps = state.lr * LBFGS.shrink ** np.arange(LBFGS.line_search_steps).reshape((-1,) + (1,) * gradient.ndim)
+        values = state.loss(state.position + steps * direction)
+        decrease = values <= state.value + LBFGS.armijo * steps * slope
+        first = np.where(decrease.any(axis=0), decrease.argmax(axis=0), len(steps) - 1)
+        step = np.take_along_axis(np.broadcast_to(steps, decrease.shape), first[None], axis=0)[0]
+        state.velocity[...] = step * direction
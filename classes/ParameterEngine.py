@@ -0,0 +1,112 @@
+import numpy as np
+from .Optimizer import Optimizer, OptimizerState, CurvatureHistory
+from .LossFunction import LossFunction
+
+
+class ParameterEngine:
+    def __init__(self, loss:LossFunction, optimizers:list[tuple[type, dict[str, float]]], theta0:np.ndarray)->None:
+        """
+        Steps N optimizers on a loss of D parameters with one vectorized update per algorithm family.
+
+        The counterpart of BatchEngine for parameter vectors instead of points on a Surface: the parameters,
+        velocities and moment accumulators live in (N, D) arrays, rows are grouped by optimizer class and
+        every family is updated by its Optimizer.update kernel. The loss and gradient of all rows come from
+        a single loss.value_and_grad call per step, plus one for the rows of a lookahead family (Nesterov),
+        one loss.hessian call for Newton and one call for all the steps of the LBFGS line search.
+
+        Parameters:
+        - loss: the LossFunction to minimize.
+        - optimizers: (Optimizer subclass, hyperparameters) of every optimizer, e.g. (Adam, {'lr': 0.1, 'beta_1': 0.9, 'beta_2': 0.999}).
+                      Missing hyperparameters are 0 (the Newton radius is unlimited), as in BatchEngine.
+                      Newton needs (N, D, D) Hessians, a finite difference of the gradient unless the loss has a
+                      closed form, so it suits small D.
+        - theta0: (D,) parameters every optimizer starts from, or (N, D) for one start per optimizer.
+        """
+        families:dict[type, list[dict[str, float]]] = {}
+        for cls, hyperparameters in optimizers:
+            families.setdefault(cls, []).append(hyperparameters)
+
+        self.loss = loss
+        self.names:list[str] = []
+        self.families:list[tuple[type, slice]] = []
+        rows = []
+        for cls, group in families.items():
+            self.families.append((cls, slice(len(rows), len(rows) + len(group))))
+            rows.extend(group)
+            self.names.extend([cls.name] * len(group))
+        # the optimizers in row order, as the families group them
+        self.optimizers:list[tuple[type, dict[str, float]]] = [(cls, hyperparameters) for cls, group in families.items()
+                                                              for hyperparameters in group]
+
+        n = len(rows)
+        self.theta = np.array(np.broadcast_to(np.asarray(theta0, dtype=float), (n, loss.dimension)))
+        self.value, self.gradient = loss.value_and_grad(self.theta)
+        self.velocity = np.zeros_like(self.theta)
+        self.sum_grad = np.zeros_like(self.theta)
+        self.sum_square_grad = np.zeros_like(self.theta)
+        self.active = np.ones(n, dtype=bool)
+
+        # per-row hyperparameters, shaped (N, 1) to broadcast over the parameters
+        column = lambda name, default=0.0: np.array([[row.get(name, default)] for row in rows], dtype=float)
+        self.lr = column('lr')
+        self.gamma = column('gamma')
+        self.beta_1 = column('beta_1')
+        self.beta_2 = column('beta_2')
+        self.t = column('t', default=1)
+        self.damping = column('damping')
+        self.radius = column('radius', default=np.inf)
+        self.memory = column('memory')
+        # empty unless there are LBFGS optimizers, the longest memory is kept for all of them
+        self.history = CurvatureHistory.allocate(int(self.memory.max(initial=0)), self.theta.shape, -1)
+
+    def state(self, rows:slice)->OptimizerState:
+        history = CurvatureHistory(self.history.s[:, rows], self.history.y[:, rows], self.history.rho[:, rows])
+        return OptimizerState(self.velocity[rows], self.sum_grad[rows], self.sum_square_grad[rows], self.t[rows],
+                              self.lr[rows], self.gamma[rows], self.beta_1[rows], self.beta_2[rows],
+                              damping=self.damping[rows], radius=self.radius[rows], memory=self.memory[rows],
+                              position=self.theta[rows],
+                              value=self.value[rows, None], loss=lambda points: self.loss.value_and_grad(points)[0][..., None],
+                              hessian=lambda: self.loss.hessian(self.theta[rows]), history=history, axis=-1)
+
+    @property
+    def shape(self)->tuple[int, int]:
+        return self.theta.shape
+
+    def freeze(self, row:int)->None:
+        '''
+        stops the given optimizer from moving in the following steps.
+        '''
+        self.active[row] = False
+
+    def step(self)->np.ndarray:
+        '''
+        advances every active optimizer by one step.
+        returns the (N,) array of velocity norms, zero for frozen optimizers.
+        '''
+        for cls, rows in self.families:
+            state = self.state(rows)
+            if cls.lookahead is Optimizer.lookahead:
+                # the gradient at the current parameters is cached from the previous step
+                gradient = self.gradient[rows]
+            else:
+                _, gradient = self.loss.value_and_grad(cls.lookahead(state, self.theta[rows]))
+            cls.update(state, gradient)
+
+        self.velocity *= self.active[:, None]
+        self.theta += self.velocity
+        self.value, self.gradient = self.loss.value_and_grad(self.theta)
+
+        return np.linalg.norm(self.velocity, axis=1)
+
+    def run(self, steps:int, tolerance:float=0.0)->np.ndarray:
+        '''
+        steps the engine `steps` times, freezing every optimizer whose step gets shorter than tolerance.
+        returns the (steps + 1, N) losses, the first row being the starting loss.
+        '''
+        losses = np.empty((steps + 1, len(self.theta)))
+        losses[0] = self.value
+        for i in range(steps):
+            del_v = self.step()
+            self.active &= del_v >= tolerance
+            losses[i + 1] = self.value
+        return losses
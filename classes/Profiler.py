@@ -0,0 +1,228 @@
+import json
+import threading
+import time
+import numpy as np
+from terrain.compiled import BoundTerrain
+
+
+class RingBuffer:
+    def __init__(self, size:int):
+        '''
+        the last `size` values pushed, kept in a preallocated array.
+        '''
+        self.data = np.zeros(size)
+        self.index = 0
+        self.count = 0
+
+    def push(self, value:float)-> None:
+        self.data[self.index] = value
+        self.index = (self.index + 1) % len(self.data)
+        self.count = min(self.count + 1, len(self.data))
+
+    def values(self)-> np.ndarray:
+        '''
+        the stored values, oldest first.
+        '''
+        if self.count < len(self.data):
+            return self.data[:self.count]
+        return np.roll(self.data, -self.index)
+
+    def percentiles(self, q:tuple[float, ...]=(50, 90, 99))-> np.ndarray:
+        if self.count == 0:
+            return np.zeros(len(q))
+        return np.percentile(self.values(), q)
+
+
+class CountingTerrain:
+    def __init__(self, terrain:BoundTerrain):
+        '''
+        wrapper of a bound terrain counting the points it is evaluated at. a value and gradient counts
+        terrain.gradient_cost times per point, e.g. once for a closed form and five times for a central difference,
+        and a Hessian terrain.hessian_cost times.
+        '''
+        self.terrain = terrain
+        self.count = 0
+
+    def __call__(self, x, y):
+        self.count += np.size(x)
+        return self.terrain(x, y)
+
+    def value_and_grad(self, x, y):
+        self.count += np.size(x) * self.terrain.gradient_cost
+        return self.terrain.value_and_grad(x, y)
+
+    def hessian(self, x, y):
+        self.count += np.size(x) * self.terrain.hessian_cost
+        return self.terrain.hessian(x, y)
+
+    def __repr__(self) -> str:
+        return f'CountingTerrain({self.terrain!r})'
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Phase:
+    def __init__(self, profiler, name:str):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        with self.profiler.lock:
+            frame = self.profiler.frame
+            frame[self.name] = frame.get(self.name, 0.0) + seconds
+        return False
+
+
+class _Evaluations:
+    def __init__(self, profiler, engine, rows:slice, active:np.ndarray):
+        self.profiler = profiler
+        self.engine = engine
+        self.rows = rows
+        self.active = active
+        self.start = 0
+
+    def __enter__(self):
+        self.start = self.profiler.counter.count if self.profiler.counter is not None else 0
+        return self
+
+    def __exit__(self, *exc):
+        if self.profiler.counter is not None:
+            optimizers = self.engine.optimizers[self.rows]
+            # a call evaluates the same number of points for each active trajectory, frozen ones get none
+            trajectories = self.active.reshape(len(optimizers), -1).sum(axis=1)
+            total = trajectories.sum()
+            if total == 0:
+                return False
+            shares = (self.profiler.counter.count - self.start) * trajectories / total
+            with self.profiler.lock:
+                counts = self.profiler.frame_evaluations
+                for optim, share in zip(optimizers, shares.tolist()):
+                    counts[repr(optim)] = counts.get(repr(optim), 0) + share
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class Profiler:
+    def __init__(self, enabled:bool=False, window:int=300):
+        """
+        Per-frame timings of the phases of the main loop and terrain evaluation counts per optimizer.
+
+        Code to be timed is wrapped in `with profiler.phase(name):` and every frame is closed with end_frame().
+        The last `window` frames of every phase are kept in ring buffers, from which rolling percentiles are
+        reported. When disabled, phase() and evaluations() return a shared no-op context manager, so the
+        instrumentation can stay in the hot loop.
+        Phases may run in the simulation thread while the main thread opens and closes the frames. The frame
+        totals are guarded by a lock, and a phase counts in the frame in which it ends.
+
+        Parameters:
+        - enabled: whether anything is recorded.
+        - window: number of frames the percentiles are computed over.
+        """
+        self.enabled = enabled
+        self.window = window
+        self.frames = 0
+        self.frame:dict[str, float] = {}
+        self.frame_evaluations:dict[str, float] = {}
+        self.timings:dict[str, RingBuffer] = {}
+        self.evaluation_counts:dict[str, RingBuffer] = {}
+        self.counter:CountingTerrain|None = None
+        self.frame_start = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def instrument(self, surface)-> None:
+        '''
+        wraps the bound terrain of the surface to count its evaluations.
+        '''
+        if self.enabled and self.counter is None:
+            self.counter = CountingTerrain(surface.terrain)
+            surface.terrain = self.counter
+
+    def phase(self, name:str):
+        if not self.enabled:
+            return _NULL_PHASE
+        # one timer per block, so blocks of the same name in two threads do not share a start time
+        return _Phase(self, name)
+
+    def evaluations(self, engine, rows:slice, active:np.ndarray):
+        '''
+        attributes the terrain evaluations made inside the block to the optimizers of the given engine rows, split over
+        the trajectories marked in the (n, M) `active` mask of those rows.
+        '''
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Evaluations(self, engine, rows, active)
+
+    def start_frame(self)-> None:
+        with self.lock:
+            self.frame.clear()
+            self.frame_evaluations.clear()
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self)-> None:
+        if not self.enabled:
+            return
+        seconds = time.perf_counter() - self.frame_start
+        # the totals are taken over under the lock, the simulation thread adds to fresh dicts meanwhile
+        with self.lock:
+            frame, self.frame = self.frame, {}
+            evaluations, self.frame_evaluations = self.frame_evaluations, {}
+        frame['frame'] = seconds
+        for name, seconds in frame.items():
+            self._buffer(self.timings, name).push(seconds)
+        for name, count in evaluations.items():
+            self._buffer(self.evaluation_counts, name).push(count)
+        self.frames += 1
+        self.frame_start = time.perf_counter()
+
+    def _buffer(self, buffers:dict[str, RingBuffer], name:str)-> RingBuffer:
+        buffer = buffers.get(name)
+        if buffer is None:
+            buffer = buffers[name] = RingBuffer(self.window)
+        return buffer
+
+    def summary(self)-> dict:
+        '''
+        p50/p90/p99/mean of every phase in milliseconds and of the terrain evaluations per optimizer per frame.
+        '''
+        def stats(buffer:RingBuffer, scale:float)-> dict[str, float]:
+            p50, p90, p99 = buffer.percentiles() * scale
+            return {'p50': p50, 'p90': p90, 'p99': p99, 'mean': buffer.values().mean() * scale}
+        return {'frames': self.frames, 'window': self.window,
+                'phases_ms': {name: stats(buffer, 1000) for name, buffer in self.timings.items()},
+                'evaluations_per_frame': {name: stats(buffer, 1) for name, buffer in self.evaluation_counts.items()}}
+
+    def report(self)-> str:
+        summary = self.summary()
+        lines = [f'last {min(self.frames, self.window)} frames   p50 / p90 / p99 ms']
+        for name, stats in summary['phases_ms'].items():
+            lines.append(f"{name}: {stats['p50']:.2f} / {stats['p90']:.2f} / {stats['p99']:.2f}")
+        if summary['evaluations_per_frame']:
+            lines.append('terrain evaluations per frame')
+            for name, stats in summary['evaluations_per_frame'].items():
+                lines.append(f"{name}: {stats['mean']:.0f}")
+        return '\n'.join(lines)
+
+    def dump(self, path:str)-> None:
+        '''
+        writes the summary and the raw per-frame values of the window to a JSON file.
+        '''
+        if not self.enabled:
+            return
+        data = self.summary()
+        data['raw_ms'] = {name: (buffer.values() * 1000).tolist() for name, buffer in self.timings.items()}
+        with open(path, 'w') as file:
+            json.dump(data, file, indent=2)
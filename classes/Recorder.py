@@ -0,0 +1,171 @@
+import json
+import threading
+import numpy as np
+from .vector import vector_view
+
+# one record per optimizer, start point and step
+RECORD = np.dtype([('x', 'f8'), ('y', 'f8'), ('z', 'f8'), ('loss', 'f8'), ('grad_norm', 'f8')])
+
+
+def _color(color)-> list[float]|None:
+    return None if color is None else [color.x, color.y, color.z]
+
+
+class TrajectoryRecorder:
+    def __init__(self, path:str, engine, chunk:int=1024):
+        """
+        Appends the state of every trajectory of a BatchEngine per step to a memory-mapped file.
+
+        The file holds a structured array of shape (steps, N, M) with the RECORD fields. It grows by `chunk`
+        steps at a time, so appending never copies the recording, and only the pages being written stay in
+        RAM. The optimizer names and colors and the number of steps are written to `path + '.json'` on close.
+
+        Parameters:
+        - path: the raw data file, overwritten.
+        - engine: the BatchEngine whose trajectories are recorded, its initial state is the first step.
+        - chunk: number of steps the file grows by.
+        """
+        self.path = path
+        self.chunk = chunk
+        self.shape = engine.shape
+        self.names = [repr(optim) for optim in engine.optimizers]
+        self.colors = [_color(optim.color) for optim in engine.optimizers]
+        self.steps = 0
+        self.capacity = 0
+        self.data = None
+        open(path, 'wb').close()
+        self.record(engine)
+
+    def _grow(self)-> None:
+        if self.data is not None:
+            self.data.flush()
+        self.capacity += self.chunk
+        with open(self.path, 'r+b') as file:
+            file.truncate(self.capacity * self.shape[0] * self.shape[1] * RECORD.itemsize)
+        self.data = np.memmap(self.path, dtype=RECORD, mode='r+', shape=(self.capacity,) + self.shape)
+
+    def record(self, engine)-> None:
+        if self.steps == self.capacity:
+            self._grow()
+        frame = self.data[self.steps]
+        frame['x'], frame['y'], frame['z'] = engine.x, engine.y, engine.z
+        # the height is the loss being minimized
+        frame['loss'] = engine.z
+        frame['grad_norm'] = np.hypot(engine.gradient_x, engine.gradient_y)
+        self.steps += 1
+
+    def close(self, dt:float|None=None)-> None:
+        '''
+        trims the file to the recorded steps and writes the metadata next to it.
+        '''
+        if self.data is None:
+            return
+        self.data.flush()
+        self.data = None
+        with open(self.path, 'r+b') as file:
+            file.truncate(self.steps * self.shape[0] * self.shape[1] * RECORD.itemsize)
+        with open(self.path + '.json', 'w') as file:
+            json.dump({'names': self.names, 'colors': self.colors, 'shape': list(self.shape), 'steps': self.steps,
+                       'dt': dt, 'dtype': RECORD.descr}, file)
+
+
+class Recording:
+    def __init__(self, path:str):
+        """
+        Read-only, memory-mapped view of a file written by TrajectoryRecorder.
+
+        Attributes:
+        - data: structured array of shape (steps, N, M) with the RECORD fields.
+        - names, colors: repr and rgb color (or None) of the N optimizers.
+        - dt: simulated time per step, if it was given to the recorder.
+        """
+        with open(path + '.json') as file:
+            meta = json.load(file)
+        self.names:list[str] = meta['names']
+        self.colors:list[list[float]|None] = meta['colors']
+        self.dt:float|None = meta['dt']
+        self.steps:int = meta['steps']
+        self.data = np.memmap(path, dtype=RECORD, mode='r', shape=(meta['steps'],) + tuple(meta['shape']))
+
+    def losses(self, row:int, start:int=0)-> np.ndarray:
+        '''
+        loss per step of one trajectory, what Optimizer.losses was meant to hold.
+        '''
+        return self.data['loss'][:, row, start]
+
+    def __repr__(self) -> str:
+        return f'Recording({self.steps} steps, {", ".join(self.names)})'
+
+
+class _Track:
+    '''
+    stands in for an optimizer during a replay, with the name and color of the recording and a position
+    that is a view of the current replay frame, so Graphics.add_optimizer and render_optimizers can draw it.
+    '''
+    def __init__(self, name:str, color, position:vector_view):
+        self.name = name
+        self.color = color
+        self.position = position
+
+    def __repr__(self) -> str:
+        return self.name
+
+
+class Replay:
+    def __init__(self, recording:Recording, speed:float=1.0, color=None):
+        """
+        Plays a Recording back through Graphics without recomputing anything.
+
+        The replay looks like a BatchEngine to Graphics: `optimizers` can be passed to add_optimizer and the
+        replay itself to add_population, after which render_optimizers/render_populations draw the current
+        frame. Like Simulation, pausing clears the `running` Event.
+
+        Parameters:
+        - recording: the Recording to play.
+        - speed: recorded steps advanced per advance() call, fractional and negative speeds are allowed.
+        - color: function turning the recorded [r, g, b] into a color object, e.g. lambda rgb: vp.vector(*rgb).
+        """
+        self.recording = recording
+        self.speed = speed
+        self.position = 0.0
+        shape = recording.data.shape[1:]
+        self.x, self.y, self.z = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+        self.optimizers = [_Track(name, None if rgb is None or color is None else color(rgb),
+                                  vector_view(self.x, self.y, self.z, (row, 0)))
+                           for row, (name, rgb) in enumerate(zip(recording.names, recording.colors))]
+        self.running = threading.Event()
+        self.seek(0)
+
+    @property
+    def step(self)-> int:
+        return int(self.position)
+
+    @property
+    def finished(self)-> bool:
+        '''
+        whether the replay reached the end it is playing towards.
+        '''
+        if self.speed < 0:
+            return self.position == 0
+        return self.position == self.recording.steps - 1
+
+    @property
+    def paused(self)-> bool:
+        return not self.running.is_set()
+
+    def pause(self)-> None:
+        self.running.clear()
+
+    def resume(self)-> None:
+        self.running.set()
+
+    def seek(self, step:float)-> None:
+        '''
+        jumps to the given step, clipped to the recording, and loads its positions into the current frame.
+        '''
+        self.position = min(max(float(step), 0.0), self.recording.steps - 1)
+        frame = self.recording.data[self.step]
+        self.x[...], self.y[...], self.z[...] = frame['x'], frame['y'], frame['z']
+
+    def advance(self)-> None:
+        self.seek(self.position + self.speed)
@@ -0,0 +1,137 @@
+import threading
+import numpy as np
+from .BatchEngine import BatchEngine
+
+
+class FrameBuffer:
+    def __init__(self, capacity:int, shape:tuple[int, int]):
+        """
+        Bounded ring buffer of position snapshots, written by the simulation thread and read by the renderer.
+
+        The reader always gets the newest snapshot. Every read lets the writer add one more snapshot,
+        and the writer blocks while it is `capacity` snapshots ahead of the reads, so the simulation
+        advances by one snapshot per rendered frame on average and the slack absorbs the jitter of
+        either side.
+
+        Parameters:
+        - capacity: number of snapshots stored.
+        - shape: (N, M) shape of the engine state arrays.
+        """
+        self.capacity = capacity
+        self.x = np.zeros((capacity,) + shape)
+        self.y = np.zeros((capacity,) + shape)
+        self.z = np.zeros((capacity,) + shape)
+        self.steps = np.zeros(capacity, dtype=int)
+        # arrays handed to the reader, so the writer can reuse the slot as soon as it was copied
+        self.out_x, self.out_y, self.out_z = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+        self.written = 0
+        self.reads = 0
+        self.last_read = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def write(self, engine:BatchEngine, step:int)-> bool:
+        '''
+        stores the current positions of the engine. returns False if the buffer was closed while waiting.
+        '''
+        with self.condition:
+            while self.written - self.reads >= self.capacity and not self.closed:
+                self.condition.wait()
+            if self.closed:
+                return False
+            slot = self.written % self.capacity
+            self.x[slot], self.y[slot], self.z[slot] = engine.x, engine.y, engine.z
+            self.steps[slot] = step
+            self.written += 1
+            self.condition.notify_all()
+        return True
+
+    def newest(self)-> tuple[int, np.ndarray, np.ndarray, np.ndarray]|None:
+        '''
+        returns (step, x, y, z) of the newest snapshot, or None if nothing was written since the last read.
+        the arrays are overwritten by the next read.
+        '''
+        with self.condition:
+            if self.written == self.last_read:
+                return None
+            slot = (self.written - 1) % self.capacity
+            self.out_x[...], self.out_y[...], self.out_z[...] = self.x[slot], self.y[slot], self.z[slot]
+            step = int(self.steps[slot])
+            self.last_read = self.written
+            self.reads += 1
+            self.condition.notify_all()
+        return step, self.out_x, self.out_y, self.out_z
+
+    def close(self)-> None:
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class Simulation:
+    def __init__(self, engine:BatchEngine, steps_per_frame:int=1, capacity:int=4, max_steps:int|None=None, on_step=None):
+        """
+        Steps a BatchEngine in a background thread and publishes its positions through a FrameBuffer,
+        so the renderer only draws the newest snapshot at its own rate.
+
+        Every step is simulated, snapshots are taken every steps_per_frame steps. Logic that must see every
+        step (convergence, the leaderboard) goes in on_step, which runs in the simulation thread.
+        Pausing clears an Event the thread waits on, so a paused simulation uses no CPU.
+
+        Parameters:
+        - engine: the BatchEngine to step, only the simulation thread touches it once started.
+        - steps_per_frame: number of steps simulated per snapshot.
+        - capacity: number of snapshots the simulation may run ahead of the renderer.
+        - max_steps: the thread stops after this many steps, None runs until stop().
+        - on_step: optional function of (engine, del_v, step) called after every step, del_v being the
+                   (N, M) velocity lengths returned by engine.step().
+        """
+        self.engine = engine
+        self.steps_per_frame = steps_per_frame
+        self.max_steps = max_steps
+        self.on_step = on_step
+        self.buffer = FrameBuffer(capacity, engine.shape)
+        self.step = 0
+        self.running = threading.Event()
+        self.finished = threading.Event()
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name='simulation', daemon=True)
+
+    def start(self, paused:bool=False)-> None:
+        if not paused:
+            self.running.set()
+        self.thread.start()
+
+    def pause(self)-> None:
+        self.running.clear()
+
+    def resume(self)-> None:
+        self.running.set()
+
+    @property
+    def paused(self)-> bool:
+        return not self.running.is_set()
+
+    def stop(self)-> None:
+        self.stopped = True
+        self.buffer.close()
+        self.running.set()
+        self.thread.join()
+
+    def _run(self)-> None:
+        try:
+            while not self.stopped and (self.max_steps is None or self.step < self.max_steps):
+                self.running.wait()
+                if self.stopped:
+                    break
+                for _ in range(self.steps_per_frame):
+                    del_v = self.engine.step()
+                    self.step += 1
+                    if self.on_step is not None:
+                        self.on_step(self.engine, del_v, self.step)
+                    if self.step == self.max_steps:
+                        break
+                if not self.buffer.write(self.engine, self.step):
+                    break
+        finally:
+            self.finished.set()
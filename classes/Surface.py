@@ -1,23 +1,77 @@
 import numpy as np
-import matplotlib.pyplot as plt
 from .vector import vector
+from terrain.compiled import bind_terrain
+from terrain.gradients import central_difference_hessian
+from .GradientField import GradientField
+from .SurfaceCache import SurfaceCache
 
 class Surface:
-    def __init__(self, function, x_min:float, x_max:float, y_min:float, y_max:float, granularity:int=50):
+    def __init__(self, function, x_min:float, x_max:float, y_min:float, y_max:float, granularity:int=50,
+                 field_resolution:int|None=None, interpolation:str='bilinear', cache:SurfaceCache|None=None, dtype=np.float64):
+        '''
+        field_resolution: if given, Z and its gradient are precomputed on a grid of that resolution
+        and get_z/derivative become interpolated lookups (see GradientField), useful for expensive terrains.
+        cache: if given, the meshgrid, the gradient field and the mesh colors are stored on disk and
+        loaded memory-mapped on the next run with the same terrain, bounds and granularity.
+        dtype: precision of the meshgrid, the gradient field and, through BatchEngine, of the optimizers running
+        on the surface. np.float32 halves their memory and evaluates the compiled terrains in float32.
+        '''
         self.function = function
+        # the terrain bound to these bounds, evaluated with (x, y) only
+        self.terrain = bind_terrain(function, x_min, x_max, y_min, y_max)
         self.x_min = x_min
         self.x_max = x_max
         self.y_min = y_min
         self.y_max = y_max
+        self.cache = cache
+        self.cache_key = None
+        self.dtype = np.dtype(dtype)
 
-        self.X, self.Y = np.meshgrid(np.linspace(x_min, x_max, granularity), np.linspace(y_min, y_max, granularity))
-        self.Z = self.function(self.X, self.Y, self.x_min, self.x_max, self.y_min, self.y_max)
+        if cache is None:
+            grids = self._meshgrid(granularity)
+        else:
+            self.cache_key = cache.key(function, 'surface', x_min, x_max, y_min, y_max, granularity, self.dtype.name)
+            grids = cache.load_or_build(self.cache_key, lambda: self._meshgrid(granularity), names=('X', 'Y', 'Z'))
+        self.X, self.Y, self.Z = grids['X'], grids['Y'], grids['Z']
+        self.field = None
+        if field_resolution is not None:
+            self.field = GradientField(function, x_min, x_max, y_min, y_max, field_resolution, interpolation, cache=cache, dtype=dtype)
+
+    def _meshgrid(self, granularity:int)-> dict[str, np.ndarray]:
+        X, Y = np.meshgrid(np.linspace(self.x_min, self.x_max, granularity, dtype=self.dtype),
+                           np.linspace(self.y_min, self.y_max, granularity, dtype=self.dtype))
+        return {'X': X, 'Y': Y, 'Z': np.asarray(self.terrain(X, Y), dtype=self.dtype)}
     
     def get_z(self, x:float, y:float)-> float:
-        return self.function(x, y, self.x_min, self.x_max, self.y_min, self.y_max)
+        if self.field is not None:
+            return self.field.get_z(x, y)
+        return self.terrain(x, y)
     
     def derivative(self, x:float, y:float)-> tuple[float, float]:
-        d = 1e-6
-        dz_dx = (self.get_z(x + d, y) - self.get_z(x, y)) / d
-        dz_dy = (self.get_z(x, y + d) - self.get_z(x, y)) / d
+        _, dz_dx, dz_dy = self.value_and_grad(x, y)
         return dz_dx, dz_dy
+
+    def value_and_grad(self, x:float, y:float)-> tuple[float, float, float]:
+        '''
+        returns (z, dz/dx, dz/dy) in one pass. Terrains with a compiled form (see terrain/compiled.py) or a
+        registered closed-form gradient (see terrain/gradients.py) are exact, the others fall back to a
+        vectorized central difference.
+        '''
+        if self.field is not None:
+            return self.field.value_and_grad(x, y)
+        return self.terrain.value_and_grad(x, y)
+
+    def next_batch(self, batch_size:int|None=None)-> None:
+        '''
+        called once per optimization step before the gradients of that step. a stochastic surface (DataSurface)
+        draws the minibatch every gradient is taken on until the next call, the others have nothing to draw.
+        '''
+
+    def hessian(self, x:float, y:float)-> tuple[float, float, float]:
+        '''
+        returns (d2z/dx2, d2z/dxdy, d2z/dy2) for any number of points in one batched pass, exact for the compiled
+        terrains, a central difference of the gradient at 4 points per point otherwise.
+        '''
+        if self.field is not None:
+            return central_difference_hessian(self.field.value_and_grad, x, y)
+        return self.terrain.hessian(x, y)
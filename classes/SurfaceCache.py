@@ -0,0 +1,128 @@
+import hashlib
+import inspect
+import os
+import shutil
+import tempfile
+import numpy as np
+from terrain.compiled import compiled_factory
+
+
+def _sources(obj, seen:set)-> list[str]:
+    '''
+    source code of a terrain and of the module-level functions and classes it refers to, recursively.
+    '''
+    if id(obj) in seen:
+        return []
+    seen.add(id(obj))
+    target = obj if inspect.isfunction(obj) or inspect.isclass(obj) else type(obj)
+    try:
+        sources = [inspect.getsource(target)]
+    except (OSError, TypeError):
+        return [f'{target.__module__}.{target.__qualname__}']
+    package = target.__module__.split('.')[0]
+    if inspect.isfunction(target):
+        functions = [target]
+    else:
+        members = [m.fget if isinstance(m, property) else m for m in vars(target).values()]
+        functions = [m for m in members if inspect.isfunction(m)]
+        # inherited methods are evaluated as well, e.g. the BoundTerrain a compiled terrain derives from
+        for base in target.__mro__[1:]:
+            if base.__module__.split('.')[0] == package:
+                sources += _sources(base, seen)
+    for function in functions:
+        for name in function.__code__.co_names:
+            # unwrap decorated helpers such as lru_cache
+            referenced = inspect.unwrap(function.__globals__.get(name)) if callable(function.__globals__.get(name)) else None
+            # only follow helpers of the terrain's own package, not numpy and friends
+            if (inspect.isfunction(referenced) or inspect.isclass(referenced)) and referenced.__module__.split('.')[0] == package:
+                sources += _sources(referenced, seen)
+    return sources
+
+
+def terrain_fingerprint(function)-> str:
+    '''
+    identity of a terrain for caching: its qualified name, its source and the source of the helpers it calls.
+    a terrain with a compiled form (see terrain/compiled.py) is evaluated through it, so the source of its factory
+    and of the classes that factory builds are part of it too. terrain objects also contribute their repr,
+    which is expected to show their parameters.
+    '''
+    target = function if inspect.isfunction(function) else type(function)
+    seen = set()
+    parts = [f'{target.__module__}.{target.__qualname__}'] + _sources(function, seen)
+    factory = compiled_factory(function) if inspect.isfunction(function) else None
+    if factory is not None:
+        parts += _sources(factory, seen)
+    if not inspect.isfunction(function):
+        parts.append(repr(function))
+    return '\n'.join(parts)
+
+
+class SurfaceCache:
+    def __init__(self, directory:str='.surface_cache'):
+        """
+        Persistent cache of the arrays computed for a Surface (meshgrid, gradient fields, mesh colors).
+
+        Every entry is a directory of .npy files named after a hash of the terrain fingerprint and the
+        parameters the arrays depend on, so changing the terrain source, the bounds, the granularity or
+        the colormap points to a new entry. Entries are loaded memory-mapped and read-only.
+
+        Parameters:
+        - directory: where the entries are stored.
+        """
+        self.directory = directory
+
+    def key(self, function, *parts)-> str:
+        digest = hashlib.sha1(terrain_fingerprint(function).encode())
+        for part in parts:
+            digest.update(repr(part).encode())
+        return digest.hexdigest()
+
+    def load(self, key:str, names:tuple[str, ...]=())-> dict[str, np.ndarray]|None:
+        '''
+        the arrays of the entry, None if it does not exist, lacks one of the expected names or has an unreadable array.
+        '''
+        path = os.path.join(self.directory, key)
+        if not os.path.isdir(path):
+            return None
+        try:
+            arrays = {name[:-4]: np.load(os.path.join(path, name), mmap_mode='r')
+                      for name in os.listdir(path) if name.endswith('.npy')}
+        except (OSError, ValueError):
+            return None
+        if any(name not in arrays for name in names):
+            return None
+        return arrays
+
+    def save(self, key:str, arrays:dict[str, np.ndarray])-> None:
+        '''
+        writes the entry into a temporary directory first, so a crash never leaves a partial entry behind.
+        '''
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=self.directory)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, f'{name}.npy'), np.asarray(array))
+        try:
+            os.rename(tmp, os.path.join(self.directory, key))
+        except OSError:
+            # another process stored the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def load_or_build(self, key:str, build, names:tuple[str, ...]=())-> dict[str, np.ndarray]:
+        '''
+        returns the cached arrays of the key, calling build() and storing its dict of arrays on a miss.
+        an entry missing one of the expected names (e.g. an empty directory) is a miss and is replaced.
+        '''
+        arrays = self.load(key, names)
+        if arrays is None:
+            built = build()
+            # a stale entry would make the rename of the new one fail
+            shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+            self.save(key, built)
+            arrays = self.load(key, names)
+            if arrays is None:
+                # the new entry could not be read back, the built arrays are used as they are
+                return built
+        return arrays
+
+    def clear(self)-> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,141 @@
+import numpy as np
+
+
+class TrailChange:
+    def __init__(self, trail:int, reset:bool, dropped:int, head:np.ndarray|None, new:np.ndarray):
+        """
+        What changed in one trail since the previous TrailBuffer.flush, for the renderer to replay on its curve.
+
+        Parameters:
+        - trail: index of the trail.
+        - reset: the curve must be cleared and `new` holds every point of the trail.
+        - dropped: number of oldest points to remove from the curve.
+        - head: new position of the last point the curve already has, None if it did not move.
+        - new: (k, 3) points to append.
+        """
+        self.trail = trail
+        self.reset = reset
+        self.dropped = dropped
+        self.head = head
+        self.new = new
+
+
+class TrailBuffer:
+    def __init__(self, capacity:int=200, min_distance:float=0.05, max_angle:float=2.0):
+        """
+        Paths of many moving points in fixed-capacity ring buffers, with online decimation.
+
+        Every trail stores at most `capacity` points in an (n, capacity, 3) array, the oldest point being
+        overwritten once it is full. A pushed position replaces the last point of its trail instead of
+        being appended when it is closer than min_distance to the point before, or when the turn it makes
+        is under max_angle degrees, so straight and slow stretches cost a single point and the trail
+        always ends at the current position. push() handles all trails with vectorized operations.
+
+        The renderer calls flush() once per frame, which returns the changes since the previous flush as
+        appended points, dropped points and a moved head, so updating a curve costs the points that
+        changed rather than the length of the trail.
+
+        Parameters:
+        - capacity: maximum number of points per trail.
+        - min_distance: minimum distance between consecutive points.
+        - max_angle: turns under this angle in degrees extend the last segment instead of adding a point.
+        """
+        assert capacity >= 2, 'a trail needs at least 2 points'
+        self.capacity = capacity
+        self.min_distance = min_distance
+        self.cos_max_angle = np.cos(np.radians(max_angle))
+        self.points = np.zeros((0, capacity, 3))
+        self.count = np.zeros(0, dtype=int)
+        # index of the next point to write, the last point is at head - 1
+        self.head = np.zeros(0, dtype=int)
+        # changes since the last flush
+        self.appended = np.zeros(0, dtype=int)
+        self.dropped = np.zeros(0, dtype=int)
+        self.head_moved = np.zeros(0, dtype=bool)
+        self.sent = np.zeros(0, dtype=int)
+
+    def __len__(self)-> int:
+        return len(self.points)
+
+    def add(self, position)-> int:
+        '''
+        adds a trail starting at position and returns its index.
+        '''
+        trail = len(self.points)
+        self.points = np.concatenate([self.points, np.zeros((1, self.capacity, 3))])
+        self.count, self.head, self.appended, self.dropped, self.sent = (np.append(a, 0) for a in
+                                                                         (self.count, self.head, self.appended, self.dropped, self.sent))
+        self.head_moved = np.append(self.head_moved, False)
+        self.push(np.asarray(position, dtype=float)[None], np.array([trail]))
+        return trail
+
+    def clear(self, trails=slice(None))-> None:
+        '''
+        empties the given trails, their next flush resets the curves.
+        '''
+        self.count[trails] = 0
+        self.head[trails] = 0
+        self.appended[trails] = 0
+        self.dropped[trails] = 0
+        self.head_moved[trails] = False
+        self.sent[trails] = -1
+
+    def push(self, positions:np.ndarray, trails:np.ndarray|None=None)-> None:
+        '''
+        adds the current (k, 3) positions of the given trails, all of them by default.
+        '''
+        positions = np.asarray(positions, dtype=float)
+        trails = np.arange(len(self.points)) if trails is None else np.asarray(trails)
+        count, head = self.count[trails], self.head[trails]
+        last = self.points[trails, (head - 1) % self.capacity]
+        before = self.points[trails, (head - 2) % self.capacity]
+
+        # the last point is extended to the new position when the point before it is too close,
+        # or when the path goes on in the same direction
+        step, segment = positions - last, last - before
+        close = np.linalg.norm(positions - before, axis=1) < self.min_distance
+        norms = np.linalg.norm(step, axis=1) * np.linalg.norm(segment, axis=1)
+        straight = np.einsum('ij,ij->i', step, segment) >= self.cos_max_angle * norms
+        replace = (count >= 2) & (close | straight)
+
+        moved = trails[replace]
+        self.points[moved, (self.head[moved] - 1) % self.capacity] = positions[replace]
+        # moving a point the renderer already has, rather than one appended since the last flush
+        self.head_moved[moved[self.appended[moved] == 0]] = True
+
+        added = trails[~replace]
+        self.points[added, self.head[added]] = positions[~replace]
+        self.head[added] = (self.head[added] + 1) % self.capacity
+        self.dropped[added] += self.count[added] == self.capacity
+        self.count[added] = np.minimum(self.count[added] + 1, self.capacity)
+        self.appended[added] += 1
+
+    def trail(self, trail:int)-> np.ndarray:
+        '''
+        the (count, 3) points of a trail, oldest first.
+        '''
+        start = (self.head[trail] - self.count[trail]) % self.capacity
+        return np.roll(self.points[trail], -start, axis=0)[:self.count[trail]]
+
+    def flush(self)-> list[TrailChange]:
+        '''
+        the changes of every trail since the previous flush, which starts a new round of changes.
+        '''
+        changes = []
+        for trail in np.flatnonzero(self.appended | self.head_moved | (self.sent < 0)).tolist():
+            count, head = int(self.count[trail]), int(self.head[trail])
+            new, sent, dropped = min(int(self.appended[trail]), count), int(self.sent[trail]), int(self.dropped[trail])
+            if sent < 0 or new == count or dropped >= sent:
+                changes.append(TrailChange(trail, True, 0, None, self.trail(trail)))
+            else:
+                # only the points that changed are read, not the whole ring
+                last = self.points[trail, (head - new - 1) % self.capacity] if self.head_moved[trail] else None
+                changes.append(TrailChange(trail, False, dropped, last, self.points[trail, np.arange(head - new, head) % self.capacity]))
+            self.sent[trail] = count
+        self.appended[...] = 0
+        self.dropped[...] = 0
+        self.head_moved[...] = False
+        return changes
+
+    def __repr__(self) -> str:
+        return f'TrailBuffer({len(self.points)} trails, {int(self.count.sum())} points)'
@@ -1,39 +1,128 @@
 class vector:
+    __slots__ = ('x', 'y', 'z')
+
     def __init__(self, x=0, y=0, z=0):
         self.x = x
         self.y = y
         self.z = z
-    
+
     def __add__(self, other):
         return vector(self.x + other.x, self.y + other.y, self.z + other.z)
-    
+
     def __sub__(self, other):
         return vector(self.x - other.x, self.y - other.y, self.z - other.z)
-    
+
     def __mul__(self, scalar:float):
         return vector(self.x * scalar, self.y * scalar, self.z * scalar)
-    
+
+    # in-place versions, they update self instead of allocating a new vector
+    def __iadd__(self, other):
+        self.x += other.x
+        self.y += other.y
+        self.z += other.z
+        return self
+
+    def __isub__(self, other):
+        self.x -= other.x
+        self.y -= other.y
+        self.z -= other.z
+        return self
+
+    def __imul__(self, scalar:float):
+        self.x *= scalar
+        self.y *= scalar
+        self.z *= scalar
+        return self
+
+    def __itruediv__(self, scalar:float):
+        self.x /= scalar
+        self.y /= scalar
+        self.z /= scalar
+        return self
+
+    def axpy(self, a:float, other):
+        '''
+        fused self += a * other, in place.
+        '''
+        self.x += a * other.x
+        self.y += a * other.y
+        self.z += a * other.z
+        return self
+
+    def set(self, x=0, y=0, z=0):
+        self.x = x
+        self.y = y
+        self.z = z
+        return self
+
+    def copy_to(self, target):
+        '''
+        writes the components into an existing object with x, y, z attributes (e.g. a vpython vector)
+        instead of building a new one.
+        '''
+        target.x = self.x
+        target.y = self.y
+        target.z = self.z
+        return target
+
     def dot(self, other):
         return self.x * other.x + self.y * other.y + self.z * other.z
-    
+
     def cross(self, other):
         return vector(self.y * other.z - self.z * other.y,
                         self.z * other.x - self.x * other.z,
                         self.x * other.y - self.y * other.x)
-    
+
     def __truediv__(self, scalar:float):
         return vector(self.x / scalar, self.y / scalar, self.z / scalar)
-    
+
     def __eq__(self, other):
         return self.x == other.x and self.y == other.y and self.z == other.z
-    
+
     def __ne__(self, other):
         return not self.__eq__(other)
-    
+
     def length(self):
         return (self.x**2 + self.y**2 + self.z**2)**0.5
-    
+
     def __repr__(self):
         return f"vector({self.x}, {self.y}, {self.z})"
 
 
+class vector_view(vector):
+    '''
+    vector whose components live in shared float64 arrays, e.g. the state arrays of the BatchEngine.
+    reading or writing x, y, z goes straight to element `index` of the arrays, z_buffer=None means z is always 0.
+    '''
+    __slots__ = ('_x_buffer', '_y_buffer', '_z_buffer', '_index')
+
+    def __init__(self, x_buffer, y_buffer, z_buffer, index):
+        self._x_buffer = x_buffer
+        self._y_buffer = y_buffer
+        self._z_buffer = z_buffer
+        self._index = index
+
+    @property
+    def x(self):
+        return self._x_buffer[self._index]
+
+    @x.setter
+    def x(self, value):
+        self._x_buffer[self._index] = value
+
+    @property
+    def y(self):
+        return self._y_buffer[self._index]
+
+    @y.setter
+    def y(self, value):
+        self._y_buffer[self._index] = value
+
+    @property
+    def z(self):
+        return 0.0 if self._z_buffer is None else self._z_buffer[self._index]
+
+    @z.setter
+    def z(self, value):
+        if self._z_buffer is not None:
+            self._z_buffer[self._index] = value
@@ -0,0 +1,57 @@
+import os
+import numpy as np
+
+# rgb lookup tables of the colormaps shipped with the project, written by build_tables
+TABLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'colormaps.npz')
+SHIPPED = ['viridis', 'plasma', 'inferno', 'magma', 'cividis', 'coolwarm', 'terrain', 'tab10', 'tab20']
+
+_tables:dict[str, np.ndarray] = {}
+
+
+def lookup_table(name:str)-> np.ndarray:
+    '''
+    the (N, 3) rgb table of a colormap, as matplotlib samples it. the shipped tables are read from
+    colormaps.npz, any other matplotlib colormap is sampled on first use, which imports matplotlib.
+    '''
+    table = _tables.get(name)
+    if table is None:
+        if os.path.exists(TABLES_PATH):
+            with np.load(TABLES_PATH) as shipped:
+                _tables.update((key, shipped[key]) for key in shipped.files)
+        if name not in _tables:
+            _tables[name] = _sample(name)
+        table = _tables[name]
+    return table
+
+
+def _sample(name:str)-> np.ndarray:
+    import matplotlib
+    colormap = matplotlib.colormaps[name]
+    return colormap(np.arange(colormap.N))[:, :3].astype(np.float32)
+
+
+def apply(values:np.ndarray, name:str='viridis')-> np.ndarray:
+    '''
+    rgb colors of values normalized to [0, 1], with a single table lookup. returns an array of shape values.shape + (3,).
+    like a matplotlib colormap, values outside [0, 1] get the end colors and NaN is black.
+    '''
+    table = lookup_table(name)
+    n = len(table)
+    values = np.asarray(values, dtype=float)
+    index = np.nan_to_num(values * n, nan=0.0)
+    index = np.clip(index, 0, n - 1).astype(np.intp)
+    colors = table[index].astype(float)
+    colors[np.isnan(values)] = 0
+    return colors
+
+
+def build_tables(names:list[str]=SHIPPED, path:str=TABLES_PATH)-> None:
+    '''
+    samples the colormaps with matplotlib and writes them to path, run it to ship another colormap.
+    '''
+    np.savez_compressed(path, **{name: _sample(name) for name in names})
+
+
+if __name__ == '__main__':
+    build_tables()
+    print(f'{len(SHIPPED)} colormaps written to {TABLES_PATH}')
@@ -0,0 +1,211 @@
+import argparse
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import params
+from terrain import terrains
+from classes.Surface import Surface
+
+
+class Run:
+    def __init__(self, positions:np.ndarray, names:list[str], colors:list[list[float]|None]):
+        """
+        The positions of a race, live or recorded, in the form the exporter draws.
+
+        Parameters:
+        - positions: np.ndarray of shape (steps, N, M, 3), the x, y, z of the M trajectories of each of the N optimizers.
+        - names: repr of every optimizer.
+        - colors: rgb color of every optimizer, None picks one from the matplotlib color cycle.
+        """
+        self.positions = positions
+        self.names = names
+        self.colors = colors
+
+    @classmethod
+    def from_recording(cls, path:str)-> 'Run':
+        from classes.Recorder import Recording
+        recording = Recording(path)
+        # the recording stays memory-mapped, the steps of every chunk are read when its task is built
+        return cls(_StackedFields(recording.data), recording.names, recording.colors)
+
+    @classmethod
+    def from_headless(cls, surface:Surface)-> 'Run':
+        import headless
+        result = headless.run(surface)
+        return cls(result.trajectories[:, :, None, :], result.names, [None] * len(result.names))
+
+    def __len__(self)-> int:
+        return len(self.positions)
+
+
+class _StackedFields:
+    '''
+    (steps, N, M, 3) view of the x, y, z fields of a recording, stacking only the steps that are sliced.
+    '''
+    def __init__(self, data:np.ndarray):
+        self.data = data
+
+    def __len__(self)-> int:
+        return len(self.data)
+
+    def __getitem__(self, index)-> np.ndarray:
+        frame = self.data[index]
+        return np.stack([frame['x'], frame['y'], frame['z']], axis=-1)
+
+
+def _colors(colors:list[list[float]|None])-> list:
+    import matplotlib.pyplot as plt
+    cycle = plt.rcParams['axes.prop_cycle'].by_key()['color']
+    return [cycle[i % len(cycle)] if color is None else color for i, color in enumerate(colors)]
+
+
+def _render_chunk(X:np.ndarray, Y:np.ndarray, Z:np.ndarray, positions:np.ndarray, first:int, frames:list[int],
+                  names:list[str], colors:list, style:str, trail:int, size:float, dpi:int, directory:str, indexed:bool)-> int:
+    '''
+    renders the given frames to PNG files. positions starts at step `first`, early enough to draw the trails.
+    indexed: store 256 color frames ready for a GIF, the palette is computed once from the first frame of the chunk.
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    figure = plt.figure(figsize=(size, size), dpi=dpi)
+    if style == '3d':
+        axes = figure.add_subplot(projection='3d')
+        axes.plot_surface(X, Y, Z, cmap='viridis', alpha=0.6, linewidth=0, antialiased=False, rstride=1, cstride=1)
+        axes.set_zlim(np.nanmin(Z), np.nanmax(Z))
+    else:
+        axes = figure.add_subplot()
+        axes.contourf(X, Y, Z, levels=30, cmap='viridis')
+        axes.set_aspect('equal')
+    axes.set_xlim(X.min(), X.max())
+    axes.set_ylim(Y.min(), Y.max())
+    axes.set_axis_off()
+    figure.subplots_adjust(0, 0, 1, 1)
+
+    population = positions.shape[2] > 1
+    heads, trails = [], []
+    for name, color in zip(names, colors):
+        if style == '3d':
+            heads.append(axes.plot([], [], [], 'o', color=color, markersize=2 if population else 6, label=name)[0])
+            trails.append(axes.plot([], [], [], '-', color=color, linewidth=1.5)[0])
+        else:
+            heads.append(axes.plot([], [], 'o', color=color, markersize=2 if population else 6, label=name)[0])
+            trails.append(axes.plot([], [], '-', color=color, linewidth=1.5)[0])
+    axes.legend(loc='upper right', fontsize=8)
+
+    # the surface and the view never change: it is drawn once and every frame only draws the optimizers
+    # over a copy of it (blitting), instead of re-rendering the whole surface
+    from PIL import Image
+    canvas = figure.canvas
+    for artist in heads + trails:
+        artist.set_animated(True)
+    canvas.draw()
+    background = canvas.copy_from_bbox(figure.bbox)
+    palette = None
+    for frame in frames:
+        i = frame - first
+        canvas.restore_region(background)
+        for row, (head, line) in enumerate(zip(heads, trails)):
+            x, y, z = positions[i, row].T
+            # a population is drawn as its point cloud, a single optimizer with its recent path
+            path = positions[max(i - trail, 0):i + 1, row, 0] if not population and trail else np.empty((0, 3))
+            if style == '3d':
+                head.set_data_3d(x, y, z)
+                line.set_data_3d(path[:, 0], path[:, 1], path[:, 2])
+            else:
+                head.set_data(x, y)
+                line.set_data(path[:, 0], path[:, 1])
+            axes.draw_artist(line)
+            axes.draw_artist(head)
+        image = Image.frombuffer('RGBA', canvas.get_width_height(), canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1)
+        image = image.convert('RGB')
+        if indexed:
+            if palette is None:
+                palette = image.quantize(256)
+            image = image.quantize(palette=palette, dither=Image.Dither.NONE)
+        image.save(os.path.join(directory, f'frame_{frame:05d}.png'), compress_level=1)
+    plt.close(figure)
+    return len(frames)
+
+
+def export(surface:Surface, run:Run, output:str, *, style:str='3d', every:int=1, fps:int=30, trail:int=40,
+           size:float=6, dpi:int=100, processes:int|None=None)-> int:
+    """
+    Renders a race to a GIF or to a directory of PNG frames, without a display.
+
+    Frames are drawn with matplotlib's Agg backend and split into contiguous chunks over a process pool.
+    Every chunk renders the surface once and blits the optimizers over it frame by frame.
+
+    Parameters:
+    - surface: the Surface of the race, its meshgrid is drawn.
+    - run: the positions to draw, see Run.from_recording and Run.from_headless.
+    - output: a .gif file, anything else is a directory the numbered PNG frames are written to.
+    - style: '3d' for the surface in perspective, 'contour' for a top view.
+    - every: draw every n-th step.
+    - fps: frame rate of the GIF.
+    - trail: number of previous steps drawn behind each optimizer, populations are drawn without trails.
+    - size, dpi: figure size in inches and resolution.
+    - processes: number of worker processes, defaults to the number of cores, 1 renders in this process.
+
+    Returns:
+    - the number of frames rendered.
+    """
+    assert style in ('3d', 'contour'), f'unknown style {style}'
+    frames = list(range(0, len(run), every))
+    processes = processes or os.cpu_count() or 1
+    # a few chunks per worker balance the load, each chunk pays for building one figure
+    n_chunks = min(len(frames), processes * 4)
+    chunks = [chunk.tolist() for chunk in np.array_split(frames, n_chunks)]
+    colors = _colors(run.colors)
+
+    gif = output.lower().endswith('.gif')
+    directory = tempfile.mkdtemp() if gif else output
+    os.makedirs(directory, exist_ok=True)
+    try:
+        tasks = []
+        for chunk in chunks:
+            first = max(chunk[0] - trail, 0)
+            tasks.append((surface.X, surface.Y, surface.Z, np.asarray(run.positions[first:chunk[-1] + 1]), first, chunk,
+                          run.names, colors, style, trail, size, dpi, directory, gif))
+        if processes == 1 or len(tasks) == 1:
+            for task in tasks:
+                _render_chunk(*task)
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                list(pool.map(_render_chunk, *zip(*tasks)))
+
+        if gif:
+            from PIL import Image
+            images = [Image.open(os.path.join(directory, f'frame_{frame:05d}.png')) for frame in frames]
+            images[0].save(output, save_all=True, append_images=images[1:], duration=round(1000 / fps), loop=0)
+    finally:
+        if gif:
+            shutil.rmtree(directory, ignore_errors=True)
+    return len(frames)
+
+
+def main()->None:
+    parser = argparse.ArgumentParser(description='Render an optimizer race to a GIF or PNG frames without a display.')
+    parser.add_argument('output', help='.gif file, or a directory for PNG frames')
+    parser.add_argument('--recording', help='a file written by TrajectoryRecorder (params.RECORD_PATH), runs the race headless if omitted')
+    parser.add_argument('--terrain', default=params.TERRAIN, choices=list(terrains.TERRAINS), help='name of a terrain in terrain/terrains.py')
+    parser.add_argument('--style', choices=['3d', 'contour'], default='3d')
+    parser.add_argument('--every', type=int, default=1, help='draw every n-th step')
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--trail', type=int, default=40, help='steps drawn behind each optimizer')
+    parser.add_argument('--granularity', type=int, default=50, help='grid points per axis of the drawn surface')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    surface = Surface(terrains.get_terrain(args.terrain), params.X_MIN, params.X_MAX, params.Y_MIN, params.Y_MAX, granularity=args.granularity)
+    run = Run.from_recording(args.recording) if args.recording else Run.from_headless(surface)
+    count = export(surface, run, args.output, style=args.style, every=args.every, fps=args.fps, trail=args.trail,
+                   processes=args.processes)
+    print(f'{count} frames written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
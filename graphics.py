@@ -1,12 +1,12 @@
-import matplotlib.pyplot as plt
 import numpy as np
 import vpython as vp
 
 from classes.Surface import Surface
 from classes.Optimizer import Optimizer
-
-def normalize(x, x_min, x_range):
-    return (x - x_min) / x_range
+from classes.BatchEngine import BatchEngine
+from classes.Profiler import Profiler
+from classes.Trails import TrailBuffer
+from mesh import Mesh, adaptive_mesh, grid_mesh, overlay_mesh
 
 def num_to_place(place:int)->str:
     if place == 1:
@@ -20,22 +20,48 @@ def num_to_place(place:int)->str:
 
 
 class Graphics:
-    def __init__(self, surface:Surface):
+    def __init__(self, surface:Surface, trail_length:int=200, trail_min_distance:float=0.05, trail_max_angle:float=2.0,
+                 trail_radius:float=0.1):
+        '''
+        trail_length, trail_min_distance, trail_max_angle: capacity and decimation of the trails drawn behind
+        the optimizer spheres, see TrailBuffer. trail_radius: thickness of the trails, 0 draws thin lines.
+        '''
         self.surface:Surface = surface
         self.optimizers:list[Optimizer] = []
         self.spheres:list[vp.sphere] = []
+        self.positions:list[vp.vector] = []  # reused every frame to pass the positions to the spheres
+        self.trails = TrailBuffer(trail_length, trail_min_distance, trail_max_angle)
+        self.trail_radius = trail_radius
+        self.curves:list[vp.curve] = []
+        self.trail_positions = np.zeros((0, 3))  # reused every frame to pass the positions to the trails
+        self.populations:list[tuple[BatchEngine, int, vp.points]] = []
+        self.profile_label:vp.label|None = None
     
     def add_optimizer(self, optimizer:Optimizer)-> None:
         self.optimizers.append(optimizer)
         self.spheres.append(vp.sphere(pos=vp.vector(optimizer.position.x, optimizer.position.y, optimizer.position.z), 
                                       radius=0.5, 
-                                      color=optimizer.color, 
-                                      make_trail=True,
-                                      trail_color=optimizer.color,
-                                      pps=10,
-                                      retain=40)
+                                      color=optimizer.color)
                             )
+        self.positions.append(vp.vector(0, 0, 0))
+        # the trail is kept in the TrailBuffer and drawn as a curve updated once per frame
+        self.trails.add([optimizer.position.x, optimizer.position.y, optimizer.position.z])
+        self.curves.append(vp.curve(color=optimizer.color, radius=self.trail_radius))
+        self.trail_positions = np.zeros((len(self.curves), 3))
     
+    def add_population(self, engine:BatchEngine, radius:float=3)-> None:
+        '''
+        shows every optimizer of the engine as a single point cloud with one point per start point.
+        the optimizers are added to the labels but get no sphere.
+        '''
+        for row, optim in enumerate(engine.optimizers):
+            self.optimizers.append(optim)
+            cloud = vp.points(pos=self._population_positions(engine, row), color=optim.color, radius=radius)
+            self.populations.append((engine, row, cloud))
+
+    def _population_positions(self, engine:BatchEngine, row:int)-> list[list[float]]:
+        return np.stack([engine.x[row], engine.y[row], engine.z[row]], axis=-1).tolist()
+
     def show_labels(self)-> None:
         y_min, y_max = self.surface.y_min, self.surface.y_max
         x_min, x_max = self.surface.x_min, self.surface.x_max
@@ -45,46 +71,118 @@ class Graphics:
             vp.sphere(pos=vp.vector(i * gap + x_min, y_min - 5, 0), radius=0.5, color=optim.color)
             vp.text(text=f'{optim}', pos=vp.vector(i * gap + x_min + 1, y_min - 5, 0), height=0.5, color=optim.color)
 
-    def add_to_leaderboard(self, optimizer_name:str, place:int, color:vp.color)-> None:
+    def add_to_leaderboard(self, optimizer_name:str, place:int, color:vp.color, step:int|None=None, time:float|None=None)-> None:
+        '''
+        step, time: the step and simulated time at which the optimizer converged, shown after its name if given.
+        '''
         x = self.surface.x_max + 5
         y = self.surface.y_max - 5 - 2 * place
         vp.text(text=f'{num_to_place(place)}: ', pos=vp.vector(x, y, 0), height=0.7, color=vp.color.black)
         vp.text(text=optimizer_name, pos=vp.vector(x + 2, y, 0), height=0.7, color=color)
+        if time is not None:
+            detail = f'{time:.2f}s' if step is None else f'{time:.2f}s (step {step})'
+            vp.text(text=detail, pos=vp.vector(x + 3 + 0.5 * len(optimizer_name), y, 0), height=0.5, color=vp.color.black)
 
-    def plot_surface(self, colormap:str='viridis')-> None:
+    def plot_surface(self, colormap:str='viridis', compound:bool=True, tolerance:float|None=None)-> None:
         """
         Plots a 3D surface using vpython.
 
+        The mesh is built with vectorized numpy (see mesh.grid_mesh): one vertex per grid point shared by
+        the neighbouring cells, so only the vpython objects themselves are created in a loop.
+
         Parameters:
-        - x, y, z: np.ndarray of shape (n, n) representing the coordinates of the surface.
-                These arrays must be square matrices of the same shape.
         - colormap: A string specifying the colormap to be used (default is 'viridis').
+        - compound: merge all the triangles into a single vpython compound object, so the
+                    browser draws the surface as one object per frame.
+        - tolerance: if given, the surface is tessellated adaptively (see mesh.adaptive_mesh) with this
+                     height error, flat regions then get far fewer triangles than the valleys.
         """
-        x, y, z = self.surface.X, self.surface.Y, self.surface.Z
-        assert x.shape == y.shape == z.shape, 'x, y, z must have the same shape'
-        assert x.shape[0] == x.shape[1], 'x, y, z must be square matrices'
-
-        n = x.shape[0]
-        cmap = plt.get_cmap(colormap)
-        z_min, z_max = np.min(z), np.max(z)
-        z_range = z_max - z_min
-        
-        for i in range(n-1):
-            for j in range(n-1):
-                z_avg = (z[i,j] + z[i,j+1] + z[i+1,j+1] + z[i+1,j]) / 4
-                z_norm = normalize(z_avg, z_min, z_range)
-                color = cmap(z_norm)
-                color = vp.vector(color[0], color[1], color[2])
-
-                v1 = vp.vertex(pos=vp.vector(x[i,j], y[i,j], z[i,j]), color=color)
-                v2 = vp.vertex(pos=vp.vector(x[i,j+1], y[i,j+1], z[i,j+1]), color=color)
-                v3 = vp.vertex(pos=vp.vector(x[i+1,j+1], y[i+1,j+1], z[i+1,j+1]), color=color)
-                v4 = vp.vertex(pos=vp.vector(x[i+1,j], y[i+1,j], z[i+1,j]), color=color)
-
-                vp.quad(vs=[v1, v2, v3, v4])
+        if tolerance is None:
+            mesh = grid_mesh(self.surface, colormap)
+        else:
+            mesh = adaptive_mesh(self.surface, tolerance, colormap)
+        self.plot_mesh(mesh, compound=compound)
+
+    def plot_overlay(self, x:np.ndarray, y:np.ndarray, values:np.ndarray, colormap:str='viridis', compound:bool=True)-> None:
+        '''
+        drapes a map over the surface, e.g. BasinMaps.basin with colormap='tab10' or BasinMaps.steps.
+        x, y: the meshgrid the values were computed on, values: np.ndarray of the same shape, NaN is left uncolored.
+        '''
+        self.plot_mesh(overlay_mesh(self.surface, x, y, values, colormap), compound=compound)
+
+    def plot_mesh(self, mesh:Mesh, compound:bool=True)-> None:
+        vertices = [vp.vertex(pos=vp.vector(*pos), color=vp.vector(*color), normal=vp.vector(*normal))
+                    for pos, color, normal in zip(mesh.positions.tolist(), mesh.colors.tolist(), mesh.normals.tolist())]
+        triangles = [vp.triangle(vs=[vertices[a], vertices[b], vertices[c]]) for a, b, c in mesh.triangles.tolist()]
+        if compound and triangles:
+            vp.compound(triangles)
 
     def render_optimizers(self)-> None:
-        for optim, sphere in zip(self.optimizers, self.spheres):
-            sphere.pos = vp.vector(optim.position.x, optim.position.y, optim.position.z)
+        for i, (optim, sphere, position) in enumerate(zip(self.optimizers, self.spheres, self.positions)):
+            sphere.pos = optim.position.copy_to(position)
+            self.trail_positions[i] = position.x, position.y, position.z
+        self.render_trails()
+
+    def render_trails(self)-> None:
+        '''
+        adds the current sphere positions to the trails and sends the changes of every curve since the last
+        frame: one splice for the dropped points, one modify for a moved last point and one append.
+        '''
+        if not self.curves:
+            return
+        self.trails.push(self.trail_positions)
+        for change in self.trails.flush():
+            curve = self.curves[change.trail]
+            if change.reset:
+                curve.clear()
+            if change.dropped:
+                curve.splice(0, change.dropped)
+            if change.head is not None:
+                curve.modify(curve.npoints - 1, vp.vector(*change.head))
+            if len(change.new):
+                curve.append(change.new.tolist())
+
+    def style_trails(self, radius:float|None=None, visible:bool|None=None)-> None:
+        '''
+        restyles the trails drawn so far, their points stay in self.trails.
+        '''
+        for curve in self.curves:
+            if radius is not None:
+                curve.radius = radius
+            if visible is not None:
+                curve.visible = visible
+
+    def render_frame(self, engine:BatchEngine, x:np.ndarray, y:np.ndarray, z:np.ndarray)-> None:
+        '''
+        draws a snapshot of the engine positions, e.g. from a Simulation frame buffer, instead of reading
+        the optimizers, whose positions may be changing in the simulation thread.
+        x, y, z: (N, M) arrays in the row order of engine.optimizers.
+        '''
+        rows = {id(optim): row for row, optim in enumerate(engine.optimizers)}
+        for i, (optim, sphere, position) in enumerate(zip(self.optimizers, self.spheres, self.positions)):
+            row = rows[id(optim)]
+            position.x, position.y, position.z = x[row, 0], y[row, 0], z[row, 0]
+            sphere.pos = position
+            self.trail_positions[i] = position.x, position.y, position.z
+        self.render_trails()
+        for population, row, cloud in self.populations:
+            if population is engine:
+                cloud.clear()
+                cloud.append(np.stack([x[row], y[row], z[row]], axis=-1).tolist())
+
+    def render_profile(self, profiler:Profiler)-> None:
+        '''
+        shows the profiler report as an overlay in the top left corner of the canvas.
+        '''
+        if self.profile_label is None:
+            self.profile_label = vp.label(pixel_pos=True, pos=vp.vector(10, vp.scene.height - 10, 0), align='left',
+                                          box=False, opacity=0, height=11, color=vp.color.black, text='')
+        self.profile_label.text = profiler.report().replace('\n', '<br>')
+
+    def render_populations(self)-> None:
+        # one clear and one append carrying the whole position array per point cloud
+        for engine, row, cloud in self.populations:
+            cloud.clear()
+            cloud.append(self._population_positions(engine, row))
 
     
@@ -0,0 +1,121 @@
+import argparse
+import numpy as np
+import params
+from terrain import terrains
+from classes import Optimizer
+from classes.Surface import Surface
+from classes.BatchEngine import BatchEngine
+from classes.Convergence import Convergence
+
+
+class RunResult:
+    def __init__(self, names:list[str], trajectories:np.ndarray, leaderboard:list[tuple[int, str, int, float]], steps:int):
+        """
+        Outcome of a headless run.
+
+        Parameters:
+        - names: repr of every optimizer, in the row order of the trajectories.
+        - trajectories: np.ndarray of shape (steps + 1, N, 3) with the x, y, z position of each optimizer per step.
+        - leaderboard: (place, name, step, time) of every optimizer that converged, in finishing order.
+        - steps: the number of steps that were simulated.
+        """
+        self.names = names
+        self.trajectories = trajectories
+        self.leaderboard = leaderboard
+        self.steps = steps
+
+    def __repr__(self) -> str:
+        return f'RunResult(steps={self.steps}, finished={len(self.leaderboard)}/{len(self.names)})'
+
+
+def default_optimizers(surface:Surface, start_x:float, start_y:float)->list[Optimizer.Optimizer]:
+    '''
+    the optimizers raced by main.py, with the same hyperparameters but no colors.
+    '''
+    return [
+        Optimizer.GradientDescent(start_x, start_y, surface=surface, lr=params.LEARNING_RATE, color=None),
+        Optimizer.Nesterov(start_x, start_y, surface=surface, lr=params.LEARNING_RATE, color=None, gamma=0.95),
+        Optimizer.Momentum(start_x, start_y, surface=surface, lr=params.LEARNING_RATE, color=None, gamma=0.95),
+        Optimizer.AdaGrad(start_x, start_y, surface=surface, lr=params.ADAGRAD_LEARNING_RATE, color=None),
+        Optimizer.RMSProp(start_x, start_y, surface=surface, lr=params.RMSPROP_LEARNING_RATE, color=None, gamma=0.9),
+        Optimizer.Adam(start_x, start_y, surface=surface, lr=params.ADAM_LEARNING_RATE, color=None, beta_1=0.7, beta_2=0.999),
+        Optimizer.Newton(start_x, start_y, surface=surface, lr=params.NEWTON_LEARNING_RATE, color=None, damping=0.05, radius=params.NEWTON_RADIUS),
+        Optimizer.LBFGS(start_x, start_y, surface=surface, lr=params.LBFGS_LEARNING_RATE, color=None, memory=10),
+    ]
+
+
+def run(surface:Surface|None=None, optimizers:list[Optimizer.Optimizer]|None=None, *,
+        T:float=params.T, dt:float=params.dt, tolerance:float=1e-4, criteria:dict|None=None,
+        accumulator_dtype=params.ACCUMULATOR_PRECISION)->RunResult:
+    """
+    Runs the optimizer race without any rendering, as fast as the CPU allows.
+
+    Parameters:
+    - surface: the Surface to optimize on, defaults to params.CHOSEN_FUNCTION within the params bounds, in params.PRECISION.
+               The optimizers run in the precision of the surface.
+    - optimizers: the optimizers to race, defaults to the ones from main.py starting at params.START_X/START_Y.
+    - T, dt: simulated duration and time per step, as in params.py.
+    - tolerance: an optimizer whose step is shorter than this is considered to have converged.
+    - criteria: other keyword arguments of Convergence, e.g. gradient_tolerance, plateau_window or bounds,
+                the ones of params.py by default.
+    - accumulator_dtype: precision of the second-moment sums, see BatchEngine.
+
+    Returns:
+    - RunResult with the trajectories and the leaderboard. The run stops at T or once every optimizer converged.
+    """
+    if surface is None:
+        surface = Surface(params.CHOSEN_FUNCTION, params.X_MIN, params.X_MAX, params.Y_MIN, params.Y_MAX, dtype=params.PRECISION)
+    if optimizers is None:
+        optimizers = default_optimizers(surface, params.START_X, params.START_Y)
+
+    engine = BatchEngine(surface, optimizers, accumulator_dtype=accumulator_dtype)
+    names = [repr(optim) for optim in engine.optimizers]
+    max_steps = int(np.ceil(T / dt))
+    trajectories = np.empty((max_steps + 1, len(names), 3))
+    trajectories[0] = np.stack([engine.x[:, 0], engine.y[:, 0], engine.z[:, 0]], axis=-1)
+
+    criteria = params.CONVERGENCE if criteria is None else criteria
+    convergence = Convergence(engine, step_tolerance=tolerance, dt=dt, **criteria)
+    leaderboard = []
+    step = 0
+    while step < max_steps and engine.active.any():
+        del_v = engine.step()
+        step += 1
+        trajectories[step] = np.stack([engine.x[:, 0], engine.y[:, 0], engine.z[:, 0]], axis=-1)
+
+        # same convergence rule as main.py, the optimizers that converged in this step are frozen and placed together
+        finished = convergence.update(engine, del_v, step)
+        for row in convergence.ranking(engine, finished):
+            leaderboard.append((len(leaderboard) + 1, names[row], step, step * dt))
+
+    return RunResult(names, trajectories[:step + 1], leaderboard, step)
+
+
+def main()->None:
+    parser = argparse.ArgumentParser(description='Run the optimizer race without vpython.')
+    parser.add_argument('--terrain', default=params.TERRAIN, choices=list(terrains.TERRAINS), help='name of a terrain in terrain/terrains.py')
+    parser.add_argument('--bounds', type=float, nargs=4, default=[params.X_MIN, params.X_MAX, params.Y_MIN, params.Y_MAX],
+                        metavar=('X_MIN', 'X_MAX', 'Y_MIN', 'Y_MAX'))
+    parser.add_argument('--start', type=float, nargs=2, default=[params.START_X, params.START_Y], metavar=('X', 'Y'))
+    parser.add_argument('--T', type=float, default=params.T, help='simulated duration')
+    parser.add_argument('--dt', type=float, default=params.dt, help='simulated time per step')
+    parser.add_argument('--tolerance', type=float, default=1e-4, help='step length under which an optimizer has converged')
+    parser.add_argument('--precision', default=params.PRECISION, choices=['float32', 'float64'], help='precision of the surface and the optimizers')
+    parser.add_argument('--save', help='write the trajectories and optimizer names to this .npz file')
+    args = parser.parse_args()
+
+    surface = Surface(terrains.get_terrain(args.terrain), *args.bounds, dtype=args.precision)
+    result = run(surface, default_optimizers(surface, *args.start), T=args.T, dt=args.dt, tolerance=args.tolerance)
+
+    print(f'{result.steps} steps simulated')
+    for place, name, step, t in result.leaderboard:
+        print(f'{place}. {name} converged at step {step} (t = {t:.2f})')
+    for name in result.names:
+        if name not in [entry[1] for entry in result.leaderboard]:
+            print(f'-  {name} did not converge')
+    if args.save:
+        np.savez(args.save, trajectories=result.trajectories, names=np.array(result.names))
+
+
+if __name__ == '__main__':
+    main()
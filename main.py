@@ -1,5 +1,7 @@
+import atexit
+import os
+import queue
 import time
-import matplotlib.pyplot as plt
 import numpy as np
 import vpython as vp
 import params
@@ -7,6 +9,13 @@ import graphics
 from classes.vector import vector
 from classes import Optimizer
 from classes import Surface
+from classes import BatchEngine
+from classes.Simulation import Simulation
+from classes.Convergence import Convergence
+from classes.Recorder import TrajectoryRecorder, Recording, Replay
+from classes.SurfaceCache import SurfaceCache
+from classes.Profiler import Profiler
+from classes.DataSurface import DataSurface, write_dataset
 
 
 
@@ -18,18 +27,65 @@ vp.scene.caption = f'''
     scroll to zoom
     '''
 
-is_paused = True
+simulation = None
 def toggle_pause():
     """Toggles the pause state."""
-    global is_paused
-    if is_paused:
-        is_paused = False
+    if simulation is None:
+        return
+    if simulation.paused:
+        simulation.resume()
         pause_button.text = "Pause"
     else:
-        is_paused = True
+        simulation.pause()
         pause_button.text = "Play"
 
 
+def run_replay(rendering:graphics.Graphics)-> None:
+    """Plays the recording of params.REPLAY_PATH, with sliders to seek and to change the speed."""
+    global simulation
+    replay = Replay(Recording(params.REPLAY_PATH), params.REPLAY_SPEED, color=lambda rgb: vp.vector(*rgb))
+    # the replay pauses and resumes like a simulation, so the Play button drives it
+    simulation = replay
+    if replay.x.shape[1] > 1:
+        rendering.add_population(replay)
+    else:
+        for track in replay.optimizers:
+            rendering.add_optimizer(track)
+    rendering.show_labels()
+
+    def render()-> None:
+        rendering.render_optimizers()
+        rendering.render_populations()
+        step_text.text = f' step {replay.step} / {replay.recording.steps - 1}'
+
+    def seek(slider:vp.slider)-> None:
+        replay.seek(slider.value)
+        # the trails restart from the new position instead of jumping to it
+        rendering.trails.clear()
+        render()
+
+    def set_speed(slider:vp.slider)-> None:
+        replay.speed = slider.value
+        speed_text.text = f' speed {slider.value:g}x'
+
+    vp.scene.append_to_caption('\n')
+    step_slider = vp.slider(min=0, max=replay.recording.steps - 1, step=1, value=0, length=400, bind=seek)
+    step_text = vp.wtext(text='')
+    vp.scene.append_to_caption('\n')
+    vp.slider(min=-8, max=8, step=0.25, value=replay.speed, length=400, bind=set_speed)
+    speed_text = vp.wtext(text=f' speed {replay.speed:g}x')
+    render()
+
+    while True:
+        vp.rate(30)
+        if replay.paused or replay.finished:
+            # waits for the Play button, the sliders still seek while paused
+            replay.running.wait(0.1)
+            continue
+        replay.advance()
+        step_slider.value = replay.step
+        render()
+
 
 if __name__ == '__main__':
     vp.canvas(background=vp.vector(0.9, 0.9, 0.9), width=800, height=800)
@@ -37,9 +93,25 @@ if __name__ == '__main__':
     global pause_button
     pause_button = vp.button(text="Play", bind=lambda: toggle_pause())
     
-    surface = Surface.Surface(params.CHOSEN_FUNCTION, params.X_MIN, params.X_MAX, params.Y_MIN, params.Y_MAX)
-    rendering = graphics.Graphics(surface)
+    cache = SurfaceCache(params.CACHE_DIR) if params.CACHE_DIR is not None else None
+    if params.DATASET_PATH is not None:
+        if not os.path.exists(params.DATASET_PATH):
+            write_dataset(params.DATASET_PATH, params.DATASET_SIZE)
+        surface = DataSurface(params.DATASET_PATH, params.X_MIN, params.X_MAX, params.Y_MIN, params.Y_MAX, params.BATCH_SIZE,
+                              cache=cache, dtype=params.PRECISION)
+    else:
+        surface = Surface.Surface(params.CHOSEN_FUNCTION, params.X_MIN, params.X_MAX, params.Y_MIN, params.Y_MAX, cache=cache,
+                                  dtype=params.PRECISION)
+    rendering = graphics.Graphics(surface, params.TRAIL_LENGTH, params.TRAIL_MIN_DISTANCE, params.TRAIL_MAX_ANGLE)
     rendering.plot_surface()
+
+    if params.REPLAY_PATH is not None:
+        run_replay(rendering)
+
+    profiler = Profiler(params.PROFILE, params.PROFILE_WINDOW)
+    if params.PROFILE:
+        profiler.instrument(surface)
+        atexit.register(profiler.dump, params.PROFILE_DUMP)
     
     start_x = params.START_X
     start_y = params.START_Y
@@ -50,47 +122,87 @@ if __name__ == '__main__':
     adagrad = Optimizer.AdaGrad(start_x, start_y, surface=surface, lr=params.ADAGRAD_LEARNING_RATE, color=vp.color.green)
     rmsprop = Optimizer.RMSProp(start_x, start_y, surface=surface, lr=params.RMSPROP_LEARNING_RATE, color=vp.color.yellow, gamma=0.9)
     adam = Optimizer.Adam(start_x, start_y, surface=surface, lr=params.ADAM_LEARNING_RATE, color=vp.color.purple, beta_1=0.7, beta_2=0.999)
+    newton = Optimizer.Newton(start_x, start_y, surface=surface, lr=params.NEWTON_LEARNING_RATE, color=vp.color.cyan, damping=0.05, radius=params.NEWTON_RADIUS)
+    lbfgs = Optimizer.LBFGS(start_x, start_y, surface=surface, lr=params.LBFGS_LEARNING_RATE, color=vp.color.magenta, memory=10)
     
-    rendering.add_optimizer(graddesc)
-    rendering.add_optimizer(nesterov)
-    rendering.add_optimizer(momentum)
-    rendering.add_optimizer(adagrad)
-    rendering.add_optimizer(rmsprop)
-    rendering.add_optimizer(adam)
+    optimizers = [graddesc, nesterov, momentum, adagrad, rmsprop, adam, newton, lbfgs]
+
+    if params.POPULATION:
+        # every optimizer runs from POPULATION start points, each drawn as one point cloud
+        starts_x, starts_y = BatchEngine.sample_starts(surface, params.POPULATION, params.POPULATION_SAMPLING)
+        engine = BatchEngine.BatchEngine(surface, optimizers, starts_x, starts_y, profiler=profiler,
+                                         accumulator_dtype=params.ACCUMULATOR_PRECISION)
+        rendering.add_population(engine)
+    else:
+        for optim in optimizers:
+            rendering.add_optimizer(optim)
+        # all the optimizers are stepped together, rendering.optimizers become views into the engine
+        engine = BatchEngine.BatchEngine(surface, rendering.optimizers, profiler=profiler, accumulator_dtype=params.ACCUMULATOR_PRECISION)
 
     rendering.show_labels()
-    
-    t = 0
+
+    # optimizers that converged, as (row, step), passed from the simulation thread to the leaderboard
+    converged_queue = queue.Queue()
+    # an optimizer making sufficiently small steps (or meeting another criterion of params.CONVERGENCE) is
+    # considered to have converged, it is frozen and no longer evaluated
+    convergence = Convergence(engine, step_tolerance=1e-4, dt=params.dt, **params.CONVERGENCE)
+
+    def on_step(engine:BatchEngine.BatchEngine, del_v:np.ndarray, step:int)-> None:
+        # runs in the simulation thread after every step, so no convergence and no recorded step is missed between frames
+        if recorder is not None:
+            recorder.record(engine)
+        finished = convergence.update(engine, del_v, step)
+        # there is no leaderboard for populations
+        if not params.POPULATION:
+            for row in convergence.ranking(engine, finished):
+                converged_queue.put((row, step))
+
+    recorder = None
+    if params.RECORD_PATH is not None:
+        recorder = TrajectoryRecorder(params.RECORD_PATH, engine)
+        atexit.register(recorder.close, params.dt)
+
+    simulation = Simulation(engine, params.SIM_STEPS_PER_FRAME, params.FRAME_BUFFER,
+                            max_steps=int(np.ceil(params.T / params.dt)), on_step=on_step)
+    simulation.start(paused=True)
+    # atexit runs the last registered first, so the simulation thread is stopped before the recorder is closed
+    atexit.register(simulation.stop)
+
     winner_optimizers = 0   # for leaderboard positions
 
     while True:
-        vp.rate(30)
-        while is_paused:
+        profiler.start_frame()
+        with profiler.phase('rate'):
             vp.rate(30)
+        if simulation.paused:
+            # waits for the Play button, paused frames are not profiled
+            simulation.running.wait()
+            continue
 
-        del_v = []
-        t += params.dt
-        
-        for optim in rendering.optimizers:
-            del_v.append(optim.step())
-
-        rendering.render_optimizers()
+        with profiler.phase('render'):
+            frame = simulation.buffer.newest()
+            if frame is not None:
+                # the spheres' trails are extended when their positions are set, so this includes the trail updates
+                rendering.render_frame(engine, *frame[1:])
 
         # code for the leaderboard
-        if any([v < 1e-4 for v in del_v]):
-            # if an optimizer makes sufficiently small steps, it is considered to have converged
-            # get information of the converged optimizer
-            idx = np.argmin(del_v)
-            optim_str = repr(rendering.optimizers[idx])
-            optim_color = rendering.optimizers[idx].color
-            # add the converged optimizer to the leaderboard
-            winner_optimizers += 1
-            rendering.add_to_leaderboard(optim_str, place=winner_optimizers, color=optim_color)
-            rendering.optimizers.pop(idx)
-            
-
-        # stopping the simulation
-        if t > params.T:
+        with profiler.phase('leaderboard'):
+            while not converged_queue.empty():
+                # get information of the converged optimizer
+                idx, step = converged_queue.get()
+                optim_str = repr(engine.optimizers[idx])
+                optim_color = engine.optimizers[idx].color
+                # add the converged optimizer to the leaderboard
+                winner_optimizers += 1
+                rendering.add_to_leaderboard(optim_str, place=winner_optimizers, color=optim_color, step=step, time=convergence.time[idx, 0])
+
+        profiler.end_frame()
+        # the overlay is refreshed twice a second, every refresh is sent to the browser
+        if params.PROFILE and profiler.frames % 15 == 0:
+            rendering.render_profile(profiler)
+
+        # stopping the simulation once the last frame was drawn
+        if frame is None and simulation.finished.is_set():
             vp.text(text="Time's up!", pos=vp.vector(0, 0, 0), height=2, color=vp.color.black)
             time.sleep(5)
             break
\ No newline at end of file
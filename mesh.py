@@ -0,0 +1,177 @@
+import numpy as np
+import colormaps
+
+from classes.Surface import Surface
+
+def normalize(x, x_min, x_range):
+    return (x - x_min) / x_range
+
+
+class Mesh:
+    def __init__(self, positions:np.ndarray, colors:np.ndarray, normals:np.ndarray, triangles:np.ndarray):
+        """
+        Triangle mesh with shared vertices, ready to be turned into vpython objects.
+
+        Parameters:
+        - positions: np.ndarray of shape (K, 3), the x, y, z of every vertex.
+        - colors: np.ndarray of shape (K, 3), the rgb color of every vertex.
+        - normals: np.ndarray of shape (K, 3), the unit normal of every vertex.
+        - triangles: np.ndarray of shape (T, 3), the vertex indices of every triangle.
+        """
+        self.positions = positions
+        self.colors = colors
+        self.normals = normals
+        self.triangles = triangles
+
+    def __repr__(self) -> str:
+        return f'Mesh({len(self.positions)} vertices, {len(self.triangles)} triangles)'
+
+
+def colorize(z:np.ndarray, colormap:str='viridis')-> np.ndarray:
+    '''
+    maps heights to rgb colors of the colormap with a single vectorized lookup.
+    returns an array of shape z.shape + (3,).
+    '''
+    z_min, z_max = np.nanmin(z), np.nanmax(z)
+    z_range = (z_max - z_min) or 1
+    return colormaps.apply(normalize(z, z_min, z_range), colormap)
+
+
+def grid_normals(x:np.ndarray, y:np.ndarray, z:np.ndarray)-> np.ndarray:
+    '''
+    unit normals of a height field sampled on a meshgrid, from the central-difference slopes of z.
+    '''
+    dz_dy, dz_dx = np.gradient(z, y[:, 0], x[0, :])
+    normals = np.stack([-dz_dx, -dz_dy, np.ones_like(z)], axis=-1)
+    return normals / np.linalg.norm(normals, axis=-1, keepdims=True)
+
+
+def _cached(surface:Surface, parts:tuple, build, names:tuple[str, ...])-> dict[str, np.ndarray]:
+    '''
+    arrays returned by build(), stored in the surface cache under the surface key and parts if the surface has one.
+    names are the keys build() returns, an entry lacking one of them is rebuilt.
+    '''
+    if surface.cache is None:
+        return build()
+    return surface.cache.load_or_build(surface.cache.key(surface.function, surface.cache_key, *parts), build, names)
+
+
+def grid_mesh(surface:Surface, colormap:str='viridis')-> Mesh:
+    """
+    Builds the mesh of the surface meshgrid, every grid point being one vertex shared by the adjacent cells.
+
+    Parameters:
+    - surface: the Surface whose X, Y, Z meshgrid is triangulated, two triangles per cell.
+    - colormap: A string specifying the colormap to be used (default is 'viridis').
+    """
+    x, y, z = surface.X, surface.Y, surface.Z
+    assert x.shape == y.shape == z.shape, 'x, y, z must have the same shape'
+    n_rows, n_cols = x.shape
+
+    positions = np.stack([x, y, z], axis=-1).reshape(-1, 3)
+    shading = _cached(surface, ('grid_mesh', colormap), lambda: {'colors': colorize(z, colormap).reshape(-1, 3),
+                                                                  'normals': grid_normals(x, y, z).reshape(-1, 3)},
+                      ('colors', 'normals'))
+
+    return Mesh(positions, shading['colors'], shading['normals'], grid_triangles(n_rows, n_cols))
+
+
+def grid_triangles(n_rows:int, n_cols:int)-> np.ndarray:
+    '''
+    vertex indices of the two triangles of every cell of a (n_rows, n_cols) grid flattened row by row.
+    '''
+    # index of the lower-left corner of every cell, the other corners follow by offset
+    corner = (np.arange(n_rows - 1)[:, None] * n_cols + np.arange(n_cols - 1)[None, :]).ravel()
+    v1, v2, v3, v4 = corner, corner + 1, corner + n_cols + 1, corner + n_cols
+    return np.concatenate([np.stack([v1, v2, v3], axis=-1), np.stack([v1, v3, v4], axis=-1)])
+
+
+def overlay_mesh(surface:Surface, x:np.ndarray, y:np.ndarray, values:np.ndarray, colormap:str='viridis', offset:float=0.05)-> Mesh:
+    '''
+    mesh draped over the surface on the meshgrid (x, y) and colored by values, e.g. a map computed per start point.
+    offset lifts it above the surface so it is not hidden by it. cells with a NaN corner have no triangles,
+    so the surface shows through them.
+    '''
+    z = np.asarray(surface.get_z(x, y), dtype=float) + offset
+    positions = np.stack([x, y, z], axis=-1).reshape(-1, 3)
+    triangles = grid_triangles(*x.shape)
+    triangles = triangles[~np.isnan(values).reshape(-1)[triangles].any(axis=1)]
+    return Mesh(positions, colorize(values, colormap).reshape(-1, 3), grid_normals(x, y, z).reshape(-1, 3), triangles)
+
+
+def _split_cells(z:np.ndarray, tolerance:float)-> list[tuple[int, int, int, int]]:
+    '''
+    quadtree subdivision of the grid index space. returns the (i0, j0, i1, j1) corners of the leaf cells,
+    a cell being split while the grid samples it covers deviate from its bilinear patch by more than tolerance.
+    '''
+    leaves = []
+    stack = [(0, 0, z.shape[0] - 1, z.shape[1] - 1)]
+    while stack:
+        i0, j0, i1, j1 = stack.pop()
+        block = z[i0:i1 + 1, j0:j1 + 1]
+        ty = np.linspace(0, 1, i1 - i0 + 1)[:, None]
+        tx = np.linspace(0, 1, j1 - j0 + 1)[None, :]
+        patch = ((block[0, 0] * (1 - tx) + block[0, -1] * tx) * (1 - ty) +
+                 (block[-1, 0] * (1 - tx) + block[-1, -1] * tx) * ty)
+        if (i1 - i0 <= 1 and j1 - j0 <= 1) or np.abs(block - patch).max() <= tolerance:
+            leaves.append((i0, j0, i1, j1))
+            continue
+        i_splits = (i0, (i0 + i1) // 2, i1) if i1 - i0 > 1 else (i0, i1)
+        j_splits = (j0, (j0 + j1) // 2, j1) if j1 - j0 > 1 else (j0, j1)
+        for a, b in zip(i_splits[:-1], i_splits[1:]):
+            for c, d in zip(j_splits[:-1], j_splits[1:]):
+                stack.append((a, c, b, d))
+    return leaves
+
+
+def adaptive_mesh(surface:Surface, tolerance:float, colormap:str='viridis')-> Mesh:
+    """
+    Builds a mesh that is only as fine as the surface needs: cells of the meshgrid are merged
+    while the surface inside them stays within `tolerance` of a flat (bilinear) patch, and are
+    refined down to single grid cells where the curvature or height variation is high.
+
+    Every leaf cell is triangulated as a fan that includes the vertices its finer neighbours put on
+    its edges, so the mesh has no cracks between cells of different sizes.
+
+    Parameters:
+    - surface: the Surface whose X, Y, Z meshgrid is tessellated, its granularity sets the finest level.
+    - tolerance: the largest height error allowed between the mesh and the sampled surface.
+    - colormap: A string specifying the colormap to be used (default is 'viridis').
+    """
+    arrays = _cached(surface, ('adaptive_mesh', tolerance, colormap), lambda: _adaptive_arrays(surface, tolerance, colormap),
+                     ('positions', 'colors', 'normals', 'triangles'))
+    return Mesh(arrays['positions'], arrays['colors'], arrays['normals'], arrays['triangles'])
+
+
+def _adaptive_arrays(surface:Surface, tolerance:float, colormap:str)-> dict[str, np.ndarray]:
+    x, y, z = surface.X, surface.Y, surface.Z
+    assert x.shape == y.shape == z.shape, 'x, y, z must have the same shape'
+    n_cols = x.shape[1]
+    leaves = _split_cells(z, tolerance)
+
+    used = np.zeros(z.shape, dtype=bool)
+    for i0, j0, i1, j1 in leaves:
+        used[[i0, i0, i1, i1], [j0, j1, j1, j0]] = True
+
+    triangles = []
+    for i0, j0, i1, j1 in leaves:
+        # boundary of the cell counter-clockwise from (i0, j0), keeping only the vertices in use
+        edge_i = np.concatenate([np.full(j1 - j0, i0), np.arange(i0, i1), np.full(j1 - j0, i1), np.arange(i1, i0, -1)])
+        edge_j = np.concatenate([np.arange(j0, j1), np.full(i1 - i0, j1), np.arange(j1, j0, -1), np.full(i1 - i0, j0)])
+        keep = used[edge_i, edge_j]
+        edge_i, edge_j = edge_i[keep], edge_j[keep]
+        # fan from the first corner, skipping the degenerate triangles along the two edges through it
+        a_i, a_j, b_i, b_j = edge_i[1:-1], edge_j[1:-1], edge_i[2:], edge_j[2:]
+        valid = ~(((a_i == i0) & (b_i == i0)) | ((a_j == j0) & (b_j == j0)))
+        fan = np.stack([np.full(valid.sum(), i0 * n_cols + j0), a_i[valid] * n_cols + a_j[valid], b_i[valid] * n_cols + b_j[valid]], axis=-1)
+        triangles.append(fan)
+
+    # keep only the grid points used as vertices and renumber the triangles
+    vertex_ids = np.flatnonzero(used)
+    remap = np.full(z.size, -1)
+    remap[vertex_ids] = np.arange(len(vertex_ids))
+
+    return {'positions': np.stack([x, y, z], axis=-1).reshape(-1, 3)[vertex_ids],
+            'colors': colorize(z, colormap).reshape(-1, 3)[vertex_ids],
+            'normals': grid_normals(x, y, z).reshape(-1, 3)[vertex_ids],
+            'triangles': remap[np.concatenate(triangles)]}
@@ -1,5 +1,4 @@
-from terrain.terrains import *
-import numpy as np
+from terrain.terrains import get_terrain
 
 X_MIN = -15
 X_MAX = 15
@@ -12,12 +11,65 @@ START_Y = -13
 assert X_MIN < START_X < X_MAX, f'starting x value {START_X} is not within the bounds of the function {X_MIN} to {X_MAX}'
 assert Y_MIN < START_Y < Y_MAX, f'starting y value {START_Y} is not within the bounds of the function {Y_MIN} to {Y_MAX}'
 
-CHOSEN_FUNCTION = gaussian_terrain
+# name of the terrain in terrain/terrains.py TERRAINS
+TERRAIN = 'gaussian_terrain'
+CHOSEN_FUNCTION = get_terrain(TERRAIN)
 
 LEARNING_RATE = 0.1
 ADAGRAD_LEARNING_RATE = 1
 RMSPROP_LEARNING_RATE = 0.5
 ADAM_LEARNING_RATE = 0.5
+# step size of Newton, 1 being the full Newton step, and the first step the L-BFGS line search tries
+NEWTON_LEARNING_RATE = 1
+# longest step of Newton, its trust region
+NEWTON_RADIUS = 2
+LBFGS_LEARNING_RATE = 1
 
 dt = 0.03
 T = 20
+
+# precision of the surface, the terrain evaluations and the optimizer state: 'float32' halves the memory of large
+# populations and precomputed fields. ACCUMULATOR_PRECISION is the one of the AdaGrad/RMSProp/Adam second-moment
+# sums, e.g. 'float64' to accumulate them safely in float32 runs, None for PRECISION
+PRECISION = 'float64'
+ACCUMULATOR_PRECISION = None
+
+# population mode: number of particles per optimizer, spread over the bounds ('grid' or 'random'), 0 races single optimizers
+POPULATION = 0
+POPULATION_SAMPLING = 'grid'
+
+# .npy dataset of (feature, target) rows to fit a line to instead of CHOSEN_FUNCTION, with minibatch gradients
+# (see classes/DataSurface.py). It is generated with DATASET_SIZE rows if the file does not exist, None disables it
+DATASET_PATH = None
+DATASET_SIZE = 1_000_000
+BATCH_SIZE = 32
+
+# directory of the on-disk surface cache used by main.py, None disables it
+CACHE_DIR = '.surface_cache'
+
+# the optimizers are stepped in a background thread: steps simulated per rendered frame,
+# and number of frames the simulation may run ahead of the renderer
+SIM_STEPS_PER_FRAME = 1
+FRAME_BUFFER = 4
+
+# stopping criteria besides a step shorter than 1e-4, passed to classes/Convergence.py: a gradient norm under
+# gradient_tolerance, a loss change under plateau_tolerance over plateau_window steps, leaving the bounds
+# (x_min, x_max, y_min, y_max), 'surface' for the ones of the surface. None disables a criterion
+CONVERGENCE = {'gradient_tolerance': None, 'plateau_window': None, 'plateau_tolerance': 1e-6, 'bounds': 'surface'}
+
+# trails behind the optimizers: maximum number of points, and the decimation dropping points closer than
+# TRAIL_MIN_DISTANCE to the previous one or turning by less than TRAIL_MAX_ANGLE degrees
+TRAIL_LENGTH = 200
+TRAIL_MIN_DISTANCE = 0.05
+TRAIL_MAX_ANGLE = 2.0
+
+# file the trajectories of every step are recorded to (see classes/Recorder.py), None disables recording
+RECORD_PATH = None
+# file of a recording to play back instead of running the optimizers, and recorded steps per rendered frame
+REPLAY_PATH = None
+REPLAY_SPEED = 1
+
+# per-frame profiling of the main loop, shown on the canvas and written to PROFILE_DUMP at exit
+PROFILE = False
+PROFILE_WINDOW = 300
+PROFILE_DUMP = 'profile.json'
@@ -0,0 +1,191 @@
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import params
+from terrain import terrains
+from classes import Optimizer
+from classes.Surface import Surface
+from classes.SurfaceCache import terrain_fingerprint
+from classes.BatchEngine import BatchEngine
+
+COLUMNS = ['run_id', 'optimizer', 'hyperparameters', 'final_loss', 'steps', 'converged', 'diverged', 'final_x', 'final_y']
+
+
+def grid_space(**values)-> list[dict]:
+    '''
+    every combination of the given values, e.g. grid_space(lr=[0.1, 0.5], gamma=[0.9, 0.95]) gives 4 settings.
+    '''
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+
+
+def random_space(n:int, seed:int=0, **ranges)-> list[dict]:
+    '''
+    n random settings. every range is either (low, high) for a uniform sample, ('log', low, high)
+    for a log-uniform sample, or a list of values to choose from.
+    '''
+    rng = np.random.default_rng(seed)
+    settings = [{} for _ in range(n)]
+    for name, spec in ranges.items():
+        if isinstance(spec, list):
+            samples = [spec[i] for i in rng.integers(len(spec), size=n)]
+        elif spec[0] == 'log':
+            samples = np.exp(rng.uniform(np.log(spec[1]), np.log(spec[2]), n)).tolist()
+        else:
+            samples = rng.uniform(spec[0], spec[1], n).tolist()
+        for setting, sample in zip(settings, samples):
+            setting[name] = sample
+    return settings
+
+
+def _run_id(surface:Surface, start:tuple[float, float], cls:type, hyperparameters:dict, max_steps:int, tolerance:float)-> str:
+    digest = hashlib.sha1(terrain_fingerprint(surface.function).encode())
+    digest.update(repr((surface.x_min, surface.x_max, surface.y_min, surface.y_max, start, cls.__name__,
+                        sorted(hyperparameters.items()), max_steps, tolerance)).encode())
+    return digest.hexdigest()[:16]
+
+
+def _run_shard(surface:Surface, start:tuple[float, float], cls:type, runs:list[tuple[str, dict]],
+               max_steps:int, tolerance:float)-> list[dict]:
+    '''
+    runs every setting of one optimizer class as a row of a single BatchEngine.
+    '''
+    optimizers = [cls(*start, surface=surface, color=None, **hyperparameters) for _, hyperparameters in runs]
+    engine = BatchEngine(surface, optimizers)
+    steps = np.full(len(runs), max_steps)
+    # a run converging at the last step has as many steps as one that did not, so convergence has its own mask
+    has_converged = np.zeros(len(runs), dtype=bool)
+    span = max(surface.x_max - surface.x_min, surface.y_max - surface.y_min)
+    for step in range(1, max_steps + 1):
+        del_v = engine.step()[:, 0]
+        converged = engine.active[:, 0] & (del_v < tolerance)
+        steps[converged] = step
+        has_converged |= converged
+        engine.active[:, 0] &= ~converged
+        # runs that blew up or wandered far outside the bounds are stopped as well
+        x, y = engine.x[:, 0], engine.y[:, 0]
+        diverged = ~np.isfinite(engine.z[:, 0]) | (np.abs(x - (surface.x_min + surface.x_max) / 2) > span) | \
+                   (np.abs(y - (surface.y_min + surface.y_max) / 2) > span)
+        engine.active[:, 0] &= ~diverged
+        if not engine.active.any():
+            break
+
+    x, y, z = engine.x[:, 0], engine.y[:, 0], engine.z[:, 0]
+    diverged = ~np.isfinite(z) | (np.abs(x - (surface.x_min + surface.x_max) / 2) > span) | \
+               (np.abs(y - (surface.y_min + surface.y_max) / 2) > span)
+    # rows of the engine are in the order of the optimizers since they all share one class
+    return [{'run_id': run_id, 'optimizer': cls.__name__, 'hyperparameters': json.dumps(hyperparameters, sort_keys=True),
+             'final_loss': float(z[i]), 'steps': int(steps[i]), 'converged': bool(has_converged[i] and not diverged[i]),
+             'diverged': bool(diverged[i]), 'final_x': float(x[i]), 'final_y': float(y[i])}
+            for i, (run_id, hyperparameters) in enumerate(runs)]
+
+
+def completed_runs(results_path:str)-> set[str]:
+    if not os.path.exists(results_path):
+        return set()
+    with open(results_path, newline='') as file:
+        return {row['run_id'] for row in csv.DictReader(file)}
+
+
+def sweep(surface:Surface, space:dict[type, list[dict]], results_path:str, *, start:tuple[float, float]|None=None,
+          max_steps:int=1000, tolerance:float=1e-4, shard_size:int=64, processes:int|None=None)-> int:
+    """
+    Runs every hyperparameter setting of the search space and appends one row per run to a CSV results table.
+
+    The settings of each optimizer class are grouped into shards of shard_size, every shard being one
+    vectorized BatchEngine run, and the shards are spread over a process pool. Rows are written and flushed
+    as soon as their shard finishes, and runs already present in the table are skipped, so an interrupted
+    sweep continues where it stopped when called again with the same arguments.
+
+    Parameters:
+    - surface: the Surface to optimize on.
+    - space: optimizer class -> list of hyperparameter dicts, e.g. {Optimizer.Adam: grid_space(lr=[0.1, 0.5], ...)}.
+    - results_path: the CSV file, with the columns of COLUMNS.
+    - start: start point of every run, defaults to params.START_X, params.START_Y.
+    - max_steps: step budget of every run.
+    - tolerance: a run whose step is shorter than this has converged.
+    - shard_size: number of runs stepped together by one worker.
+    - processes: number of worker processes, defaults to the number of cores, 1 runs in this process.
+
+    Returns:
+    - the number of runs done by this call.
+    """
+    start = start or (params.START_X, params.START_Y)
+    done = completed_runs(results_path)
+    shards = []
+    for cls, settings in space.items():
+        runs = [(_run_id(surface, start, cls, hyperparameters, max_steps, tolerance), hyperparameters) for hyperparameters in settings]
+        runs = [run for run in runs if run[0] not in done]
+        shards += [(surface, start, cls, runs[i:i + shard_size], max_steps, tolerance) for i in range(0, len(runs), shard_size)]
+
+    new_file = not os.path.exists(results_path)
+    count = 0
+    with open(results_path, 'a', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=COLUMNS)
+        if new_file:
+            writer.writeheader()
+
+        def write(rows:list[dict])-> None:
+            writer.writerows(rows)
+            file.flush()
+
+        processes = processes or os.cpu_count() or 1
+        if processes == 1 or len(shards) <= 1:
+            for shard in shards:
+                rows = _run_shard(*shard)
+                write(rows)
+                count += len(rows)
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                for future in as_completed([pool.submit(_run_shard, *shard) for shard in shards]):
+                    rows = future.result()
+                    write(rows)
+                    count += len(rows)
+    return count
+
+
+def default_space()-> dict[type, list[dict]]:
+    '''
+    learning rates around the ones of params.py and the momentum/beta values around the ones of main.py.
+    '''
+    scales = [0.1, 0.3, 1, 3]
+    return {
+        Optimizer.GradientDescent: grid_space(lr=[params.LEARNING_RATE * s for s in scales]),
+        Optimizer.Momentum: grid_space(lr=[params.LEARNING_RATE * s for s in scales], gamma=[0.8, 0.9, 0.95, 0.99]),
+        Optimizer.Nesterov: grid_space(lr=[params.LEARNING_RATE * s for s in scales], gamma=[0.8, 0.9, 0.95, 0.99]),
+        Optimizer.AdaGrad: grid_space(lr=[params.ADAGRAD_LEARNING_RATE * s for s in scales]),
+        Optimizer.RMSProp: grid_space(lr=[params.RMSPROP_LEARNING_RATE * s for s in scales], gamma=[0.8, 0.9, 0.99]),
+        Optimizer.Adam: grid_space(lr=[params.ADAM_LEARNING_RATE * s for s in scales], beta_1=[0.5, 0.7, 0.9], beta_2=[0.99, 0.999]),
+    }
+
+
+def main()->None:
+    parser = argparse.ArgumentParser(description='Sweep the optimizer hyperparameters around the values of params.py.')
+    parser.add_argument('results', help='CSV results table, appended to and resumed from')
+    parser.add_argument('--terrain', default=params.TERRAIN, choices=list(terrains.TERRAINS), help='name of a terrain in terrain/terrains.py')
+    parser.add_argument('--random', type=int, default=0, help='sample this many random settings per optimizer instead of the grid')
+    parser.add_argument('--max-steps', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    surface = Surface(terrains.get_terrain(args.terrain), params.X_MIN, params.X_MAX, params.Y_MIN, params.Y_MAX)
+    space = default_space()
+    if args.random:
+        # same hyperparameters as the grid, sampled log-uniformly between its extremes. the seed comes from the class
+        # name, so the classes get different samples and a class keeps its own when others are added
+        seed = lambda cls: int(hashlib.sha1(cls.__name__.encode()).hexdigest()[:8], 16)
+        space = {cls: random_space(args.random, seed(cls),
+                                   **{name: ('log', min(s[name] for s in settings), max(s[name] for s in settings))
+                                      for name in settings[0]})
+                 for cls, settings in space.items()}
+    count = sweep(surface, space, args.results, max_steps=args.max_steps, processes=args.processes)
+    print(f'{count} runs written to {args.results}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+import math
+import numpy as np
+from .gradients import value_and_grad, has_gradient, central_difference_hessian
+
+# terrain function -> factory of (x_min, x_max, y_min, y_max) returning the BoundTerrain computing it
+_COMPILED = {}
+
+
+def register_terrain(function):
+    """
+    Decorator registering a factory that builds a BoundTerrain equivalent to a terrain function.
+
+    The factory takes the bounds (x_min, x_max, y_min, y_max) and is called once per Surface, so
+    everything that only depends on the bounds is computed there instead of on every evaluation.
+    """
+    def decorator(factory):
+        _COMPILED[function] = factory
+        return factory
+    return decorator
+
+
+def compiled_factory(function):
+    '''
+    the factory registered for a terrain function with register_terrain, None if it has none.
+    '''
+    return _COMPILED.get(function)
+
+
+class BoundTerrain:
+    '''
+    terrain built once for given bounds, evaluated with (x, y) only.
+    gradient_cost: terrain evaluations per point spent by value_and_grad, for the profiler.
+    hessian_cost: the same for hessian.
+    '''
+    gradient_cost = 1
+
+    @property
+    def hessian_cost(self)-> int:
+        return 4 * self.gradient_cost
+
+    def __call__(self, x, y):
+        raise NotImplementedError
+
+    def value_and_grad(self, x, y):
+        raise NotImplementedError
+
+    def hessian(self, x, y):
+        '''
+        returns (d2z/dx2, d2z/dxdy, d2z/dy2), a central difference of value_and_grad at 4 points evaluated in one call
+        unless the terrain has a closed form.
+        '''
+        return central_difference_hessian(self.value_and_grad, x, y)
+
+
+class FunctionTerrain(BoundTerrain):
+    def __init__(self, function, x_min:float, x_max:float, y_min:float, y_max:float):
+        '''
+        adapter binding a plain terrain function of (x, y, x_min, x_max, y_min, y_max) to its bounds.
+        the gradient comes from terrain/gradients.py, a central difference if there is no closed form.
+        '''
+        self.function = function
+        self.bounds = (x_min, x_max, y_min, y_max)
+        self.gradient_cost = 1 if has_gradient(function) else 5
+
+    def __call__(self, x, y):
+        return self.function(x, y, *self.bounds)
+
+    def value_and_grad(self, x, y):
+        return value_and_grad(self.function, x, y, *self.bounds)
+
+    def __repr__(self) -> str:
+        return f'FunctionTerrain({getattr(self.function, "__name__", self.function)!r})'
+
+
+class MixtureTerrain(BoundTerrain):
+    hessian_cost = 1
+
+    def __init__(self, gaussians:list[tuple[float, float, float, float, float]]=(), quadratic:tuple[float, ...]=(0, 0, 0, 0, 0, 0)):
+        """
+        Sum of axis-aligned Gaussians and a quadratic, evaluated in one fused vectorized kernel.
+
+        z = sum_k A_k exp(-(x - x0_k)^2 a_k - (y - y0_k)^2 b_k) + q_xx x^2 + q_yy y^2 + q_xy x y + q_x x + q_y y + q_0
+        with a_k = 1 / (2 sigma_x_k^2) and b_k = 1 / (2 sigma_y_k^2) precomputed. Array inputs are evaluated
+        against the K Gaussians at once in (K, *shape) scratch buffers that are kept per input shape, so repeated
+        calls with the same shape (every BatchEngine step) allocate only their outputs, which also means an
+        instance must not be evaluated from two threads at once. Scalars take a plain math path.
+        Float32 arrays are evaluated in float32 with float32 scratch buffers, the others in float64.
+
+        The Hessian is exact as well and costs one evaluation.
+
+        Parameters:
+        - gaussians: (x0, y0, sigma_x, sigma_y, amplitude) of every Gaussian, as gaussian_terrain_params returns.
+        - quadratic: (q_xx, q_yy, q_xy, q_x, q_y, q_0).
+        """
+        params = np.array(gaussians, dtype=float).reshape(-1, 5)
+        self.x0, self.y0 = params[:, 0], params[:, 1]
+        # the exponent is -(x - x0)^2 a - (y - y0)^2 b, the minus sign is folded into the constants
+        self.neg_a = -1 / (2 * params[:, 2] ** 2)
+        self.neg_b = -1 / (2 * params[:, 3] ** 2)
+        self.amplitude = params[:, 4]
+        # dz/dx = sum 2 (-a) A (x - x0) e, the same for y
+        self.gx, self.gy = 2 * self.neg_a * self.amplitude, 2 * self.neg_b * self.amplitude
+        self.quadratic = tuple(float(q) for q in quadratic)
+        self._scalar = list(zip(self.x0.tolist(), self.y0.tolist(), self.neg_a.tolist(), self.neg_b.tolist(),
+                                self.amplitude.tolist(), self.gx.tolist(), self.gy.tolist()))
+        self._buffers:dict[tuple, tuple[np.ndarray, ...]] = {}
+
+    def _scratch(self, shape:tuple, dtype:np.dtype)-> tuple[np.ndarray, ...]:
+        '''
+        the dx, dy, e, t scratch buffers of shape (K, *shape) and the constants reshaped to broadcast against them,
+        all of the given dtype.
+        '''
+        buffers = self._buffers.get((shape, dtype))
+        if buffers is None:
+            column = (-1,) + (1,) * len(shape)
+            buffers = self._buffers[shape, dtype] = (*(np.empty((len(self.x0),) + shape, dtype=dtype) for _ in range(4)),
+                                                     *(c.reshape(column).astype(dtype) for c in (self.x0, self.y0, self.neg_a, self.neg_b)))
+        return buffers
+
+    @staticmethod
+    def _arrays(x, y)-> tuple[np.ndarray, np.ndarray]:
+        x, y = np.asarray(x), np.asarray(y)
+        # float32 only if both are, integers are evaluated in float64
+        dtype = np.result_type(x, y, np.float32)
+        x, y = x.astype(dtype, copy=False), y.astype(dtype, copy=False)
+        if x.shape != y.shape:
+            x, y = np.broadcast_arrays(x, y)
+        return x, y
+
+    @staticmethod
+    def _sum(weights:np.ndarray, values:np.ndarray)-> np.ndarray:
+        '''
+        sum over the Gaussians of weights[k] * values[k], a single matrix-vector product.
+        '''
+        return (weights.astype(values.dtype, copy=False) @ values.reshape(len(weights), -1)).reshape(values.shape[1:])
+
+    def _kernel(self, x:np.ndarray, y:np.ndarray)-> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''
+        x - x0, y - y0 and exp(-(x - x0)^2 a - (y - y0)^2 b) of every Gaussian and point, in the scratch buffers.
+        '''
+        dx, dy, e, t, x0, y0, neg_a, neg_b = self._scratch(x.shape, x.dtype)
+        np.subtract(x, x0, out=dx)
+        np.subtract(y, y0, out=dy)
+        np.multiply(dx, dx, out=e)
+        e *= neg_a
+        np.multiply(dy, dy, out=t)
+        t *= neg_b
+        e += t
+        np.exp(e, out=e)
+        return dx, dy, e
+
+    def _quadratic(self, x, y):
+        q_xx, q_yy, q_xy, q_x, q_y, q_0 = self.quadratic
+        z = q_0
+        # only the nonzero coefficients are evaluated, e.g. a plain paraboloid skips the cross and linear terms
+        if q_xx:
+            z = z + q_xx * x * x
+        if q_yy:
+            z = z + q_yy * y * y
+        if q_xy:
+            z = z + q_xy * x * y
+        if q_x:
+            z = z + q_x * x
+        if q_y:
+            z = z + q_y * y
+        return z
+
+    def _quadratic_grad(self, x, y):
+        q_xx, q_yy, q_xy, q_x, q_y, _ = self.quadratic
+        dz_dx = 2 * q_xx * x if q_xx else 0
+        dz_dy = 2 * q_yy * y if q_yy else 0
+        if q_xy:
+            dz_dx, dz_dy = dz_dx + q_xy * y, dz_dy + q_xy * x
+        return dz_dx + q_x, dz_dy + q_y
+
+    def __call__(self, x, y):
+        if np.ndim(x) == 0 and np.ndim(y) == 0:
+            z = self._quadratic(x, y)
+            for x0, y0, neg_a, neg_b, A, _, _ in self._scalar:
+                z += A * math.exp((x - x0) ** 2 * neg_a + (y - y0) ** 2 * neg_b)
+            return z
+        x, y = self._arrays(x, y)
+        z = self._quadratic(x, y)
+        if self._scalar:
+            _, _, e = self._kernel(x, y)
+            z = z + self._sum(self.amplitude, e)
+        return z
+
+    def value_and_grad(self, x, y):
+        if np.ndim(x) == 0 and np.ndim(y) == 0:
+            z, (dz_dx, dz_dy) = self._quadratic(x, y), self._quadratic_grad(x, y)
+            for x0, y0, neg_a, neg_b, A, gx, gy in self._scalar:
+                e = math.exp((x - x0) ** 2 * neg_a + (y - y0) ** 2 * neg_b)
+                z, dz_dx, dz_dy = z + A * e, dz_dx + gx * (x - x0) * e, dz_dy + gy * (y - y0) * e
+            return z, dz_dx, dz_dy
+        x, y = self._arrays(x, y)
+        z, (dz_dx, dz_dy) = self._quadratic(x, y), self._quadratic_grad(x, y)
+        if self._scalar:
+            dx, dy, e = self._kernel(x, y)
+            dx *= e
+            dy *= e
+            z = z + self._sum(self.amplitude, e)
+            dz_dx = dz_dx + self._sum(self.gx, dx)
+            dz_dy = dz_dy + self._sum(self.gy, dy)
+        return z, dz_dx, dz_dy
+
+    def hessian(self, x, y):
+        '''
+        the exact Hessian, d2/dx2 of A e being 2 (-a) A e (1 + 2 (-a) (x - x0)^2) and d2/dxdy 4 a b A (x - x0) (y - y0) e.
+        '''
+        q_xx, q_yy, q_xy = self.quadratic[:3]
+        x, y = self._arrays(x, y)
+        d_xx, d_xy, d_yy = (np.full(x.shape, q, dtype=x.dtype) for q in (2 * q_xx, q_xy, 2 * q_yy))
+        if self._scalar:
+            dx, dy, e = self._kernel(x, y)
+            neg_a, neg_b = self._scratch(x.shape, x.dtype)[6:]
+            d_xx += self._sum(self.gx, e * (1 + 2 * neg_a * dx * dx))
+            d_yy += self._sum(self.gy, e * (1 + 2 * neg_b * dy * dy))
+            d_xy += self._sum(self.gx, 2 * neg_b * dx * dy * e)
+        return d_xx[()], d_xy[()], d_yy[()]
+
+    def __repr__(self) -> str:
+        return f'MixtureTerrain({len(self.x0)} gaussians, quadratic={self.quadratic})'
+
+
+def bind_terrain(function, x_min:float, x_max:float, y_min:float, y_max:float)-> BoundTerrain:
+    '''
+    the BoundTerrain of a terrain function for the given bounds: its registered compiled form if it has one,
+    otherwise the function itself behind a FunctionTerrain adapter. A BoundTerrain is returned as it is.
+    '''
+    if isinstance(function, BoundTerrain):
+        return function
+    factory = compiled_factory(function)
+    if factory is not None:
+        return factory(x_min, x_max, y_min, y_max)
+    return FunctionTerrain(function, x_min, x_max, y_min, y_max)
@@ -25,3 +25,23 @@ def gaussian(x, y, x0, y0, sigma_x, sigma_y, amplitude):
     z = amplitude * np.exp(-(dx2 * inv_sigma_x + dy2 * inv_sigma_y))
     
     return z
+
+def gaussian_value_and_grad(x, y, x0, y0, sigma_x, sigma_y, amplitude):
+    """
+    2D Gaussian function together with its gradient, sharing the exponential.
+    
+    Parameters:
+    - same as gaussian.
+    
+    Returns:
+    - z, dz_dx, dz_dy: Value of the Gaussian and its partial derivatives at point (x, y).
+    """
+    inv_sigma_x = 1 / (2 * sigma_x ** 2)
+    inv_sigma_y = 1 / (2 * sigma_y ** 2)
+    
+    dx = x - x0
+    dy = y - y0
+    
+    z = amplitude * np.exp(-(dx ** 2 * inv_sigma_x + dy ** 2 * inv_sigma_y))
+    
+    return z, -2 * inv_sigma_x * dx * z, -2 * inv_sigma_y * dy * z
@@ -1,12 +1,16 @@
+from functools import lru_cache
 import numpy as np
-import matplotlib.pyplot as plt
+from .utils import grid_cells, grid_bilinear
 
-def perlin(x, y, seed=0):
+def permutation_table(seed=0):
+    "permutation table of the given seed, repeated twice. Uses its own RandomState so the global np.random is untouched"
+    p = np.random.RandomState(seed).permutation(256)
+    return np.concatenate([p, p])
+
+def perlin(x, y, seed=0, p=None):
     # permutation table
-    np.random.seed(seed)
-    p = np.arange(256, dtype=int)
-    np.random.shuffle(p)
-    p = np.stack([p, p]).flatten()
+    if p is None:
+        p = permutation_table(seed)
     # coordinates of the top-left
     xi, yi = x.astype(int), y.astype(int)
     # internal coordinates
@@ -19,8 +23,8 @@ def perlin(x, y, seed=0):
     n11 = gradient(p[p[xi + 1] + yi + 1], xf - 1, yf - 1)
     n10 = gradient(p[p[xi + 1] + yi], xf - 1, yf)
     x1 = lerp(n00, n10, u)
-    x2 = lerp(n01, n11, u)  
-    return lerp(x1, x2, v)  
+    x2 = lerp(n01, n11, u)
+    return lerp(x1, x2, v)
 
 def lerp(a, b, x):
     "linear interpolation"
@@ -34,17 +38,71 @@ def gradient(h, x, y):
     "grad converts h to the right gradient vector and return the dot product with (x,y)"
     vectors = np.array([[0, 1], [0, -1], [1, 0], [-1, 0]])
     g = vectors[h % 4]
-    return g[:, :, 0] * x + g[:, :, 1] * y
+    return g[..., 0] * x + g[..., 1] * y
+
 
+@lru_cache(maxsize=16)
+def generate_terrain(iters = 2, resolution = 100, seed = 87):
+    """
+    Fractal noise height field: the sum of `iters` octaves of Perlin noise, octave i having frequency 2**i
+    and amplitude 1 / 2**i.
 
-def generate_terrain(iters = 2):
-    p = np.zeros((100,100))
+    The result is memoized per (iters, resolution, seed) and returned read-only, so every caller
+    shares the same array instead of regenerating it.
+    """
+    assert 2 ** (iters - 1) < 256, 'too many octaves for the 256 entry permutation table'
+    p = permutation_table(seed)
+    terrain = np.zeros((resolution, resolution))
     for i in range(iters):
         freq = 2**i
-        lin = np.linspace(0, freq, 100, endpoint=False)
-        x, y = np.meshgrid(lin, lin)  
-        p = perlin(x, y, seed=87) / freq + p
-    return p
+        lin = np.linspace(0, freq, resolution, endpoint=False)
+        x, y = np.meshgrid(lin, lin)
+        terrain += perlin(x, y, p=p) / freq
+    terrain.setflags(write=False)
+    return terrain
+
+
+class PerlinTerrain:
+    def __init__(self, octaves:int=2, resolution:int=100, seed:int=87, amplitude:float=50):
+        """
+        Terrain function backed by a fractal Perlin noise height field stretched over the Surface bounds.
+
+        Instances are called like the functions in terrains.py, with (x, y, x_min, x_max, y_min, y_max),
+        and accept scalars or arrays. Heights between the grid points are bilinearly interpolated.
+
+        Parameters:
+        - octaves: number of noise octaves, more octaves give a more rugged terrain.
+        - resolution: number of grid points along each axis of the height field.
+        - seed: seed of the permutation table.
+        - amplitude: scale of the heights.
+        """
+        self.octaves = octaves
+        self.resolution = resolution
+        self.seed = seed
+        self.amplitude = amplitude
+
+    @property
+    def height_field(self)-> np.ndarray:
+        return generate_terrain(self.octaves, self.resolution, self.seed)
+
+    def __call__(self, x, y, x_min, x_max, y_min, y_max):
+        field = self.height_field
+        z = grid_bilinear(field, *grid_cells(x, y, x_min, x_max, y_min, y_max, field.shape)) * self.amplitude
+        return z[()]
+
+    def value_and_grad(self, x, y, x_min, x_max, y_min, y_max):
+        '''
+        returns (z, dz/dx, dz/dy), the gradient being the exact derivative of the bilinear interpolation.
+        '''
+        field = self.height_field
+        i, j, ty, tx = grid_cells(x, y, x_min, x_max, y_min, y_max, field.shape)
+        hx = (x_max - x_min) / (field.shape[1] - 1)
+        hy = (y_max - y_min) / (field.shape[0] - 1)
+        z00, z01, z10, z11 = field[i, j], field[i, j + 1], field[i + 1, j], field[i + 1, j + 1]
+        z = ((z00 * (1 - tx) + z01 * tx) * (1 - ty) + (z10 * (1 - tx) + z11 * tx) * ty) * self.amplitude
+        dz_dx = ((z01 - z00) * (1 - ty) + (z11 - z10) * ty) * (self.amplitude / hx)
+        dz_dy = ((z10 - z00) * (1 - tx) + (z11 - z01) * tx) * (self.amplitude / hy)
+        return z[()], dz_dx[()], dz_dy[()]
 
-terrain_built = False
-p_terrain = None
+    def __repr__(self) -> str:
+        return f'PerlinTerrain(octaves={self.octaves}, resolution={self.resolution}, seed={self.seed}, amplitude={self.amplitude})'
@@ -1,56 +1,44 @@
 import numpy as np
-from .perlin import generate_terrain, terrain_built, p_terrain
-from .utils import grid_to_coordinate, bilinear_interpolation
-from .gaussian import gaussian
+from .perlin import PerlinTerrain
+from .gaussian import gaussian, gaussian_value_and_grad
+from .gradients import register_gradient
+from .compiled import register_terrain, MixtureTerrain
 
 def square(x, y, x_min, x_max, y_min, y_max, scale=15):
     return (x**2 + y**2) / scale
 
+@register_gradient(square)
+def square_value_and_grad(x, y, x_min, x_max, y_min, y_max, scale=15):
+    return (x**2 + y**2) / scale, 2 * x / scale, 2 * y / scale
+
 def saddle(x, y, x_min, x_max, y_min, y_max, scale=15):
     return (x**2 - y**2) / scale
 
+@register_gradient(saddle)
+def saddle_value_and_grad(x, y, x_min, x_max, y_min, y_max, scale=15):
+    return (x**2 - y**2) / scale, 2 * x / scale, -2 * y / scale
+
 def ripple(x, y, x_min, x_max, y_min, y_max, scale=1.5):
     d = np.sqrt(x**2 + y**2)
     return d - np.cos(d)
 
+@register_gradient(ripple)
+def ripple_value_and_grad(x, y, x_min, x_max, y_min, y_max, scale=1.5):
+    d = np.sqrt(x**2 + y**2)
+    # dz/dd = 1 + sin(d), the cone tip at d = 0 gets a zero gradient
+    dz_dd = (1 + np.sin(d)) / np.where(d > 0, d, np.inf)
+    return d - np.cos(d), dz_dd * x, dz_dd * y
 
-# def perlin_terrain(x, y, x_min, x_max, y_min, y_max):
-#     global terrain_built, p_terrain
-#     if not terrain_built:
-#         terrain_built = True
-#         p_terrain = generate_terrain()
-#     # terrain is a (100, 100) shaped numpy array
-#     # we need to be able to get values from the terrain even from floating x, y
-#     n = p_terrain.shape[0]
-#     div = n -1
-#     x_norm = (x - x_min) / (x_max - x_min)
-#     y_norm = (y - y_min) / (y_max - y_min)
-#     del_x = (x_max - x_min) / div
-#     del_y = (y_max - y_min) / div
-#     if type(x) == np.ndarray:
-#         # will only be used for plotting the surface
-#         x_idx = (x_norm * div).astype(int)
-#         y_idx = (y_norm * div).astype(int)
-#         return p_terrain[x_idx, y_idx] * 50
-#     else:
-#         # fine grained calculation needed
-#         i, j = int(x_norm * div), int(y_norm * div)
-#         x1, y1, z1 = grid_to_coordinate(j/div, x_min, x_max), grid_to_coordinate(i/div, y_min, y_max), p_terrain[i, j]
-#         x2, y2, z2 = x1 + del_x, y1, p_terrain[i, j+1]
-#         x3, y3, z3 = x1 + del_x, y1 + del_y, p_terrain[i+1, j+1]
-#         x4, y4, z4 = x1, y1 + del_y, p_terrain[i+1, j]
-#         return bilinear_interpolation(x, y, [(x1, y1, z1), (x2, y2, z2), (x3, y3, z3), (x4, y4, z4)]) * 50
-        
-def gaussian_terrain(x, y, x_min, x_max, y_min, y_max):
+
+# fractal noise terrain, the height field is generated once and shared by every Surface using it
+perlin_terrain = PerlinTerrain()
+
+def gaussian_terrain_params(x_min, x_max, y_min, y_max):
     """
-    Function to generate the z-value of a terrain consisting of 2 or 3 Gaussian functions.
-    Two of the Gaussian functions are multiplied by -1 to create valleys.
-    
-    Parameters:
-    - x, y: Coordinates where to evaluate the terrain.
+    Parameters of the Gaussians making up gaussian_terrain for the given bounds.
     
     Returns:
-    - z: Value of the terrain at point (x, y).
+    - list of (x0, y0, sigma_x, sigma_y, amplitude) tuples, one per Gaussian.
     """
     x_range = x_max - x_min
     y_range = y_max - y_min
@@ -70,13 +58,56 @@ def gaussian_terrain(x, y, x_min, x_max, y_min, y_max):
     sigma_x3, sigma_y3 = 10, 7  # Spread along x and y
     amplitude_3 = -10  # Negative amplitude for the valley
 
+    return [(x0_1, y0_1, sigma_x1, sigma_y1, amplitude_1),
+            (x0_2, y0_2, sigma_x2, sigma_y2, amplitude_2),
+            (x0_3, y0_3, sigma_x3, sigma_y3, amplitude_3)]
+
+def gaussian_terrain(x, y, x_min, x_max, y_min, y_max):
+    """
+    Function to generate the z-value of a terrain consisting of 2 or 3 Gaussian functions.
+    Two of the Gaussian functions are multiplied by -1 to create valleys.
+    
+    Parameters:
+    - x, y: Coordinates where to evaluate the terrain.
+    
+    Returns:
+    - z: Value of the terrain at point (x, y).
+    """
     # Calculate the terrain height z as a sum of the Gaussian functions
-    z = (gaussian(x, y, x0_1, y0_1, sigma_x1, sigma_y1, amplitude_1) +
-         gaussian(x, y, x0_2, y0_2, sigma_x2, sigma_y2, amplitude_2) +
-         gaussian(x, y, x0_3, y0_3, sigma_x3, sigma_y3, amplitude_3))
+    z = 0
+    for g_params in gaussian_terrain_params(x_min, x_max, y_min, y_max):
+        z = z + gaussian(x, y, *g_params)
     
     return z
 
+@register_gradient(gaussian_terrain)
+def gaussian_terrain_value_and_grad(x, y, x_min, x_max, y_min, y_max):
+    z, dz_dx, dz_dy = 0, 0, 0
+    for g_params in gaussian_terrain_params(x_min, x_max, y_min, y_max):
+        g, dg_dx, dg_dy = gaussian_value_and_grad(x, y, *g_params)
+        z, dz_dx, dz_dy = z + g, dz_dx + dg_dx, dz_dy + dg_dy
+    
+    return z, dz_dx, dz_dy
 
+@register_terrain(gaussian_terrain)
+def gaussian_terrain_compiled(x_min, x_max, y_min, y_max):
+    # the Gaussians only depend on the bounds, so they are set up once per Surface
+    return MixtureTerrain(gaussian_terrain_params(x_min, x_max, y_min, y_max))
 
+# terrains by name, for params.TERRAIN and the --terrain option of the scripts
+TERRAINS = {
+    'square': square,
+    'saddle': saddle,
+    'ripple': ripple,
+    'gaussian_terrain': gaussian_terrain,
+    'perlin_terrain': perlin_terrain,
+}
 
+def get_terrain(name:str):
+    '''
+    the terrain registered in TERRAINS under the given name.
+    '''
+    try:
+        return TERRAINS[name]
+    except KeyError:
+        raise ValueError(f'unknown terrain {name!r}, expected one of {", ".join(TERRAINS)}') from None
@@ -54,4 +54,59 @@ def grid_to_coordinate(r, min, max):
     """
     assert min < max, "min must be less than max"
     assert r >= 0 and r <= 1, "r must be between 0 and 1"
-    return min + r * (max - min)
\ No newline at end of file
+    return min + r * (max - min)
+
+
+def grid_cells(x, y, x_min, x_max, y_min, y_max, shape):
+    """
+    Locate points on a regular grid spanning the bounds, with grid[i, j] at (x_j, y_i) like np.meshgrid.
+    
+    Returns:
+    - i, j: indices of the lower-left corner of the cell containing each point, clipped to the grid.
+    - ty, tx: position of each point inside its cell, in [0, 1] for points within the bounds.
+    """
+    n_y, n_x = shape
+    # float32 points stay in float32, anything else is located in float64
+    fx = (np.asarray(x, dtype=np.result_type(x, np.float32)) - x_min) * ((n_x - 1) / (x_max - x_min))
+    fy = (np.asarray(y, dtype=np.result_type(y, np.float32)) - y_min) * ((n_y - 1) / (y_max - y_min))
+    j = np.clip(np.floor(fx).astype(int), 0, n_x - 2)
+    i = np.clip(np.floor(fy).astype(int), 0, n_y - 2)
+    return i, j, fy - i, fx - j
+
+def grid_bilinear(grid, i, j, ty, tx):
+    """
+    Vectorized bilinear interpolation of a regular grid at the cells found by grid_cells.
+    """
+    return ((grid[i, j] * (1 - tx) + grid[i, j + 1] * tx) * (1 - ty) +
+            (grid[i + 1, j] * (1 - tx) + grid[i + 1, j + 1] * tx) * ty)
+
+def _hermite_basis(t):
+    # value-basis and derivative-basis functions of a cubic Hermite spline, and their derivatives in t
+    t2, t3 = t * t, t * t * t
+    basis = (2 * t3 - 3 * t2 + 1, -2 * t3 + 3 * t2, t3 - 2 * t2 + t, t3 - t2)
+    d_basis = (6 * t2 - 6 * t, -6 * t2 + 6 * t, 3 * t2 - 4 * t + 1, 3 * t2 - 2 * t)
+    return basis, d_basis
+
+def grid_bicubic(Z, Zx, Zy, Zxy, i, j, ty, tx, hx, hy):
+    """
+    Vectorized bicubic Hermite interpolation from the values and derivatives stored on a regular grid.
+    
+    Parameters:
+    - Z, Zx, Zy, Zxy: grids of the function, dz/dx, dz/dy and d2z/dxdy.
+    - i, j, ty, tx: cells and in-cell positions as returned by grid_cells.
+    - hx, hy: grid spacing along x and y.
+    
+    Returns:
+    - z, dz_dx, dz_dy: the interpolated value and its exact derivatives.
+    """
+    (vx0, vx1, dx0, dx1), (d_vx0, d_vx1, d_dx0, d_dx1) = _hermite_basis(tx)
+    (vy0, vy1, dy0, dy1), (d_vy0, d_vy1, d_dy0, d_dy1) = _hermite_basis(ty)
+    
+    z = dz_dx = dz_dy = 0
+    for di, vy, dy, d_vy, d_dy in ((0, vy0, dy0, d_vy0, d_dy0), (1, vy1, dy1, d_vy1, d_dy1)):
+        for dj, vx, dx, d_vx, d_dx in ((0, vx0, dx0, d_vx0, d_dx0), (1, vx1, dx1, d_vx1, d_dx1)):
+            c, cx, cy, cxy = Z[i + di, j + dj], Zx[i + di, j + dj] * hx, Zy[i + di, j + dj] * hy, Zxy[i + di, j + dj] * hx * hy
+            z = z + vx * vy * c + dx * vy * cx + vx * dy * cy + dx * dy * cxy
+            dz_dx = dz_dx + (d_vx * vy * c + d_dx * vy * cx + d_vx * dy * cy + d_dx * dy * cxy) / hx
+            dz_dy = dz_dy + (vx * d_vy * c + dx * d_vy * cx + vx * d_dy * cy + dx * d_dy * cxy) / hy
+    return z, dz_dx, dz_dy